@@ -0,0 +1,271 @@
+import os
+import sys
+import json
+import time
+import argparse
+import numpy as np
+
+sys.path.append("./scripts")
+
+from ray_tracing_fresnel import trace_ray
+from texture_hw5 import camera_pixel_angle
+from find_intersection import Nearest_HIT_finder_bvh, Ray
+from parallel_hw5 import render_parallel
+from scene_file_hw5 import load_scene, build_scene, build_accelerator
+from bvh_hw5 import build_flat_bvh
+from mesh_hw5 import Mesh, build_mesh_bvh
+from camera_hw5 import Camera
+from stats_hw5 import enable_stats, disable_stats
+
+import bvh_hw5
+
+# 고정 seed, 낮은 해상도로 표준 scene들을 렌더링 ~ 단계별 rays/s 를 baseline과 비교 + 이미지가 reference와 같은지 확인
+# python benchmark.py            : 측정 + 비교 (느려졌거나 이미지가 달라지면 exit 1)
+# python benchmark.py --update   : 지금 결과를 baseline / reference로 저장 (--scenes 로 고른 것만 기존 baseline에 덮어씀)
+# 시간 baseline은 기계마다 다르므로 저장소에 넣지 않음 (benchmarks/, 같은 기계에서 만든 것과 비교)
+# reference 이미지는 고정 seed라 기계와 상관없이 같음 ~ benchmark_references/ 로 저장소에 포함
+
+WIDTH = 64
+HEIGHT = 48
+SEED = 0
+
+REPEAT = 7                  # 짧은 측정은 반복해서 중앙값 (렌더링은 한 번)
+SCALAR_PIXELS = 64          # trace_ray (scalar) 로 렌더링할 픽셀 수
+RANDOM_RAYS = 20000         # Nearest_HIT_finder / 교차 함수용 ray 수
+
+SLOWDOWN_TOLERANCE = 0.15   # baseline 대비 이만큼 이상 느리면 실패
+MICRO_TOLERANCE = 0.30      # 짧은 micro-benchmark (교차 함수 하나씩, 빌드, scalar / batch hit) 는 흔들림이 커서 더 넓게
+MICRO_METRICS = ('build_s', 'scalar_pixels_per_s', 'scalar_hit_rays_per_s', 'batch_hit_rays_per_s')
+MIN_SECONDS = 0.01          # 이보다 짧은 시간은 noise라 비교 안 함
+IMAGE_TOLERANCE = 1e-3      # reference 이미지와의 RMSE 상한
+
+BENCH_DIR = "benchmarks"
+BASELINE_FILE = os.path.join(BENCH_DIR, "baseline.json")
+REFERENCE_DIR = "benchmark_references"
+
+# ---------- scene ----------
+
+def cornell_scene():
+    return load_scene("scenes/cornell_box.json")
+
+# Cornell box 안에 작은 구 여러 개 ~ BVH가 의미 있는 크기
+def spheres_scene(count=200):
+    with open("scenes/cornell_box.json") as file:
+        description = json.load(file)
+
+    rng = np.random.default_rng(SEED)
+    names = ["white", "red", "green", "glass_ball"]
+
+    description['objects'] = description['objects'][:6] # 벽만
+    for _ in range(count):
+        center = rng.uniform((-13, -11, -8), (13, 9, 6))
+        description['objects'].append({"type": "Sphere", "center": center.tolist(), "radius": float(rng.uniform(0.4, 1.2)), "material": names[rng.integers(len(names))]})
+
+    return build_scene(description, os.path.abspath("scenes"))
+
+# 절차적으로 만든 torus mesh ~ OBJ 파일 없이
+def torus_mesh(material, center=(0, 4, 0), major=4.0, minor=1.5, segments=128, rings=64):
+    phi, theta = np.meshgrid(np.linspace(0, 2 * np.pi, segments, endpoint=False), np.linspace(0, 2 * np.pi, rings, endpoint=False), indexing='ij')
+
+    radius = major + minor * np.cos(theta)
+    vertices = np.stack([radius * np.cos(phi), minor * np.sin(theta), radius * np.sin(phi)], axis=-1).reshape(-1, 3) + np.array(center)
+
+    i, j = np.meshgrid(np.arange(segments), np.arange(rings), indexing='ij')
+    a = i * rings + j
+    b = ((i + 1) % segments) * rings + j
+    c = ((i + 1) % segments) * rings + (j + 1) % rings
+    d = i * rings + (j + 1) % rings
+
+    faces = np.concatenate([np.stack([a, b, c], axis=-1).reshape(-1, 3), np.stack([a, c, d], axis=-1).reshape(-1, 3)])
+    return Mesh(vertices, faces, material)
+
+# Cornell box + 공중에 떠 있는 torus (삼각형 16384개)
+def mesh_scene():
+    scene = cornell_scene()
+
+    scene.objects = scene.objects + [torus_mesh(scene.objects[6].material)]
+    scene.accelerator = build_accelerator(scene.objects)
+
+    return scene
+
+SCENES = {"cornell": cornell_scene, "spheres": spheres_scene, "mesh": mesh_scene}
+
+# ---------- 측정 ----------
+
+# 반복 측정의 중앙값 ~ 가장 빠른 값보다 한 번 튄 측정 (다른 process 등) 에 덜 흔들림
+def median_time(function, repeat=REPEAT):
+    times = []
+
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        times.append(time.perf_counter() - start)
+
+    return float(np.median(times)), result
+
+# 같은 시야, 낮은 해상도
+def bench_camera(camera):
+    return Camera(eye=camera.eye, target=camera.target, up=camera.up, fov=camera.fov, width=WIDTH, height=HEIGHT)
+
+# 카메라 앞쪽으로 퍼지는 고정 ray들
+def random_rays(camera, count=RANDOM_RAYS):
+    rng = np.random.default_rng(SEED)
+    xs = rng.uniform(0, camera.width, count)
+    ys = rng.uniform(0, camera.height, count)
+
+    return camera.generate_rays(xs, ys)
+
+def bench_scene(name, scene):
+    camera = bench_camera(scene.camera)
+    results = {}
+
+    # 가속 구조 빌드 (cache 없이) ~ object BVH + mesh 자체 BVH
+    def build():
+        for obj in scene.objects:
+            if isinstance(obj, Mesh): build_mesh_bvh(obj)
+        return build_flat_bvh(scene.objects)
+
+    cache_dir, bvh_hw5.BVH_CACHE_DIR = bvh_hw5.BVH_CACHE_DIR, None
+    try: results['build_s'], bvh = median_time(build)
+    finally: bvh_hw5.BVH_CACHE_DIR = cache_dir
+
+    # wavefront 렌더링 전체 + 단계별 (stats 의 ray 수 / 단계 시간) ~ stats 비용은 2% 이하라 같이 측정
+    stats = enable_stats()
+    try: results['render_s'], image = median_time(lambda: render_parallel(camera, scene.accelerator, scene.lights, WIDTH, HEIGHT, workers=1, seed=SEED), 1)
+    finally: disable_stats()
+
+    rays = stats.counters
+    camera_rays = sum(rays.get(f"rays.{kind}", 0) for kind in ("primary", "indirect", "reflection", "refraction"))
+
+    results['render_rays_per_s'] = (camera_rays + rays.get("rays.shadow", 0)) / results['render_s']
+    results['intersect_rays_per_s'] = camera_rays / max(stats.timers.get("intersect", 0), 1e-9)
+    results['shadow_rays_per_s'] = rays.get("rays.shadow", 0) / max(stats.timers.get("shadow", 0), 1e-9)
+    results['shade_points_per_s'] = camera_rays / max(stats.timers.get("shade", 0) + stats.timers.get("texture", 0), 1e-9)
+
+    # scalar ~ trace_ray, Nearest_HIT_finder_bvh
+    rng = np.random.default_rng(SEED)
+    pixels = rng.integers(0, (WIDTH, HEIGHT), size=(SCALAR_PIXELS, 2))
+
+    def scalar_render():
+        np.random.seed(SEED)
+        return [trace_ray(camera.generate_ray(x, y), bvh, scene.lights, camera.eye, pixel_angle=camera_pixel_angle(camera)) for x, y in pixels]
+
+    seconds, _ = median_time(scalar_render, 1)
+    results['scalar_pixels_per_s'] = SCALAR_PIXELS / seconds
+
+    origins, directions = random_rays(camera, RANDOM_RAYS // 10)
+    rays_list = [Ray(o, d) for o, d in zip(origins, directions)]
+
+    seconds, _ = median_time(lambda: [Nearest_HIT_finder_bvh(ray, bvh) for ray in rays_list])
+    results['scalar_hit_rays_per_s'] = len(rays_list) / seconds
+
+    origins, directions = random_rays(camera)
+    seconds, _ = median_time(lambda: scene.accelerator.nearest_hit_batch(origins, directions))
+    results['batch_hit_rays_per_s'] = RANDOM_RAYS / seconds
+
+    return results, image
+
+# 교차 함수 하나씩 ~ 종류마다 물체를 향하는 ray들로 intersect_batch
+def bench_intersectors(scene):
+    results = {}
+    rng = np.random.default_rng(SEED)
+
+    for obj in scene.objects:
+        kind = obj.__class__.__name__
+        if f"{kind}_rays_per_s" in results: continue
+
+        geo = obj.geometry
+        targets = rng.uniform(geo.bounds_min, geo.bounds_max, (RANDOM_RAYS, 3))
+        origins = np.tile(np.asarray(scene.camera.eye, dtype=np.float64), (RANDOM_RAYS, 1))
+        directions = targets - origins
+        directions /= np.linalg.norm(directions, axis=1, keepdims=True)
+
+        seconds, _ = median_time(lambda: obj.intersect_batch(origins, directions))
+        results[f"{kind}_rays_per_s"] = RANDOM_RAYS / seconds
+
+    return results
+
+# ---------- 비교 ----------
+
+def reference_path(name):
+    return os.path.join(REFERENCE_DIR, f"{name}_reference.npy")
+
+def compare(name, results, image, baseline):
+    failures = []
+    previous = baseline.get(name, {})
+
+    for metric, value in results.items():
+        tolerance = MICRO_TOLERANCE if name == 'intersectors' or metric in MICRO_METRICS else SLOWDOWN_TOLERANCE
+        line = f"  {metric:<26} {value:>14,.3f}"
+
+        # 시간은 작을수록, rays/s 는 클수록 좋음
+        is_time = metric.endswith("_s") and not metric.endswith("per_s")
+
+        if metric in previous:
+            ratio = previous[metric] / value if is_time else value / previous[metric]
+            line += f"  x{ratio:5.2f}"
+
+            if ratio < 1 - tolerance and not (is_time and value < MIN_SECONDS):
+                line += "  SLOWER"
+                failures.append(f"{name}.{metric}")
+
+        print(line)
+
+    if image is not None and not os.path.exists(reference_path(name)):
+        print(f"  {'image_rmse':<26} {'no reference':>14}")
+
+    if image is not None and os.path.exists(reference_path(name)):
+        rmse = float(np.sqrt(np.mean((image - np.load(reference_path(name))) ** 2)))
+        print(f"  {'image_rmse':<26} {rmse:>14.6f}" + ("  CHANGED" if rmse > IMAGE_TOLERANCE else ""))
+
+        if rmse > IMAGE_TOLERANCE: failures.append(f"{name}.image")
+
+    return failures
+
+def main():
+    parser = argparse.ArgumentParser(description="HW5 ray tracer benchmarks")
+    parser.add_argument("--update", action="store_true", help="save results as the new baseline / reference images")
+    parser.add_argument("--scenes", nargs="*", default=list(SCENES), choices=list(SCENES))
+    args = parser.parse_args()
+
+    baseline = {}
+    if os.path.exists(BASELINE_FILE):
+        with open(BASELINE_FILE) as file: baseline = json.load(file)
+
+    current = {}
+    failures = []
+
+    for name in args.scenes:
+        print(f"[{name}]")
+        scene = SCENES[name]()
+
+        results, image = bench_scene(name, scene)
+        current[name] = results
+        failures += compare(name, results, image, baseline)
+
+        if args.update:
+            os.makedirs(REFERENCE_DIR, exist_ok=True)
+            np.save(reference_path(name), image)
+
+    print("[intersectors]")
+    current['intersectors'] = bench_intersectors(mesh_scene())
+    failures += compare('intersectors', current['intersectors'], None, baseline)
+
+    if args.update:
+        # 이번에 돌린 scene만 바꾸고 나머지 baseline은 그대로
+        baseline.update(current)
+
+        os.makedirs(BENCH_DIR, exist_ok=True)
+        with open(BASELINE_FILE, "w") as file: json.dump(baseline, file, indent=2)
+
+        print(f"{BASELINE_FILE} updated")
+        return 0
+
+    if failures:
+        print("regressions: " + ", ".join(failures))
+        return 1
+
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
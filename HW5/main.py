@@ -1,17 +1,29 @@
 import os
+import time
 import numpy as np
 import sys
 
 from tqdm import tqdm
-from PIL import Image
 
 sys.path.append("./scripts")
 
-from ray_tracing_fresnel import trace_ray
-from find_intersection import build_bvh
+from ray_tracing_fresnel import trace_ray, trace_rays
+from texture_hw5 import camera_pixel_angle
+from parallel_hw5 import render_parallel
+from progressive_hw5 import render_progressive
+from adaptive_hw5 import render_adaptive
+from light_hw5 import configure_light_sampling
+from mesh_hw5 import load_mesh
+from scene_file_hw5 import load_scene, build_accelerator, compiled_scene_path
+from stats_hw5 import count, enable_stats, disable_stats
+from denoise_hw5 import render_aux, save_aux, denoise
+from sampler_hw5 import make_sampler
+from irradiance_hw5 import IrradianceCache, prepare_irradiance_cache, cache_signature, set_irradiance_cache
+from photon_hw5 import trace_caustic_photons, set_photon_map
 
 from camera_hw5 import Camera
-from Cornell_scene import create_cornell_box
+from image_hw5 import get_next_filename, save_image
+from Cornell_scene import create_cornell_box, Material
 
 camera = Camera(
     eye=(0, 0, 45),
@@ -22,46 +34,175 @@ camera = Camera(
     height=480
 )
 
-objects, lights = create_cornell_box()
-
-# BVH 생성
-BVH = build_bvh(objects)
+# "scalar" : ray 하나씩, "wavefront" : 타일 단위 배치, "parallel" : 타일 단위 배치 + 멀티프로세스 
+# "progressive" : pass 마다 샘플 누적 (버퍼에서 이어서 렌더링 가능)
+# "adaptive" : 오차가 큰 픽셀에만 샘플 추가 + 샘플 수 heatmap 저장
+RENDER_MODE = "parallel"
+TILE_SIZE = 32
+WORKERS = None # None -> 코어 수만큼 
+SEED = 0
+
+# progressive ~ 픽셀당 샘플 수 = pass 수
+PASSES = 10
+ACCUMULATION_BUFFER = "accumulation.npz" # output 폴더의 buffer / preview / heatmap / irradiance 파일은 앞에 scene 이름 (scene_output)
+
+# adaptive ~ 픽셀당 최대 샘플 수, 상대 오차 threshold
+MAX_SAMPLES = 64
+ERROR_THRESHOLD = 0.03
+
+# "whitted" : 재귀 ray tracing (반사 + 굴절 분기), "path" : path tracing + Russian roulette (샘플당 비용 일정)
+# path는 pass 하나가 픽셀당 1 샘플 ~ progressive / adaptive 로 샘플 누적
+INTEGRATOR = "whitted"
+
+# 샘플 생성 ~ "sobol" / "halton" : 저불일치 수열 + 픽셀마다 scramble (같은 샘플 수에 노이즈가 적음), "random" : 기존 np.random
+SAMPLER = "sobol"
+
+# irradiance cache ~ whitted의 depth 0 간접광을 record로 저장해서 주변 점은 보간 (반구 ray 대신)
+# 렌더링 전에 primary hit 들에 record를 만들어 두고 output 폴더에 저장 ~ 같은 scene을 다시 렌더링하면 재사용 (scene이 바뀌면 새로)
+IRRADIANCE_CACHE = False
+IRRADIANCE_CACHE_FILE = "irradiance.npz"
+
+# caustic ~ 렌더링 전에 광원에서 유리 / 거울 쪽으로 photon을 쏴서 (광원 x 물체마다 CAUSTIC_PHOTONS 개) 바닥 등에 모인 빛을 photon map으로
+# whitted / path 둘 다 shading 때 가까운 photon으로 더함 (shadow ray로는 유리 너머 광원을 못 봄)
+CAUSTICS = False
+CAUSTIC_PHOTONS = 100000
+
+# 면광원 샘플링 ~ "grid" (기존 6 x 6 격자는 36), "stratified", "random"
+LIGHT_MODE = "stratified"
+LIGHT_SAMPLES = 16
+
+# scene 파일 (JSON) ~ python main.py a.json b.json ... 처럼 여러 개를 차례로, 없으면 SCENE_FILE, 그것도 None 이면 create_cornell_box
+# 파일의 "render" 항목이 아래 설정을 덮어씀, COMPILE_SCENES 면 만든 scene을 .cache/ 에 저장해두고 다음부터 바로 읽음
+SCENE_FILE = None
+COMPILE_SCENES = True
+
+# OBJ mesh 추가 ~ None 이면 Cornell box만, 중심 / 가장 긴 변 길이로 맞춰서 배치
+MESH_FILE = None
+MESH_CENTER = (0, -4, 0)
+MESH_SIZE = 8
+
+# 첫 hit의 albedo / normal / depth 버퍼 ~ DENOISE 면 이것으로 à-trous denoiser를 돌린 뒤 저장 (2 ~ 4 spp 로도 깨끗하게)
+# SAVE_AUX 면 버퍼를 이미지 옆에 .aux.npz 로 저장
+DENOISE = False
+SAVE_AUX = False
+
+# 렌더링 통계 ~ ray 종류별 수, BVH 노드 방문, primitive 교차 검사 수, 단계별 시간 (출력 + 이미지 옆에 .json)
+COLLECT_STATS = False
 
 output_dir = "hw5_result"
-os.makedirs(output_dir, exist_ok=True)
-
-# 파일 이름 결정 
-def get_next_filename(directory):
-    existing = [f for f in os.listdir(directory) if f.endswith(".png")]
-    nums = [int(f.split(".")[0]) for f in existing if f.split(".")[0].isdigit()]
-    next_num = max(nums) + 1 if nums else 1
-    return os.path.join(directory, f"{next_num}.png")
 
 # tqdm이 적용된 렌더링 함수 (overwrite render)
 def render_with_progress(camera, objects, lights, width=640, height=480):
 
     image = np.zeros((height, width, 3), dtype=np.float32)
+    pixel_angle = camera_pixel_angle(camera)
 
     for y in tqdm(range(height), desc="Rendering"):
         for x in range(width):
             ray = camera.generate_ray(x, y)
-            color = trace_ray(ray, objects, lights, camera.eye)
+            count("rays.primary")
+            color = trace_ray(ray, objects, lights, camera.eye, pixel_angle=pixel_angle)
             image[y, x] = color
     return image
 
-def save_image(image_array, filename="output_image.png"):
+# scene 파일의 "render" 항목 -> 렌더링 설정 (없는 것은 위의 기본값)
+def render_settings(overrides):
+    settings = dict(mode=RENDER_MODE, integrator=INTEGRATOR, sampler=SAMPLER, tile_size=TILE_SIZE, workers=WORKERS, seed=SEED, passes=PASSES,
+                    max_samples=MAX_SAMPLES, error_threshold=ERROR_THRESHOLD, denoise=DENOISE, save_aux=SAVE_AUX, irradiance_cache=IRRADIANCE_CACHE,
+                    caustics=CAUSTICS, caustic_photons=CAUSTIC_PHOTONS, output_dir=output_dir)
+
+    unknown = set(overrides) - set(settings) - {'light_mode', 'light_samples', 'accelerator'}
+    if unknown: raise ValueError(f"unknown render settings: {', '.join(sorted(unknown))}")
+
+    settings.update(overrides)
+    return settings
+
+# output 폴더 안의 scene별 파일 ~ 여러 scene을 한 번에 렌더링해도 buffer / preview / cache가 섞이지 않게
+def scene_output(settings, name, filename):
+    return os.path.join(settings['output_dir'], f"{name}.{filename}")
+
+def render_scene(camera, scene, lights, settings, name="cornell"):
+    mode = settings['mode']
+    width, height = camera.width, camera.height
+
+    sampler = make_sampler(settings['sampler'], settings['seed'])
+    common = dict(tile_size=settings['tile_size'], workers=settings['workers'], seed=settings['seed'], integrator=settings['integrator'], sampler=sampler)
+
+    if mode == "progressive":
+        buffer_path = scene_output(settings, name, ACCUMULATION_BUFFER)
+        return render_progressive(camera, scene, lights, buffer_path, settings['passes'], preview_path=scene_output(settings, name, "preview.png"), width=width, height=height, **common)
+
+    if mode == "adaptive":
+        return render_adaptive(camera, scene, lights, width, height, threshold=settings['error_threshold'], max_samples=settings['max_samples'], heatmap_path=scene_output(settings, name, "heatmap.png"), **common)
+
+    if mode == "parallel": return render_parallel(camera, scene, lights, width, height, **common)
+    if mode == "wavefront": return render_parallel(camera, scene, lights, width, height, **dict(common, workers=1))
+    if mode == "scalar": return render_with_progress(camera, scene, lights, width, height) # 기존 ray 하나씩 (np.random)
+
+    raise ValueError(f"unknown render mode: {mode!r}")
+
+# 멀티프로세스 (spawn) 에서 worker가 다시 렌더링하지 않도록 
+if __name__ == "__main__":
+    scene_files = sys.argv[1:] or ([SCENE_FILE] if SCENE_FILE is not None else [])
+
+    jobs = []
+
+    for scene_file in scene_files:
+        loaded = load_scene(scene_file, compiled_scene_path(scene_file) if COMPILE_SCENES else None)
+        name = os.path.splitext(os.path.basename(scene_file))[0]
+        jobs.append((name, loaded.camera, loaded.accelerator, loaded.lights, render_settings(loaded.settings)))
+
+    if not scene_files:
+        objects, lights = create_cornell_box()
+        configure_light_sampling(lights, LIGHT_SAMPLES, LIGHT_MODE)
+
+        if MESH_FILE is not None:
+            mesh_material = Material(color=(0.8, 0.8, 0.8), ambient=0.05, diffuse=0.6, specular=0.3, shininess=20, reflective=0.05)
+            objects.append(load_mesh(MESH_FILE, mesh_material, center=MESH_CENTER, size=MESH_SIZE))
+
+        # 작은 scene은 compiled scene, 큰 scene은 flat BVH (SAH)
+        jobs.append(("cornell", camera, build_accelerator(objects), lights, render_settings({})))
+
+    for name, job_camera, scene, lights, settings in jobs:
+        if hasattr(scene, 'format_stats'): print(scene.format_stats())
+
+        os.makedirs(settings['output_dir'], exist_ok=True)
+
+        stats = enable_stats() if COLLECT_STATS else None
+        start_time = time.perf_counter()
+
+        # photon map이 먼저 ~ irradiance record의 간접광에도 caustic이 들어감
+        if settings['caustics']: set_photon_map(trace_caustic_photons(scene, lights, settings['caustic_photons'], settings['seed']))
+
+        # whitted만 ~ path는 vertex마다 직접 샘플링
+        if settings['irradiance_cache'] and settings['integrator'] == "whitted":
+            cache_path = scene_output(settings, name, IRRADIANCE_CACHE_FILE)
+            cache = IrradianceCache.load(cache_path, cache_signature(scene, lights))
+
+            prepare_irradiance_cache(cache, job_camera, scene, lights, trace_rays, settings['seed'])
+            cache.save(cache_path)
+
+            set_irradiance_cache(cache)
+
+        # 렌더링
+        image = render_scene(job_camera, scene, lights, settings, name)
+
+        filename = get_next_filename(settings['output_dir'])
+
+        if settings['denoise'] or settings['save_aux']:
+            aux = render_aux(job_camera, scene, job_camera.width, job_camera.height, settings['tile_size'])
 
-    # gamma correction - 자주 사용하는 2.2를 사용 
-    gamma_correction = np.clip(image_array, 0, 1) ** (1 / 2.2)
+            if settings['save_aux']: save_aux(os.path.splitext(filename)[0] + ".aux.npz", *aux)
+            if settings['denoise']: image = denoise(image, *aux)
 
-    image = Image.fromarray((255* gamma_correction).astype(np.uint8)) # Error 처리 uint8 
-    image.save(filename)
+        save_image(image, filename)
+        set_irradiance_cache(None)
+        set_photon_map(None)
 
-    # 확인용 
-    print(f"{filename} saved")
+        if stats is not None:
+            wall_time = time.perf_counter() - start_time
 
+            print(stats.summary(wall_time))
+            stats.dump(os.path.splitext(filename)[0] + ".stats.json", wall_time)
 
-# 렌더링
-image = render_with_progress(camera, BVH, lights)
-filename = get_next_filename(output_dir)
-save_image(image, filename)
\ No newline at end of file
+            disable_stats()
@@ -1,17 +1,35 @@
-from PIL import Image
+import os
 import numpy as np
 
 from find_intersection import intersect_plane, intersect_cube, intersect_hollow_cylinder, intersect_hole_plane, intersect_sphere
+from find_intersection import intersect_plane_batch, intersect_cube_batch, intersect_hollow_cylinder_batch, intersect_hole_plane_batch, intersect_sphere_batch
+from find_intersection import compile_geometry
+from texture_hw5 import as_texture
 
 EPSILON = 0.01
 PI = np.pi
 
-def load_texture(path):
-    return np.array(Image.open(path)).astype(np.float32) / 255
+# texture는 경로로만 ~ 처음 샘플링할 때 디코딩, 같은 파일은 texture cache에서 공유 (mip 포함)
+PAPER_TEXTURE = "textures/paper.png"
+TAPE_TEXTURE = "textures/Tape.png"
+WOOD_TEXTURE = "textures/wood.png" # 저장소에는 없음 ~ 있으면 씀
 
-paper_texture = load_texture("textures/paper.png")
-tape_texture = load_texture("textures/Tape.png")
-wood_texture = load_texture("textures/wood.png")
+# 기본 scene의 texture는 선택 ~ 파일이 없으면 경고만 하고 material 색으로 (scene 파일의 texture는 없으면 에러)
+def optional_texture(path):
+    if os.path.isfile(path): return path
+
+    print(f"{path} not found, using the plain material colour")
+    return None
+
+# Plane, Hole_Plane 공용 ~ point 하나 (3,) 또는 배치 (N, 3) 
+def plane_uv(plane, points):
+    geo = plane.geometry
+    point_center = points - geo.center
+
+    u = 1/2 + (point_center @ geo.uv_u) * geo.inv_size[0]
+    v = 1/2 + (point_center @ geo.uv_v) * geo.inv_size[1]
+
+    return np.clip(u, 0, 1), np.clip(v, 0, 1)
 
 class Material:
     def __init__(self, color, ambient=0.1, diffuse=0.9, specular=0.0, shininess=0, reflective=0.0, refractive=0.0, ior=1.0, texture=None):
@@ -27,7 +45,7 @@ class Material:
 
         self.ior = ior
 
-        self.texture = texture
+        self.texture = as_texture(texture)
 
 class Plane:
     def __init__(self, center, normal, size, material):
@@ -36,27 +54,22 @@ class Plane:
         self.size = size      
         self.material = material
 
+        self.geometry = compile_geometry(self)
+
     def intersect(self, ray):
         return intersect_plane(ray, self)
+
+    # origins, directions : (N, 3) -> ray_distance (N,), normal (N, 3)
+    def intersect_batch(self, origins, directions):
+        return intersect_plane_batch(origins, directions, self)
     
     # for texture
     def get_uv(self, point):
+        return plane_uv(self, point)
 
-        point_center = np.array(point) - np.array(self.center)
-
-        u_axis = np.cross(self.normal, (0, 1, 0)).astype(np.float64) # 외적 
-
-        # 거의 평행일때 처리해줘야 함 
-        if np.linalg.norm(u_axis) < EPSILON: 
-            u_axis = np.cross(self.normal, (1, 0, 0)).astype(np.float64)
-
-        u_axis /= np.linalg.norm(u_axis)
-        v_axis = np.cross(self.normal, u_axis)
-
-        u = 1/2 + np.dot(point_center, u_axis) / self.size[0]
-        v = 1/2 + np.dot(point_center, v_axis) / self.size[1]
-
-        return np.clip(u, 0, 1), np.clip(v, 0, 1)
+    # points : (N, 3) ~ 배치 버전 
+    def get_uv_batch(self, points):
+        return plane_uv(self, points)
     
 class Hole_Plane:
     def __init__(self, center, normal, size, hole_size, material):
@@ -66,27 +79,20 @@ class Hole_Plane:
         self.hole_size = hole_size  
         self.material = material 
 
+        self.geometry = compile_geometry(self)
+
     def intersect(self, ray):
         return intersect_hole_plane(ray, self)
 
+    def intersect_batch(self, origins, directions):
+        return intersect_hole_plane_batch(origins, directions, self)
+
     # 그냥 plane이랑 동일 
     def get_uv(self, point):
+        return plane_uv(self, point)
 
-        point_center = np.array(point) - np.array(self.center)
-        u_axis = np.cross(self.normal, (0, 1, 0))
-
-        # 거의 평행일때 처리해줘야 함 
-        if np.linalg.norm(u_axis) < EPSILON: u_axis = np.cross(self.normal, (1, 0, 0))
-
-        u_axis = u_axis.astype(float) # 오류처리 
-
-        u_axis /= np.linalg.norm(u_axis)
-        v_axis = np.cross(self.normal, u_axis)
-
-        u = 1/2 + np.dot(point_center, u_axis) / self.size[0]
-        v = 1/2 + np.dot(point_center, v_axis) / self.size[1]
-
-        return np.clip(u, 0, 1), np.clip(v, 0, 1)
+    def get_uv_batch(self, points):
+        return plane_uv(self, points)
 
 class Cube:
     def __init__(self, center, size, material):
@@ -94,12 +100,18 @@ class Cube:
         self.size = size     
         self.material = material
 
+        self.geometry = compile_geometry(self)
+
     def intersect(self, ray):
         return intersect_cube(ray, self)
+
+    def intersect_batch(self, origins, directions):
+        return intersect_cube_batch(origins, directions, self)
     
     def get_uv(self, point):
 
-        point_center = np.array(point) - np.array(self.center)
+        inv_size = self.geometry.inv_size
+        point_center = point - self.geometry.center
 
         max_axis = np.argmax(np.abs(point_center)) # 가장 긴 쪽 
 
@@ -107,16 +119,33 @@ class Cube:
         v = 0
 
         if max_axis == 0: # X 
-            u = 1/2 + point_center[2] / self.size[2]
-            v = 1/2 + point_center[1] / self.size[1]
+            u = 1/2 + point_center[2] * inv_size[2]
+            v = 1/2 + point_center[1] * inv_size[1]
 
         elif max_axis == 1: # Y
-            u = 1/2 + point_center[0] / self.size[0]
-            v = 1/2 + point_center[2] / self.size[2]
+            u = 1/2 + point_center[0] * inv_size[0]
+            v = 1/2 + point_center[2] * inv_size[2]
 
         else: # Z
-            u = 1/2 + point_center[0] / self.size[0]
-            v = 1/2 + point_center[1] / self.size[1]
+            u = 1/2 + point_center[0] * inv_size[0]
+            v = 1/2 + point_center[1] * inv_size[1]
+
+        return np.clip(u, 0, 1), np.clip(v, 0, 1)
+
+    def get_uv_batch(self, points):
+        inv_size = self.geometry.inv_size
+        point_center = points - self.geometry.center
+
+        max_axis = np.argmax(np.abs(point_center), axis=1)
+
+        # 축별로 (u 성분, v 성분)
+        u_index = np.array([2, 0, 0])[max_axis]
+        v_index = np.array([1, 2, 1])[max_axis]
+
+        rows = np.arange(len(points))
+
+        u = 1/2 + point_center[rows, u_index] * inv_size[u_index]
+        v = 1/2 + point_center[rows, v_index] * inv_size[v_index]
 
         return np.clip(u, 0, 1), np.clip(v, 0, 1)
 
@@ -128,17 +157,33 @@ class HollowCylinder:
         self.height = height
         self.material = material
 
+        self.geometry = compile_geometry(self)
+
     def intersect(self, ray):
         return intersect_hollow_cylinder(ray, self)
+
+    def intersect_batch(self, origins, directions):
+        return intersect_hollow_cylinder_batch(origins, directions, self)
     
     def get_uv(self, point):
-        x = point[0] - self.center[0] 
-        z = point[2] - self.center[2]
+        geo = self.geometry
+
+        x = point[0] - geo.center_xz[0] 
+        z = point[2] - geo.center_xz[1]
 
         theta = np.arctan2(z, x) # 오차 최소화하여 각도 계산 
 
         u = (theta + PI) / (2 * PI)
-        v = (point[1] - (self.center[1] - self.height / 2)) / self.height
+        v = (point[1] - geo.y_min) * geo.inv_height
+
+        return np.clip(u, 0, 1), np.clip(v, 0, 1)
+
+    def get_uv_batch(self, points):
+        geo = self.geometry
+        theta = np.arctan2(points[:, 2] - geo.center_xz[1], points[:, 0] - geo.center_xz[0])
+
+        u = (theta + PI) / (2 * PI)
+        v = (points[:, 1] - geo.y_min) * geo.inv_height
 
         return np.clip(u, 0, 1), np.clip(v, 0, 1)
     
@@ -148,19 +193,32 @@ class Sphere:
         self.radius = radius
         self.material = material
 
+        self.geometry = compile_geometry(self)
+
     def intersect(self, ray):
         return intersect_sphere(ray, self)
 
+    def intersect_batch(self, origins, directions):
+        return intersect_sphere_batch(origins, directions, self)
+
     def get_uv(self, point):
-        point_center = np.array(point) - np.array(self.center)
+        point_center = point - self.geometry.center
 
-        x, y, z = point_center / self.radius
+        x, y, z = point_center * self.geometry.inv_radius
 
         u = 1/2 + (np.arctan2(z, x) / (2 * PI))
         v = 1/2 - (np.arcsin(y) / PI)
 
         return np.clip(u, 0, 1), np.clip(v, 0, 1)
 
+    def get_uv_batch(self, points):
+        point_center = (points - self.geometry.center) * self.geometry.inv_radius
+
+        u = 1/2 + (np.arctan2(point_center[:, 2], point_center[:, 0]) / (2 * PI))
+        v = 1/2 - (np.arcsin(np.clip(point_center[:, 1], -1, 1)) / PI)
+
+        return np.clip(u, 0, 1), np.clip(v, 0, 1)
+
 
 class AreaLight:
     def __init__(self, center, normal, size, intensity):
@@ -174,11 +232,11 @@ class AreaLight:
 # Cornell Box 정의 #######################################################################
 
 def create_cornell_box():
-    white = Material(color=(1.0, 1.0, 1.0), ambient=0.05, diffuse=0.5, specular=0.3, shininess=2, reflective=0.05, refractive=0.0, texture=paper_texture)
-    red = Material(color=(1.0, 0.0, 0.0), ambient=0.05, diffuse=0.5, specular=0.3, shininess=2, reflective=0.05, refractive=0.0, texture=paper_texture)
-    green = Material(color=(0.0, 1.0, 0.0), ambient=0.05, diffuse=0.5, specular=0.3, shininess=2, reflective=0.05, refractive=0.0, texture=paper_texture)
-    wood = Material(color=(0.7, 0.5, 0.3), ambient=0.1, diffuse=0.2, specular=0.1, shininess=12, reflective=0.1, refractive=0.0, texture=wood_texture)
-    tape = Material(color=(0.95, 0.9, 0.8), ambient=0.1, diffuse=0.4, specular=0.3, shininess=9, reflective=0.05, refractive=0.0, texture=tape_texture)
+    white = Material(color=(1.0, 1.0, 1.0), ambient=0.05, diffuse=0.5, specular=0.3, shininess=2, reflective=0.05, refractive=0.0, texture=optional_texture(PAPER_TEXTURE))
+    red = Material(color=(1.0, 0.0, 0.0), ambient=0.05, diffuse=0.5, specular=0.3, shininess=2, reflective=0.05, refractive=0.0, texture=optional_texture(PAPER_TEXTURE))
+    green = Material(color=(0.0, 1.0, 0.0), ambient=0.05, diffuse=0.5, specular=0.3, shininess=2, reflective=0.05, refractive=0.0, texture=optional_texture(PAPER_TEXTURE))
+    wood = Material(color=(0.7, 0.5, 0.3), ambient=0.1, diffuse=0.2, specular=0.1, shininess=12, reflective=0.1, refractive=0.0, texture=optional_texture(WOOD_TEXTURE))
+    tape = Material(color=(0.95, 0.9, 0.8), ambient=0.1, diffuse=0.4, specular=0.3, shininess=9, reflective=0.05, refractive=0.0, texture=optional_texture(TAPE_TEXTURE))
     glass_ball = Material(color=(0.9, 0.95, 1.0), ambient=0.2, diffuse=0.8, specular=0.3, shininess=250, reflective=0.1, refractive=0.9, ior=1.5)
 
     objects = [
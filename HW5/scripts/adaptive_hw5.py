@@ -0,0 +1,78 @@
+import os
+import numpy as np
+
+from tqdm import tqdm
+
+from image_hw5 import save_heatmap
+from parallel_hw5 import make_tiles, render_parallel, render_pixel_jobs, worker_pool, TILE_SIZE, SEED, INTEGRATOR
+from progressive_hw5 import AccumulationBuffer, buffer_signature
+
+# 처음에는 모든 픽셀에 MIN_SAMPLES 만큼, 이후 오차가 큰 픽셀에만 라운드마다 ROUND_SAMPLES 씩 (최대 MAX_SAMPLES)
+MIN_SAMPLES = 4
+MAX_SAMPLES = 64
+ROUND_SAMPLES = 4
+
+# 상대 오차 = 표준오차 / (평균 밝기 + ERROR_FLOOR) ~ 어두운 픽셀에서 너무 엄격해지지 않도록
+ERROR_THRESHOLD = 0.03
+ERROR_FLOOR = 0.1
+
+# 한 번에 trace 할 픽셀 수 ~ worker 하나의 일 단위, 타일 하나 (32 x 32) 크기 (worker 수와 상관없이 고정해야 seed가 같음)
+CHUNK_PIXELS = 1024
+
+# 샘플을 더 받아야 하는 픽셀 
+def active_pixels(buffer, threshold=ERROR_THRESHOLD, max_samples=MAX_SAMPLES):
+    error, mean = buffer.standard_error()
+    return (error / (mean + ERROR_FLOOR) > threshold) & (buffer.sample_count < max_samples)
+
+# adaptive sampling ~ 픽셀별 평균 / 분산을 누적하면서 오차가 threshold 보다 큰 곳에만 샘플 추가
+# buffer_path가 있으면 progressive와 같은 버퍼 형식으로 저장 (이어서 렌더링 가능)
+# sampler (QMC) 가 있으면 픽셀마다 지금까지의 샘플 수가 수열 위치
+def render_adaptive(camera, scene, lights, width=640, height=480, threshold=ERROR_THRESHOLD, min_samples=MIN_SAMPLES, max_samples=MAX_SAMPLES, round_samples=ROUND_SAMPLES, buffer_path=None, heatmap_path=None, tile_size=TILE_SIZE, workers=1, seed=SEED, integrator=INTEGRATOR, sampler=None):
+    buffer = AccumulationBuffer.load(buffer_path, width, height, buffer_signature(camera, scene, lights, tile_size, seed, integrator, sampler))
+
+    # 모든 픽셀 min_samples 까지 ~ progressive와 같은 seed 규칙
+    tile_count = len(make_tiles(width, height, tile_size))
+
+    for pass_index in range(buffer.passes, min_samples):
+        image = render_parallel(camera, scene, lights, width, height, tile_size=tile_size, workers=workers, seed=seed + pass_index * tile_count, jitter=True, integrator=integrator, desc=f"Pass {pass_index + 1}/{min_samples}", sampler=sampler, sample_index=pass_index)
+
+        buffer.add(image)
+        buffer.save()
+
+    # 이후 라운드 ~ chunk마다 (지금까지 샘플 수 + chunk 번호) 로 seed를 정해서 이어서 렌더링해도, worker 수가 달라도 같은 결과
+    # chunk는 worker pool로 (pool은 라운드 전체에서 하나)
+    workers = workers or os.cpu_count() or 1
+    pool = None if workers == 1 else worker_pool(camera, scene, lights, workers, seed, True, integrator, sampler)
+
+    try:
+        while True:
+            active = active_pixels(buffer, threshold, max_samples)
+            ys, xs = np.nonzero(active)
+            if len(xs) == 0: break
+
+            # 픽셀마다 max_samples 를 넘지 않게
+            remaining = np.minimum(round_samples, max_samples - buffer.sample_count[ys, xs])
+
+            for step in tqdm(range(int(remaining.max())), desc=f"Adaptive ({len(xs)} pixels)"):
+                step_x, step_y = xs[remaining > step], ys[remaining > step]
+                round_index = int(buffer.sample_count.sum())
+
+                jobs = [(seed + round_index + chunk_index, step_x[start:start + CHUNK_PIXELS], step_y[start:start + CHUNK_PIXELS], buffer.sample_count[step_y[start:start + CHUNK_PIXELS], step_x[start:start + CHUNK_PIXELS]])
+                        for chunk_index, start in enumerate(range(0, len(step_x), CHUNK_PIXELS))]
+
+                for (_, chunk_x, chunk_y, _), colors in zip(jobs, render_pixel_jobs(camera, scene, lights, jobs, pool, integrator, sampler)):
+                    buffer.add_pixels(chunk_x, chunk_y, colors)
+
+            buffer.save()
+
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+    total = int(buffer.sample_count.sum())
+    print(f"Adaptive: {total} samples ({total / (width * height):.2f} per pixel, {total / (width * height * max_samples) * 100:.1f}% of uniform {max_samples})")
+
+    if heatmap_path is not None: save_heatmap(buffer.sample_count, heatmap_path)
+
+    return buffer.image()
@@ -0,0 +1,533 @@
+import os
+import math
+import time
+import shutil
+import hashlib
+import numpy as np
+
+from find_intersection import compute_aabb, update_nearest_batch, update_occluded_batch
+from stats_hw5 import count
+
+# SAH 설정
+LEAF_SIZE = 4        # leaf 하나에 들어갈 수 있는 최대 primitive 수 (이하면 SAH로 나눌지 판단, 넘으면 항상 나눔)
+SAH_BINS = 12        # centroid binning 개수
+TRAVERSAL_COST = 1.0 # 노드 하나 (box test) 비용
+INTERSECT_COST = 0.1 # primitive 교차 하나 비용 ~ wavefront에서는 노드 방문 (ray 묶음 나누기 + box test) 이 leaf 교차 (배열 한 번) 보다 훨씬 비쌈 (torus / 구 scene에서 측정)
+
+# SAH 결과 디스크 cache ~ primitive box + 빌드 설정의 hash 마다 디렉터리 하나, 배열마다 .npy (memory-map 으로 읽음)
+# 같은 scene이면 다음 실행 / worker process에서 다시 빌드하지 않음 (None 이면 안 씀)
+# 위치는 실행 폴더와 상관없이 HW5/.cache/bvh (.gitignore)
+BVH_CACHE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), ".cache", "bvh")
+
+# cache 형식 ~ 빌더 / 저장하는 배열 구성이 바뀌면 올림 (hash에 들어가서 예전 cache는 안 읽힘)
+CACHE_FORMAT = 2
+
+# 최근에 쓴 것만 이만큼 남기고 나머지는 저장할 때 지움
+CACHE_KEEP = 64
+
+ARRAY_NAMES = ('bounds_min', 'bounds_max', 'left', 'right', 'axis', 'prim_start', 'prim_count', 'primitive_ids')
+
+# NumPy 배열로 펼친 BVH (깊이 우선 배치)
+# 노드 i : bounds_min[i], bounds_max[i]
+#   - 내부 노드 : left[i] = i + 1 (깊이 우선 배치), right[i] = 오른쪽 자식 index
+#   - leaf     : left[i] = -1, primitive_ids[prim_start[i] : prim_start[i] + prim_count[i]]
+# primitive id는 objects 리스트의 index
+
+class FlatBVH:
+    def __init__(self, objects, bounds_min, bounds_max, left, right, axis, prim_start, prim_count, primitive_ids):
+        self.objects = objects
+
+        self.bounds_min = bounds_min
+        self.bounds_max = bounds_max
+        self.left = left
+        self.right = right
+        self.axis = axis # 분할 축 ~ left가 이 축 기준 아래쪽
+
+        self.prim_start = prim_start
+        self.prim_count = prim_count
+        self.primitive_ids = primitive_ids
+
+        self.build_time = 0.0
+        self.cache_path = None # 디스크 cache에 있으면 그 디렉터리
+        self.from_cache = False # 빌드하지 않고 cache에서 읽었는지
+
+        self._prepare()
+
+    def _prepare(self):
+        objects, left, right = self.objects, self.left, self.right
+        bounds_min, bounds_max = self.bounds_min, self.bounds_max
+        prim_start, prim_count, primitive_ids = self.prim_start, self.prim_count, self.primitive_ids
+
+        # scalar traversal용 python 값 (노드마다 numpy 임시 배열 만들지 않도록)
+        self._bounds = [tuple(lo) + tuple(hi) for lo, hi in zip(bounds_min.tolist(), bounds_max.tolist())]
+        self._left = left.tolist()
+        self._right = right.tolist()
+
+        # objects = None 이면 primitive가 object가 아님 (mesh 삼각형 등) ~ leaf 처리를 subclass에서
+        if objects is not None:
+            self._leaf_objects = [[objects[i] for i in primitive_ids[s:s + c]] for s, c in zip(prim_start.tolist(), prim_count.tolist())]
+
+    # pickle (worker로 넘기기) ~ cache에 있으면 배열 대신 경로만 보내고 받는 쪽에서 memory-map, python 목록은 다시 만듦
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        for name in ('_bounds', '_left', '_right', '_leaf_objects'): state.pop(name, None)
+
+        if self.cache_path is not None:
+            for name in ARRAY_NAMES: del state[name]
+
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        if self.cache_path is not None: self.__dict__.update(load_cached_arrays(self.cache_path))
+
+        self._prepare()
+
+    @property
+    def node_count(self):
+        return len(self.left)
+
+    # 빌드 통계 ~ 노드 수, 깊이, leaf 크기, SAH 기대 비용 
+    def stats(self):
+        area = _surface_area(self.bounds_min, self.bounds_max)
+        area_ratio = area / area[0] if area[0] > 0 else np.ones_like(area)
+
+        is_leaf = self.left < 0
+
+        depth = np.zeros(self.node_count, dtype=np.int32)
+        for node in range(self.node_count): # 깊이 우선 배치라 부모가 항상 먼저
+            if not is_leaf[node]:
+                depth[self.left[node]] = depth[node] + 1
+                depth[self.right[node]] = depth[node] + 1
+
+        expected_cost = TRAVERSAL_COST * np.sum(area_ratio[~is_leaf]) + INTERSECT_COST * np.sum(area_ratio[is_leaf] * self.prim_count[is_leaf])
+
+        return {
+            'nodes': int(self.node_count),
+            'leaves': int(np.count_nonzero(is_leaf)),
+            'depth': int(depth.max()),
+            'primitives': int(len(self.primitive_ids)),
+            'max_leaf_size': int(self.prim_count[is_leaf].max()),
+            'expected_cost': float(expected_cost),
+            'build_time': float(self.build_time),
+            'from_cache': self.from_cache,
+        }
+
+    def format_stats(self):
+        stats = self.stats()
+        return "BVH: {nodes} nodes ({leaves} leaves), depth {depth}, {primitives} primitives, max leaf {max_leaf_size}, SAH cost {expected_cost:.2f}, build {build_time:.3f}s".format(**stats) + (" (from cache)" if stats['from_cache'] else "")
+
+    # 최근접 교차 (scalar) ~ 가까운 자식 먼저, 지금까지의 최근접보다 먼 노드는 건너뜀
+    def nearest_hit(self, ray):
+        origin = [float(v) for v in ray.origin]
+        direction = [float(v) for v in ray.direction]
+
+        entry = _entry_function(origin, direction)
+
+        best_hit = None
+        best_t = math.inf
+
+        t_root = entry(self._bounds[0])
+        if t_root is None: return None
+
+        stack = [(0, t_root)]
+
+        while stack:
+            node, t_node = stack.pop()
+            if t_node > best_t: continue
+
+            count("bvh.nodes")
+            left = self._left[node]
+
+            # leaf
+            if left < 0:
+                for obj in self._leaf_objects[node]:
+                    count("tests." + obj.__class__.__name__)
+                    hit = obj.intersect(ray)
+
+                    if hit is not None and hit.ray_distance < best_t:
+                        best_hit, best_t = hit, hit.ray_distance
+                continue
+
+            right = self._right[node]
+
+            t_left = entry(self._bounds[left])
+            t_right = entry(self._bounds[right])
+
+            # 먼 쪽을 먼저 push -> 가까운 쪽이 먼저 pop
+            children = sorted(((t, child) for t, child in ((t_left, left), (t_right, right)) if t is not None and t <= best_t), reverse=True)
+
+            for t, child in children: stack.append((child, t))
+
+        return best_hit
+
+    # 최근접 교차 (배치) ~ 노드마다 살아있는 ray index만 들고 내려감 (packet traversal)
+    def nearest_hit_batch(self, origins, directions):
+        n = len(origins)
+
+        ray_distance = np.full(n, np.inf)
+        normals = np.zeros((n, 3), dtype=np.float64)
+        object_ids = np.full(n, -1, dtype=np.int64)
+
+        # origin, 1 / direction 을 한 배열로 ~ 노드마다 gather 한 번
+        packet = np.empty((n, 6), dtype=np.float64)
+        packet[:, :3] = origins
+
+        with np.errstate(divide='ignore'):
+            packet[:, 3:] = 1 / directions
+
+        stack = [(0, np.arange(n))]
+
+        while stack:
+            node, rows = stack.pop()
+            count("bvh.nodes", len(rows))
+
+            sub = packet[rows]
+            hit = self._box_test_batch(node, sub, ray_distance[rows])
+
+            if not hit.all():
+                rows, sub = rows[hit], sub[hit]
+                if len(rows) == 0: continue
+
+            left = self.left[node]
+
+            # leaf
+            if left < 0:
+                if len(rows) == n: rows = None # 전부 살아있으면 gather 생략
+
+                self._leaf_nearest(node, origins, directions, rows, ray_distance, normals, object_ids)
+                continue
+
+            right = self.right[node]
+
+            # 분할 축 방향으로 진행하는 ray가 많으면 left가 가까움
+            if np.count_nonzero(sub[:, 3 + self.axis[node]] >= 0) * 2 >= len(rows):
+                stack.append((right, rows))
+                stack.append((left, rows))
+            else:
+                stack.append((left, rows))
+                stack.append((right, rows))
+
+        return ray_distance, normals, object_ids
+
+    # 가려짐 검사 (scalar) ~ max_distance 안에서 처음 만나는 물체가 있으면 바로 True
+    def occluded(self, ray, max_distance):
+        entry = _entry_function([float(v) for v in ray.origin], [float(v) for v in ray.direction])
+
+        stack = [0]
+
+        while stack:
+            node = stack.pop()
+            count("bvh.nodes")
+
+            t_node = entry(self._bounds[node])
+            if t_node is None or t_node > max_distance: continue
+
+            left = self._left[node]
+
+            if left < 0:
+                for obj in self._leaf_objects[node]:
+                    count("tests." + obj.__class__.__name__)
+                    hit = obj.intersect(ray)
+                    if hit is not None and hit.ray_distance < max_distance: return True
+                continue
+
+            stack.append(self._right[node])
+            stack.append(left)
+
+        return False
+
+    # 가려짐 검사 (배치) ~ 가려진 ray는 그 자리에서 traversal에서 빠짐
+    def occluded_batch(self, origins, directions, max_distances):
+        n = len(origins)
+
+        max_distances = np.broadcast_to(np.asarray(max_distances, dtype=np.float64), (n,))
+        occluded = np.zeros(n, dtype=bool)
+
+        packet = np.empty((n, 6), dtype=np.float64)
+        packet[:, :3] = origins
+
+        with np.errstate(divide='ignore'):
+            packet[:, 3:] = 1 / directions
+
+        stack = [(0, np.arange(n))]
+
+        while stack:
+            node, rows = stack.pop()
+
+            rows = rows[~occluded[rows]]
+            if len(rows) == 0: continue
+
+            count("bvh.nodes", len(rows))
+            hit = self._box_test_batch(node, packet[rows], max_distances[rows])
+            rows = rows[hit]
+            if len(rows) == 0: continue
+
+            left = self.left[node]
+
+            if left < 0:
+                self._leaf_occluded(node, origins, directions, rows, max_distances, occluded)
+                continue
+
+            stack.append((self.right[node], rows))
+            stack.append((left, rows))
+
+        return occluded
+
+    # leaf 안의 primitive ~ rows : 검사할 ray index (None = 전부)
+    def _leaf_primitives(self, node):
+        start = self.prim_start[node]
+        return self.primitive_ids[start:start + self.prim_count[node]]
+
+    def _leaf_nearest(self, node, origins, directions, rows, ray_distance, normals, object_ids):
+        for object_id in self._leaf_primitives(node):
+            update_nearest_batch(origins, directions, self.objects[object_id], object_id, rows, ray_distance, normals, object_ids)
+
+    def _leaf_occluded(self, node, origins, directions, rows, max_distances, occluded):
+        for object_id in self._leaf_primitives(node):
+            update_occluded_batch(origins, directions, self.objects[object_id], rows[~occluded[rows]], max_distances, occluded)
+
+    # slab test ~ 축별로 (N, 3) reduce 피함, sub : (N, 6) = origin, 1 / direction
+    def _box_test_batch(self, node, sub, max_distance):
+        lo = self.bounds_min[node]
+        hi = self.bounds_max[node]
+
+        t_near = np.full(len(sub), -np.inf)
+        t_far = max_distance
+
+        with np.errstate(invalid='ignore'):
+            for k in range(3):
+                t0 = (lo[k] - sub[:, k]) * sub[:, 3 + k]
+                t1 = (hi[k] - sub[:, k]) * sub[:, 3 + k]
+
+                t_near = np.maximum(t_near, np.minimum(t0, t1))
+                t_far = np.minimum(t_far, np.maximum(t0, t1))
+
+        return (t_near <= t_far) & (t_far >= 0)
+
+# ray 하나에 대한 box 진입 거리 함수 (miss -> None), 축과 평행한 경우 따로 처리
+def _entry_function(origin, direction):
+    ox, oy, oz = origin
+    inv = [1 / d if d != 0 else None for d in direction]
+
+    def entry(box):
+        t_near = -math.inf
+        t_far = math.inf
+
+        for k, o in ((0, ox), (1, oy), (2, oz)):
+            lo, hi = box[k], box[k + 3]
+
+            if inv[k] is None:
+                if o < lo or o > hi: return None
+                continue
+
+            t0 = (lo - o) * inv[k]
+            t1 = (hi - o) * inv[k]
+            if t0 > t1: t0, t1 = t1, t0
+
+            if t0 > t_near: t_near = t0
+            if t1 < t_far: t_far = t1
+
+        if t_near > t_far or t_far < 0: return None
+        return t_near
+
+    return entry
+
+def _surface_area(lo, hi):
+    extent = np.maximum(hi - lo, 0)
+    return 2 * (extent[..., 0] * extent[..., 1] + extent[..., 1] * extent[..., 2] + extent[..., 2] * extent[..., 0])
+
+# SAH (binned) 빌더 ~ 박스는 한 번만 계산, 바로 flat 배열로 
+def build_flat_bvh(objects, leaf_size=LEAF_SIZE, bins=SAH_BINS):
+    start_time = time.perf_counter()
+
+    boxes = [compute_aabb(obj) for obj in objects]
+
+    prim_min = np.array([box.min for box in boxes], dtype=np.float64)
+    prim_max = np.array([box.max for box in boxes], dtype=np.float64)
+
+    arrays, path, from_cache = cached_sah_arrays(prim_min, prim_max, leaf_size, bins)
+
+    bvh = FlatBVH(objects, *arrays)
+    bvh.build_time = time.perf_counter() - start_time
+    bvh.cache_path, bvh.from_cache = path, from_cache
+
+    return bvh
+
+# primitive box 배열 (n, 3) -> FlatBVH 배열들 (bounds_min, ..., primitive_ids)
+def build_sah_arrays(prim_min, prim_max, leaf_size=LEAF_SIZE, bins=SAH_BINS):
+    builder = _SAHBuilder(prim_min, prim_max, leaf_size, bins)
+    builder.build(np.arange(len(prim_min)))
+
+    return builder.arrays()
+
+# ---------- 디스크 cache ----------
+# 배열 + 설정 값들의 hash ~ SAH 빌드 결과는 primitive box와 빌드 설정만으로 정해지므로 이것들이 key
+def content_hash(arrays, settings):
+    digest = hashlib.sha1()
+
+    for array in arrays:
+        array = np.ascontiguousarray(array)
+        digest.update(f"{array.dtype.str}{array.shape}".encode())
+        digest.update(array.tobytes())
+
+    digest.update(repr(settings).encode())
+    return digest.hexdigest()
+
+def cache_path(kind, key):
+    if BVH_CACHE_DIR is None: return None
+    return os.path.abspath(os.path.join(BVH_CACHE_DIR, f"{kind}-{key}"))
+
+# 오래 안 쓴 것부터 지워서 CACHE_KEEP 개만 남김 ~ 읽을 때 수정 시각을 갱신 (touch_cache)
+# 다른 process가 memory-map 으로 열고 있어도 되는 것만 (못 지우면 그대로)
+def evict_cache(keep=CACHE_KEEP):
+    try: entries = [os.path.join(BVH_CACHE_DIR, name) for name in os.listdir(BVH_CACHE_DIR) if not name.endswith(".tmp")]
+    except OSError: return
+
+    entries = [path for path in entries if os.path.isdir(path)]
+    entries.sort(key=os.path.getmtime, reverse=True)
+
+    for path in entries[keep:]: shutil.rmtree(path, ignore_errors=True)
+
+def touch_cache(path):
+    try: os.utime(path)
+    except OSError: pass
+
+def load_cached_arrays(path, names=ARRAY_NAMES):
+    touch_cache(path)
+
+    # np.asarray ~ memmap subclass 대신 일반 배열 (복사 없이 같은 page)
+    return {name: np.asarray(np.load(os.path.join(path, name + ".npy"), mmap_mode='r')) for name in names}
+
+# 임시 디렉터리에 다 쓰고 이름 바꾸기 ~ 도중에 죽거나 여러 process가 동시에 만들어도 반쯤 쓴 cache는 안 보임
+# 저장했으면 (또는 이미 있으면) True, 못 쓰면 (읽기 전용 등) False
+def save_cached_arrays(path, names, arrays):
+    temp_path = f"{path}.{os.getpid()}.tmp"
+
+    try:
+        os.makedirs(temp_path, exist_ok=True)
+        for name, array in zip(names, arrays): np.save(os.path.join(temp_path, name + ".npy"), array)
+    except OSError: return False
+
+    try: os.rename(temp_path, path)
+    except OSError: # 다른 process가 먼저 만듦
+        for name in names: os.remove(os.path.join(temp_path, name + ".npy"))
+        os.rmdir(temp_path)
+
+    evict_cache()
+    return os.path.isdir(path)
+
+# cache에 있으면 읽고, 없으면 빌드해서 저장 ~ (배열들, cache 디렉터리 또는 None, cache에서 읽었는지)
+def cached_sah_arrays(prim_min, prim_max, leaf_size=LEAF_SIZE, bins=SAH_BINS):
+    prim_min = np.asarray(prim_min, dtype=np.float64)
+    prim_max = np.asarray(prim_max, dtype=np.float64)
+
+    path = cache_path("bvh", content_hash((prim_min, prim_max), (CACHE_FORMAT, leaf_size, bins, TRAVERSAL_COST, INTERSECT_COST)))
+
+    if path is not None and os.path.isdir(path):
+        arrays = load_cached_arrays(path)
+        return tuple(arrays[name] for name in ARRAY_NAMES), path, True
+
+    arrays = build_sah_arrays(prim_min, prim_max, leaf_size, bins)
+
+    if path is None or not save_cached_arrays(path, ARRAY_NAMES, arrays): return arrays, None, False
+    return arrays, path, False
+
+class _SAHBuilder:
+    def __init__(self, prim_min, prim_max, leaf_size, bins):
+        self.prim_min = prim_min
+        self.prim_max = prim_max
+        self.centroids = (prim_min + prim_max) / 2
+
+        self.leaf_size = max(1, leaf_size)
+        self.bins = max(2, bins)
+
+        self.bounds_min, self.bounds_max, self.left, self.right, self.axis = [], [], [], [], []
+        self.prim_start, self.prim_count, self.primitive_ids = [], [], []
+
+    def arrays(self):
+        return (
+            np.array(self.bounds_min, dtype=np.float64), np.array(self.bounds_max, dtype=np.float64),
+            np.array(self.left, dtype=np.int32), np.array(self.right, dtype=np.int32), np.array(self.axis, dtype=np.int8),
+            np.array(self.prim_start, dtype=np.int32), np.array(self.prim_count, dtype=np.int32), np.array(self.primitive_ids, dtype=np.int32),
+        )
+
+    def build(self, ids):
+        index = len(self.left)
+
+        lo = self.prim_min[ids].min(axis=0)
+        hi = self.prim_max[ids].max(axis=0)
+
+        self.bounds_min.append(lo)
+        self.bounds_max.append(hi)
+        self.left.append(-1)
+        self.right.append(-1)
+        self.axis.append(0)
+        self.prim_start.append(0)
+        self.prim_count.append(0)
+
+        # leaf ~ 나눌 수 없거나 (centroid가 전부 같음), leaf_size 이하인데 나눈 비용이 leaf (전부 교차) 보다 비쌀 때
+        split = self.find_split(ids, lo, hi)
+        if split is not None and len(ids) <= self.leaf_size and split[2] >= INTERSECT_COST * len(ids): split = None
+
+        if split is None:
+            self.prim_start[index] = len(self.primitive_ids)
+            self.prim_count[index] = len(ids)
+            self.primitive_ids.extend(ids.tolist())
+            return index
+
+        axis, left_mask, _ = split
+
+        self.axis[index] = axis
+        self.left[index] = self.build(ids[left_mask])
+        self.right[index] = self.build(ids[~left_mask])
+
+        return index
+
+    # 가장 싼 (axis, left_mask, cost) 반환, cost는 현재 노드 면적으로 정규화 
+    # 세 축을 한 번에 binning (축마다 따로 돌면 노드당 호출 수가 너무 많음)
+    def find_split(self, ids, lo, hi):
+        if len(ids) < 2: return None
+
+        bins = self.bins
+        centroids = self.centroids[ids]
+
+        c_min = centroids.min(axis=0)
+        extent = centroids.max(axis=0) - c_min
+        if not np.any(extent > 0): return None
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            bin_index = ((centroids - c_min) / extent * bins).astype(np.int64)
+        bin_index = np.clip(bin_index, 0, bins - 1) # (n, 3)
+
+        # (axis, bin) -> 한 줄 index
+        flat_index = (bin_index + np.arange(3) * bins).T.ravel()
+
+        counts = np.bincount(flat_index, minlength=3 * bins).reshape(3, bins)
+
+        bin_min = np.full((3 * bins, 3), np.inf)
+        bin_max = np.full((3 * bins, 3), -np.inf)
+        np.minimum.at(bin_min, flat_index, np.tile(self.prim_min[ids], (3, 1)))
+        np.maximum.at(bin_max, flat_index, np.tile(self.prim_max[ids], (3, 1)))
+
+        bin_min = bin_min.reshape(3, bins, 3)
+        bin_max = bin_max.reshape(3, bins, 3)
+
+        # 앞 / 뒤에서 누적 ~ split i : bin 0..i | i+1..
+        left_count = np.cumsum(counts, axis=1)[:, :-1]
+        right_count = len(ids) - left_count
+
+        left_area = _surface_area(np.minimum.accumulate(bin_min, axis=1)[:, :-1], np.maximum.accumulate(bin_max, axis=1)[:, :-1])
+        right_area = _surface_area(np.minimum.accumulate(bin_min[:, ::-1], axis=1)[:, ::-1][:, 1:], np.maximum.accumulate(bin_max[:, ::-1], axis=1)[:, ::-1][:, 1:])
+
+        valid = (left_count > 0) & (right_count > 0) & (extent[:, None] > 0)
+
+        with np.errstate(invalid='ignore'):
+            cost = TRAVERSAL_COST + INTERSECT_COST * (left_area * left_count + right_area * right_count) / _surface_area(lo, hi)
+
+        cost = np.where(valid, cost, np.inf)
+
+        axis, split = np.unravel_index(np.argmin(cost), cost.shape)
+        if not np.isfinite(cost[axis, split]): return None
+
+        return int(axis), bin_index[:, axis] <= split, float(cost[axis, split])
@@ -47,3 +47,23 @@ class Camera:
         direction /= np.linalg.norm(direction)
 
         return Ray(self.eye, direction)
+
+    # 배치 버전 ~ xs, ys : 픽셀 좌표 배열 (N,) -> origins, directions (N, 3)
+    def generate_rays(self, xs, ys):
+        px = (2 * ((np.asarray(xs, dtype=np.float64) + 1/2) / self.width) -1) * self.aspect_ratio
+        py = 1 - 2*((np.asarray(ys, dtype=np.float64) + 1/2) / self.height)
+
+        px *= self.scale
+        py *= self.scale
+
+        directions = -self.camera_z + px[:, None] * self.camera_x + py[:, None] * self.camera_y
+        directions /= np.linalg.norm(directions, axis=1, keepdims=True)
+
+        origins = np.broadcast_to(self.eye.astype(np.float64), directions.shape).copy()
+
+        return origins, directions
+
+    # 타일 (x0 ~ x1, y0 ~ y1) 의 픽셀 좌표, row-major 
+    def tile_pixels(self, x0, y0, x1, y1):
+        ys, xs = np.mgrid[y0:y1, x0:x1]
+        return xs.ravel(), ys.ravel()
@@ -0,0 +1,399 @@
+import numpy as np
+
+from find_intersection import AABB, Hit, solve_quadratic_batch, EPSILON
+from stats_hw5 import count
+
+# primitive 종류 ~ objects 리스트의 object 하나 -> (type, group 내 index)
+TYPE_PLANE = 0    # Plane, Hole_Plane (구멍 크기 0 = 일반 plane)
+TYPE_BOX = 1
+TYPE_CYLINDER = 2
+TYPE_SPHERE = 3
+TYPE_MESH = 4     # mesh 하나 = primitive 하나 (안쪽은 mesh 자체 BVH)
+
+# (primitive 수 x ray 수) 임시 배열 크기 상한 ~ 넘으면 primitive를 나눠서
+MAX_BROADCAST = 1 << 21
+
+# 종류별 primitive 묶음 ~ 같은 종류 전부를 연속 배열로
+# intersect : (K, N) ray_distance (miss = inf) + 보조값 ~ primitive 축이 앞 (행 단위로 연속이라 빠름)
+# hit_normals : ray마다 가장 가까운 primitive (k) 의 normal만 계산
+
+class PlaneGroup:
+    type_id = TYPE_PLANE
+    counter = "tests.Plane" # 통계용
+
+    def __init__(self, objects):
+        geometry = [obj.geometry for obj in objects]
+
+        self.centers = np.array([g.center for g in geometry], dtype=np.float64)
+        self.normals = np.array([g.normal for g in geometry], dtype=np.float64)
+        self.half_size = np.array([g.half_size for g in geometry], dtype=np.float64)
+        self.half_hole = np.array([getattr(g, 'half_hole', (0, 0)) for g in geometry], dtype=np.float64)
+
+        # 축 5개 (normal, u, v, 구멍용 uv_u, uv_v) 를 한 행렬로 ~ origins, directions 투영은 행렬곱 한 번씩
+        # point_center @ axis = origin @ axis + t * direction @ axis - center @ axis
+        axes = [self.normals] + [np.array([getattr(g, name) for g in geometry], dtype=np.float64) for name in ('u', 'v', 'uv_u', 'uv_v')]
+
+        self.axes = np.stack(axes) # (5, K, 3)
+        self.offsets = np.sum(self.axes * self.centers, axis=2) # (5, K)
+
+        self.has_hole = bool(np.any(self.half_hole > 0))
+
+    def __len__(self):
+        return len(self.centers)
+
+    def intersect(self, origins, directions, ks):
+        axis_count = 5 if self.has_hole else 3
+        K = len(ks)
+
+        axes = self.axes[:axis_count, ks].reshape(-1, 3)
+        origin_proj = axes @ origins.T - self.offsets[:axis_count, ks].reshape(-1, 1) # (axis_count * K, N)
+        direction_proj = axes @ directions.T
+
+        lean = direction_proj[:K]
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            ray_distance = -origin_proj[:K] / lean
+
+            x = origin_proj[K:2 * K] + ray_distance * direction_proj[K:2 * K]
+            y = origin_proj[2 * K:3 * K] + ray_distance * direction_proj[2 * K:3 * K]
+
+            valid = (np.abs(lean) >= EPSILON) & (ray_distance >= 0)
+            valid &= (np.abs(x) <= self.half_size[ks, 0, None]) & (np.abs(y) <= self.half_size[ks, 1, None])
+
+            if self.has_hole:
+                x = origin_proj[3 * K:4 * K] + ray_distance * direction_proj[3 * K:4 * K]
+                y = origin_proj[4 * K:] + ray_distance * direction_proj[4 * K:]
+
+                valid &= ~((np.abs(x) < self.half_hole[ks, 0, None]) & (np.abs(y) < self.half_hole[ks, 1, None]))
+
+        return np.where(valid, ray_distance, np.inf), None
+
+    def hit_normals(self, origins, directions, ray_distance, k, extra):
+        return self.normals[k]
+
+class BoxGroup:
+    type_id = TYPE_BOX
+    counter = "tests.Cube"
+
+    def __init__(self, objects):
+        self.mins = np.array([obj.geometry.bounds_min for obj in objects], dtype=np.float64)
+        self.maxs = np.array([obj.geometry.bounds_max for obj in objects], dtype=np.float64)
+
+    def __len__(self):
+        return len(self.mins)
+
+    # slab ~ 축별로
+    def intersect(self, origins, directions, ks):
+        start_distance = np.full((len(ks), len(origins)), -np.inf)
+        exit_distance = np.full((len(ks), len(origins)), np.inf)
+
+        # 임시 배열을 줄이려고 in-place
+        with np.errstate(divide='ignore', invalid='ignore'):
+            for axis in range(3):
+                ray_start = (self.mins[ks, axis, None] - origins[:, axis]) / directions[:, axis]
+                ray_exit = (self.maxs[ks, axis, None] - origins[:, axis]) / directions[:, axis]
+
+                np.maximum(start_distance, np.minimum(ray_start, ray_exit), out=start_distance)
+                np.minimum(exit_distance, np.maximum(ray_start, ray_exit, out=ray_start), out=exit_distance)
+
+        valid = (start_distance <= exit_distance) & (exit_distance >= 0)
+        ray_distance = np.where(start_distance > 0, start_distance, exit_distance)
+
+        return np.where(valid, ray_distance, np.inf), None
+
+    # intersect_cube_batch와 같은 순서 (축마다 min -> max)
+    def hit_normals(self, origins, directions, ray_distance, k, extra):
+        point = origins + ray_distance[:, None] * directions
+
+        normals = np.zeros_like(origins)
+        assigned = np.zeros(len(origins), dtype=bool)
+
+        for axis in range(3):
+            for bounds, sign in ((self.mins, -1), (self.maxs, 1)):
+                face = ~assigned & (np.abs(point[:, axis] - bounds[k, axis]) < EPSILON)
+                normals[face, axis] = sign
+                assigned |= face
+
+        return normals
+
+class CylinderGroup:
+    type_id = TYPE_CYLINDER
+    counter = "tests.HollowCylinder"
+
+    def __init__(self, objects):
+        geometry = [obj.geometry for obj in objects]
+
+        self.center_xz = np.array([g.center_xz for g in geometry], dtype=np.float64)
+        self.y_min = np.array([g.y_min for g in geometry])
+        self.y_max = np.array([g.y_max for g in geometry])
+        self.inner_radius = np.array([g.inner_radius for g in geometry])
+        self.outer_radius = np.array([g.outer_radius for g in geometry])
+        self.inner_sq = self.inner_radius ** 2
+        self.outer_sq = self.outer_radius ** 2
+
+    def __len__(self):
+        return len(self.center_xz)
+
+    # extra ~ 맞은 면 (0 : 바깥, 1 : 안쪽, 2 : 윗면, 3 : 아랫면)
+    def intersect(self, origins, directions, ks):
+        origin_x = origins[:, 0] - self.center_xz[ks, 0, None]
+        origin_z = origins[:, 2] - self.center_xz[ks, 1, None]
+        dx, dy, dz = directions[:, 0], directions[:, 1], directions[:, 2]
+
+        a = dx * dx + dz * dz
+        b = (dx * origin_x + dz * origin_z) * 2
+        c_base = origin_x * origin_x + origin_z * origin_z
+
+        y_min, y_max = self.y_min[ks, None], self.y_max[ks, None]
+
+        best_t = np.full(origin_x.shape, np.inf)
+        surface = np.zeros(origin_x.shape, dtype=np.int8)
+
+        # 옆면 ~ intersect_hollow_cylinder_batch와 같은 순서
+        for radius_sq, code in ((self.outer_sq, 0), (self.inner_sq, 1)):
+            t0, t1, solvable = solve_quadratic_batch(a, b, c_base - radius_sq[ks, None])
+
+            for t in (t0, t1):
+                with np.errstate(invalid='ignore'):
+                    y = origins[:, 1] + t * dy
+                    valid = solvable & (t > 0) & (y >= y_min) & (y <= y_max) & (t < best_t)
+
+                best_t = np.where(valid, t, best_t)
+                surface[valid] = code
+
+        # 위아래
+        for y_plane, code in ((y_max, 2), (y_min, 3)):
+            with np.errstate(divide='ignore', invalid='ignore'):
+                t_cap = (y_plane - origins[:, 1]) / dy
+                dist_xz = np.hypot(origin_x + t_cap * dx, origin_z + t_cap * dz)
+
+                valid = (np.abs(dy) >= EPSILON) & (t_cap >= 0) & (t_cap < best_t)
+                valid &= (dist_xz >= self.inner_radius[ks, None]) & (dist_xz <= self.outer_radius[ks, None])
+
+            best_t = np.where(valid, t_cap, best_t)
+            surface[valid] = code
+
+        return best_t, surface
+
+    def hit_normals(self, origins, directions, ray_distance, k, extra):
+        normals = np.zeros_like(origins)
+
+        nx = origins[:, 0] + ray_distance * directions[:, 0] - self.center_xz[k, 0]
+        nz = origins[:, 2] + ray_distance * directions[:, 2] - self.center_xz[k, 1]
+
+        side = extra <= 1
+        length = np.sqrt(nx * nx + nz * nz) * np.where(extra == 0, 1, -1)
+
+        normals[side, 0] = nx[side] / length[side]
+        normals[side, 2] = nz[side] / length[side]
+        normals[extra == 2, 1] = 1
+        normals[extra == 3, 1] = -1
+
+        return normals
+
+class SphereGroup:
+    type_id = TYPE_SPHERE
+    counter = "tests.Sphere"
+
+    def __init__(self, objects):
+        geometry = [obj.geometry for obj in objects]
+
+        self.centers = np.array([g.center for g in geometry], dtype=np.float64)
+        self.radius_sq = np.array([g.radius_sq for g in geometry])
+        self.inv_radius = np.array([g.inv_radius for g in geometry])
+
+        self.center_sq = np.sum(self.centers * self.centers, axis=1)
+
+    def __len__(self):
+        return len(self.centers)
+
+    # |o - c|^2 = |o|^2 - 2 o.c + |c|^2 ~ (K, N, 3) 배열 없이
+    # 판별식까지만 전체 계산, 근은 판별식 >= 0 인 (대부분 소수) 쌍만
+    def intersect(self, origins, directions, ks):
+        centers = self.centers[ks]
+
+        a = np.sum(directions * directions, axis=1)
+        half_b = np.sum(origins * directions, axis=1) - centers @ directions.T
+        c = np.sum(origins * origins, axis=1) - 2 * centers @ origins.T + (self.center_sq[ks] - self.radius_sq[ks])[:, None]
+
+        Quadratic = half_b ** 2 - a * c
+
+        ray_distance = np.full(Quadratic.shape, np.inf)
+        k, n = np.nonzero(Quadratic >= 0)
+
+        sqrt_disc = np.sqrt(Quadratic[k, n])
+        x1 = (-half_b[k, n] - sqrt_disc) / a[n]
+        x2 = (-half_b[k, n] + sqrt_disc) / a[n]
+
+        # 가까운 양수 근
+        ray_distance[k, n] = np.where(x1 > 0, x1, np.where(x2 > 0, x2, np.inf))
+        return ray_distance, None
+
+    def hit_normals(self, origins, directions, ray_distance, k, extra):
+        return (origins + ray_distance[:, None] * directions - self.centers[k]) * self.inv_radius[k][:, None]
+
+# mesh는 개수가 적고 각자 BVH가 있으니 mesh마다 배치 교차, normal은 그때 같이 받아둠 
+class MeshGroup:
+    type_id = TYPE_MESH
+    counter = "tests.Mesh"
+
+    def __init__(self, objects):
+        self.meshes = objects
+
+    def __len__(self):
+        return len(self.meshes)
+
+    # extra ~ (K, N, 3) normal
+    def intersect(self, origins, directions, ks):
+        ray_distance = np.full((len(ks), len(origins)), np.inf)
+        normals = np.zeros((len(ks), len(origins), 3))
+
+        for row, k in enumerate(ks):
+            ray_distance[row], normals[row] = self.meshes[k].intersect_batch(origins, directions)
+
+        return ray_distance, normals
+
+    def hit_normals(self, origins, directions, ray_distance, k, extra):
+        return extra
+
+# class 이름 -> group
+GROUPS = {
+    'Plane': PlaneGroup,
+    'Hole_Plane': PlaneGroup,
+    'Cube': BoxGroup,
+    'HollowCylinder': CylinderGroup,
+    'Sphere': SphereGroup,
+    'Mesh': MeshGroup,
+}
+
+# 종류별로 묶은 scene (structure of arrays)
+# prim_type[i], prim_index[i] : objects[i] 의 종류, group 안에서의 index
+# group_ids[type] : group 안의 index -> objects 리스트 index
+class CompiledScene:
+    def __init__(self, objects):
+        self.objects = objects
+
+        self.prim_type = np.zeros(len(objects), dtype=np.int8)
+        self.prim_index = np.zeros(len(objects), dtype=np.int64)
+
+        members = {}
+        for object_id, obj in enumerate(objects):
+            class_name = obj.__class__.__name__
+            if class_name not in GROUPS: raise NotImplementedError(f"Unknown object type: {class_name}")
+
+            members.setdefault(GROUPS[class_name], []).append(object_id)
+
+        self.groups = []
+        self.group_ids = []
+        self.group_bounds = [] # group 전체를 감싸는 AABB ~ plane은 None (교차 자체가 box test만큼 쌈)
+
+        for group_class, ids in members.items():
+            ids = np.array(ids, dtype=np.int64)
+
+            self.prim_type[ids] = group_class.type_id
+            self.prim_index[ids] = np.arange(len(ids))
+
+            self.groups.append(group_class([objects[i] for i in ids]))
+            self.group_ids.append(ids)
+
+            if group_class is PlaneGroup: self.group_bounds.append(None)
+            else:
+                bounds_min = np.min([objects[i].geometry.bounds_min for i in ids], axis=0)
+                bounds_max = np.max([objects[i].geometry.bounds_max for i in ids], axis=0)
+                self.group_bounds.append(AABB(bounds_min, bounds_max))
+
+    def counts(self):
+        return {group.__class__.__name__: len(group) for group in self.groups}
+
+    # primitive를 나눠서 (K, N) 이 MAX_BROADCAST를 넘지 않도록
+    def _chunks(self, group, ray_count):
+        step = max(MAX_BROADCAST // max(ray_count, 1), 1)
+        return [np.arange(start, min(start + step, len(group))) for start in range(0, len(group), step)]
+
+    # group AABB를 통과하는 ray index (None = 전부)
+    def _candidate_rays(self, bounds, origins, directions, max_distance, rows=None):
+        if bounds is None: return rows
+
+        if rows is None: return np.nonzero(bounds.intersect_batch(origins, directions, max_distance))[0]
+        return rows[bounds.intersect_batch(origins[rows], directions[rows], max_distance[rows])]
+
+    # 최근접 교차 (배치) ~ Nearest_HIT_finder_batch와 같은 반환값
+    def nearest_hit_batch(self, origins, directions):
+        ray_distance = np.full(len(origins), np.inf)
+        normals = np.zeros((len(origins), 3), dtype=np.float64)
+        object_ids = np.full(len(origins), -1, dtype=np.int64)
+
+        for group, ids, bounds in zip(self.groups, self.group_ids, self.group_bounds):
+            rows = self._candidate_rays(bounds, origins, directions, ray_distance)
+            if rows is not None and len(rows) == 0: continue
+
+            sub_origins = origins if rows is None else origins[rows]
+            sub_directions = directions if rows is None else directions[rows]
+            if rows is None: rows = np.arange(len(origins))
+
+            for ks in self._chunks(group, len(rows)):
+                count(group.counter, len(ks) * len(rows))
+                t, extra = group.intersect(sub_origins, sub_directions, ks)
+
+                nearest = np.argmin(t, axis=0)
+                t = t[nearest, np.arange(len(rows))]
+                k = ks[nearest]
+
+                # 같은 거리면 앞쪽 object (리스트 순서와 동일)
+                closer = (t < ray_distance[rows]) | ((t == ray_distance[rows]) & (ids[k] < object_ids[rows]) & np.isfinite(t))
+                sub = np.nonzero(closer)[0]
+                if len(sub) == 0: continue
+
+                extra = None if extra is None else extra[nearest[sub], sub]
+                hit_rows = rows[sub]
+
+                ray_distance[hit_rows] = t[sub]
+                normals[hit_rows] = group.hit_normals(sub_origins[sub], sub_directions[sub], t[sub], k[sub], extra)
+                object_ids[hit_rows] = ids[k[sub]]
+
+        return ray_distance, normals, object_ids
+
+    # 가려짐 검사 (배치, any-hit) ~ 이미 가려진 ray는 다음 group에서 제외
+    def occluded_batch(self, origins, directions, max_distances):
+        occluded = np.zeros(len(origins), dtype=bool)
+
+        for group, bounds in zip(self.groups, self.group_bounds):
+            rows = np.nonzero(~occluded)[0] if occluded.any() else None
+            if rows is not None and len(rows) == 0: return occluded
+
+            rows = self._candidate_rays(bounds, origins, directions, max_distances, rows)
+            if rows is not None and len(rows) == 0: continue
+
+            for ks in self._chunks(group, len(origins) if rows is None else len(rows)):
+                count(group.counter, len(ks) * (len(origins) if rows is None else len(rows)))
+
+                if rows is None:
+                    t, extra = group.intersect(origins, directions, ks)
+                    occluded |= np.any(t < max_distances, axis=0)
+                else:
+                    t, extra = group.intersect(origins[rows], directions[rows], ks)
+                    occluded[rows] |= np.any(t < max_distances[rows], axis=0)
+
+        return occluded
+
+    # scalar ray ~ Nearest_HIT_finder_bvh / Occlusion_finder_bvh 에서 사용
+    def nearest_hit(self, ray):
+        origin = ray.origin.astype(np.float64)[None]
+        direction = ray.direction.astype(np.float64)[None]
+
+        ray_distance, normals, object_ids = self.nearest_hit_batch(origin, direction)
+        if object_ids[0] < 0: return None
+
+        obj = self.objects[object_ids[0]]
+        point = ray.origin + ray_distance[0] * ray.direction
+
+        return Hit(ray_distance=ray_distance[0], point=point, normal=normals[0], material=obj.material, object=obj)
+
+    def occluded(self, ray, max_distance):
+        origin = ray.origin.astype(np.float64)[None]
+        direction = ray.direction.astype(np.float64)[None]
+
+        return bool(self.occluded_batch(origin, direction, np.array([max_distance], dtype=np.float64))[0])
+
+def compile_scene(objects):
+    return CompiledScene(objects)
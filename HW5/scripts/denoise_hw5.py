@@ -0,0 +1,125 @@
+import numpy as np
+
+from find_intersection import Nearest_HIT_finder_batch, scene_objects
+from shader_hw5 import material_table, surface_color_batch
+from texture_hw5 import pixel_footprint, camera_pixel_angle
+from parallel_hw5 import make_tiles, TILE_SIZE
+from stats_hw5 import count, timed
+
+# à-trous wavelet denoiser (Dammertz et al. 2010) ~ 5 x 5 B3 spline kernel을 간격 1, 2, 4, ... 로 벌려가며 반복
+# 가중치는 color + 첫 hit의 albedo / normal / depth 버퍼로 edge-stopping ~ 물체 경계, texture는 유지하고 노이즈만 뭉갬
+ITERATIONS = 5
+
+SIGMA_COLOR = 0.4       # color 차이 (반복마다 절반) ~ 클수록 더 뭉갬
+SIGMA_ALBEDO = 0.1
+NORMAL_POWER = 64       # max(0, n_p . n_q) ^ 이것 ~ 클수록 각진 경계를 엄격하게
+SIGMA_DEPTH = 0.05      # 상대 깊이 차이 |z_p - z_q| / min(z_p, z_q)
+
+B3_SPLINE = np.array([1, 4, 6, 4, 1], dtype=np.float64) / 16
+
+# ---------- 보조 버퍼 ----------
+
+# 픽셀 중심으로 primary ray 하나씩 ~ 첫 hit의 albedo (material color x texture), normal (카메라 쪽), 깊이
+# 아무것도 안 맞은 픽셀은 albedo / normal 0, 깊이 inf
+def render_aux(camera, scene, width=640, height=480, tile_size=TILE_SIZE):
+    albedo = np.zeros((height, width, 3), dtype=np.float32)
+    normal = np.zeros((height, width, 3), dtype=np.float32)
+    depth = np.full((height, width), np.inf, dtype=np.float32)
+
+    objects = scene_objects(scene)
+    table = material_table(objects)
+
+    for x0, y0, x1, y1 in make_tiles(width, height, tile_size):
+        xs, ys = camera.tile_pixels(x0, y0, x1, y1)
+        origins, directions = camera.generate_rays(xs, ys)
+        count("rays.aux", len(origins))
+
+        with timed("intersect"): ray_distance, normals, object_ids = Nearest_HIT_finder_batch(origins, directions, scene)
+
+        rows = np.nonzero(object_ids >= 0)[0]
+        points = origins[rows] + ray_distance[rows, None] * directions[rows]
+
+        # 양면 plane 등 ~ 카메라를 보는 쪽으로 통일
+        normals = normals[rows] / np.linalg.norm(normals[rows], axis=1, keepdims=True)
+        normals *= np.where(np.sum(normals * directions[rows], axis=1) > 0, -1, 1)[:, None]
+
+        tile_albedo = np.zeros((len(origins), 3))
+        tile_normal = np.zeros((len(origins), 3))
+        tile_depth = np.full(len(origins), np.inf)
+
+        tile_albedo[rows] = surface_color_batch(points, object_ids[rows], objects, table, pixel_footprint(points, normals, camera.eye, camera_pixel_angle(camera)))
+        tile_normal[rows] = normals
+        tile_depth[rows] = ray_distance[rows]
+
+        albedo[y0:y1, x0:x1] = tile_albedo.reshape(y1 - y0, x1 - x0, 3)
+        normal[y0:y1, x0:x1] = tile_normal.reshape(y1 - y0, x1 - x0, 3)
+        depth[y0:y1, x0:x1] = tile_depth.reshape(y1 - y0, x1 - x0)
+
+    return albedo, normal, depth
+
+def save_aux(path, albedo, normal, depth):
+    np.savez_compressed(path, albedo=albedo, normal=normal, depth=depth)
+    print(f"{path} saved")
+
+# ---------- denoiser ----------
+
+# (dy, dx) 만큼 민 이미지 ~ 가장자리는 복사 (edge padding)
+def _shifted(padded, pad, dy, dx, height, width):
+    return padded[pad + dy:pad + dy + height, pad + dx:pad + dx + width]
+
+# 한 단계 ~ step 간격으로 벌린 5 x 5 kernel, 가중치 합으로 정규화
+def atrous_step(color, albedo, normal, depth, step, sigma_color):
+    height, width = color.shape[:2]
+    pad = 2 * step
+
+    def padded(buffer):
+        widths = ((pad, pad), (pad, pad)) + ((0, 0),) * (buffer.ndim - 2)
+        return np.pad(buffer, widths, mode='edge')
+
+    color_pad, albedo_pad, normal_pad, depth_pad = padded(color), padded(albedo), padded(normal), padded(depth)
+
+    total = np.zeros_like(color)
+    weight_sum = np.zeros((height, width))
+
+    for i, ky in enumerate(B3_SPLINE):
+        for j, kx in enumerate(B3_SPLINE):
+            dy, dx = (i - 2) * step, (j - 2) * step
+
+            q_color = _shifted(color_pad, pad, dy, dx, height, width)
+            q_albedo = _shifted(albedo_pad, pad, dy, dx, height, width)
+            q_normal = _shifted(normal_pad, pad, dy, dx, height, width)
+            q_depth = _shifted(depth_pad, pad, dy, dx, height, width)
+
+            w_color = np.exp(-np.sum((color - q_color) ** 2, axis=-1) / sigma_color ** 2)
+            w_albedo = np.exp(-np.sum((albedo - q_albedo) ** 2, axis=-1) / SIGMA_ALBEDO ** 2)
+            w_normal = np.maximum(np.sum(normal * q_normal, axis=-1), 0) ** NORMAL_POWER
+            w_depth = np.exp(-np.abs(depth - q_depth) / (SIGMA_DEPTH * np.minimum(depth, q_depth)))
+
+            weight = ky * kx * w_color * w_albedo * w_normal * w_depth
+
+            total += weight[:, :, None] * q_color
+            weight_sum += weight
+
+    return total / weight_sum[:, :, None]
+
+# color (H, W, 3) + 보조 버퍼 -> 노이즈 제거한 color
+# albedo로 나눠서 (demodulate) 조명만 filter 후 다시 곱함 ~ texture 무늬가 뭉개지지 않게
+def denoise(image, albedo, normal, depth, iterations=ITERATIONS, sigma_color=SIGMA_COLOR):
+    with timed("denoise"):
+        image = np.asarray(image, dtype=np.float64)
+        albedo = np.asarray(albedo, dtype=np.float64)
+        normal = np.asarray(normal, dtype=np.float64)
+
+        # 배경 (miss) ~ 아주 먼 깊이로 물체와 섞이지 않게, 결과는 원래 값 그대로
+        hit = np.isfinite(depth)
+        depth = np.where(hit, depth, 1e30).astype(np.float64)
+
+        safe_albedo = np.where(albedo > 1e-3, albedo, 1.0)
+        irradiance = image / safe_albedo
+
+        normal = np.where(hit[:, :, None], normal, np.array([0.0, 0.0, 1.0]))
+
+        for iteration in range(iterations):
+            irradiance = atrous_step(irradiance, albedo, normal, depth, 2 ** iteration, sigma_color * 2 ** -iteration)
+
+        return np.where(hit[:, :, None], irradiance * safe_albedo, image).astype(np.float32)
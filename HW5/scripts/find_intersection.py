@@ -1,8 +1,11 @@
 # https://www.scratchapixel.com/lessons/3d-basic-rendering/minimal-ray-tracer-rendering-simple-shapes/ray-box-intersection.html
 # https://en.wikipedia.org/wiki/Slab_method
 
+import math
 import numpy as np
 
+from stats_hw5 import count
+
 EPSILON = 0.00001
 
 class Hit:
@@ -21,33 +24,94 @@ class Ray:
         self.direction = np.array(direction, dtype=np.float32) 
         self.direction /= np.linalg.norm(self.direction)
 
+# ---------- geometry cache ----------
+# scene 생성 시 object마다 한 번만 계산 (center, 축, 절반 크기, 역수 ...), 교차 / uv 코드는 여기서 읽기만 함
+
+class Geometry:
+    def __init__(self, **fields):
+        for name, value in fields.items():
+            if isinstance(value, np.ndarray): value.flags.writeable = False
+            object.__setattr__(self, name, value)
+
+    # 읽기 전용 
+    def __setattr__(self, name, value):
+        raise AttributeError(f"geometry cache is read-only ({name})")
+
+# normal 기준 축 두 개 ~ first 와 외적, 거의 평행이면 second
+def plane_axes(normal, first, second):
+    u = np.cross(normal, first)
+    if np.linalg.norm(u) < EPSILON: u = np.cross(normal, second)
+    u = u / np.linalg.norm(u)
+
+    return u, np.cross(normal, u)
+
+def compile_geometry(obj):
+    class_name = obj.__class__.__name__
+    center = np.array(obj.center, dtype=np.float32)
+
+    if class_name in ('Plane', 'Hole_Plane'):
+        normal = np.array(obj.normal, dtype=np.float32)
+        size = np.array(obj.size, dtype=np.float32)
+
+        # 교차 범위는 (1, 0, 0) 기준, uv / 구멍은 (0, 1, 0) 기준 축 (기존 코드 그대로)
+        u, v = plane_axes(normal, (1, 0, 0), (0, 0, 1))
+        uv_u, uv_v = plane_axes(normal, (0, 1, 0), (1, 0, 0))
+
+        # 최소 두께 0.1 
+        corners = np.array([center + du * size[0] / 2 * u + dv * size[1] / 2 * v for du in [-1, 1] for dv in [-1, 1]])
+
+        fields = dict(normal=normal, u=u.astype(np.float32), v=v.astype(np.float32), half_size=size / 2,
+                      uv_u=uv_u.astype(np.float32), uv_v=uv_v.astype(np.float32), inv_size=1 / size,
+                      bounds_min=corners.min(axis=0) - 0.1, bounds_max=corners.max(axis=0) + 0.1)
+
+        if class_name == 'Hole_Plane': fields['half_hole'] = np.array(obj.hole_size, dtype=np.float32) / 2
+
+    elif class_name == 'Cube':
+        size = np.array(obj.size, dtype=np.float32)
+
+        fields = dict(half_size=size / 2, inv_size=1 / size, bounds_min=center - size / 2, bounds_max=center + size / 2)
+
+    elif class_name == 'HollowCylinder':
+        half_height = obj.height / 2
+        extent = np.array([obj.outer_radius, half_height, obj.outer_radius], dtype=np.float32)
+
+        fields = dict(center_xz=(float(center[0]), float(center[2])), y_min=float(center[1] - half_height), y_max=float(center[1] + half_height),
+                      outer_radius=float(obj.outer_radius), inner_radius=float(obj.inner_radius),
+                      outer_sq=float(obj.outer_radius) ** 2, inner_sq=float(obj.inner_radius) ** 2, inv_height=1 / obj.height,
+                      bounds_min=center - extent, bounds_max=center + extent)
+
+    elif class_name == 'Mesh':
+        fields = dict(bounds_min=obj.vertices.min(axis=0).astype(np.float32), bounds_max=obj.vertices.max(axis=0).astype(np.float32))
+
+    elif class_name == 'Sphere':
+        fields = dict(radius=float(obj.radius), radius_sq=float(obj.radius) ** 2, inv_radius=1 / obj.radius,
+                      bounds_min=center - obj.radius, bounds_max=center + obj.radius)
+
+    else:
+        raise NotImplementedError("Unknown object type")
+
+    return Geometry(center=center, **fields)
+
 def intersect_plane(ray, plane):
+    geo = plane.geometry
 
     # 각도, 거리 예외 처리 
-    lean = np.dot(ray.direction, plane.normal)
+    lean = np.dot(ray.direction, geo.normal)
     if abs(lean) < EPSILON: return None 
 
-    ray_distance = np.dot(np.array(plane.center) - ray.origin, plane.normal) / lean
+    ray_distance = np.dot(geo.center - ray.origin, geo.normal) / lean
     if ray_distance < 0: return None
 
     # 
     hit_point = ray.origin + ray_distance * ray.direction
-    point_center = hit_point - np.array(plane.center)
-
-    width, height = plane.size[0] / 2, plane.size[1] / 2
-
-    u = np.cross(plane.normal, (1, 0, 0))
-    if np.linalg.norm(u) < EPSILON: u = np.cross(plane.normal, (0, 0, 1))
-    u = u / np.linalg.norm(u)
+    point_center = hit_point - geo.center
 
-    v = np.cross(plane.normal, u)
+    x = np.dot(point_center, geo.u)
+    y = np.dot(point_center, geo.v)
 
-    x = np.dot(point_center, u)
-    y = np.dot(point_center, v)
+    if abs(x) > geo.half_size[0] or abs(y) > geo.half_size[1]: return None
 
-    if abs(x) > width or abs(y) > height: return None
-
-    return Hit(ray_distance=ray_distance, point=hit_point, normal=np.array(plane.normal), material=plane.material, object=plane)
+    return Hit(ray_distance=ray_distance, point=hit_point, normal=geo.normal, material=plane.material, object=plane)
 
 def intersect_hole_plane(ray, face):
 
@@ -55,28 +119,21 @@ def intersect_hole_plane(ray, face):
     hit = intersect_plane(ray, face)
     if hit is None: return None
 
-    point_center = hit.point - np.array(face.center)
-
-    u_axis = np.cross(face.normal, (0, 1, 0))
-    if np.linalg.norm(u_axis) < EPSILON: u_axis = np.cross(face.normal, (1, 0, 0))
-    u_axis = u_axis / np.linalg.norm(u_axis)
-
-    v_axis = np.cross(face.normal, u_axis)
+    geo = face.geometry
+    point_center = hit.point - geo.center
 
-    x = np.dot(point_center, u_axis)
-    y = np.dot(point_center, v_axis)
+    x = np.dot(point_center, geo.uv_u)
+    y = np.dot(point_center, geo.uv_v)
 
-    hole_w, hole_h = face.hole_size[0] / 2, face.hole_size[1] / 2
-
-    if abs(x) < hole_w and abs(y) < hole_h: return None
+    if abs(x) < geo.half_hole[0] and abs(y) < geo.half_hole[1]: return None
 
     hit.object = face
     return hit
 
 # Cube ~ Slab method 사용
 def intersect_cube(ray, cube):
-    min_point = np.array(cube.center) - 1/2 * np.array(cube.size)
-    max_point = np.array(cube.center) + 1/2 * np.array(cube.size)
+    min_point = cube.geometry.bounds_min
+    max_point = cube.geometry.bounds_max
 
     ray_start = (min_point - ray.origin) / ray.direction
     ray_exit  = (max_point - ray.origin) / ray.direction
@@ -107,77 +164,95 @@ def intersect_cube(ray, cube):
 
     return Hit(ray_distance=ray_distance, point=point, normal=normal, material=cube.material, object=cube)
 
-def intersect_hollow_cylinder(ray, cyl):
-    origin = ray.origin
-    direction = ray.direction
+# a t^2 + b t + c = 0 의 실근 (작은 것부터), 없으면 None
+# -b ± sqrt(D) 에서 생기는 소거 오차를 피하려고 q를 통해 두 근을 구함 (Numerical Recipes)
+def solve_quadratic(a, b, c):
+    if a == 0: return None
 
-    center = np.array(cyl.center)
-    origin_center = origin[[0, 2]]  - center[[0, 2]]
+    Quadratic = b * b - 4 * a * c
+    if Quadratic < 0: return None
 
-    dir_xz = direction[[0, 2]]
+    q = -0.5 * (b + math.copysign(math.sqrt(Quadratic), b))
+    if q == 0: return 0.0, 0.0
 
-    a = np.dot(dir_xz, dir_xz)
-    b = np.dot(dir_xz, origin_center) * 2 # 2배 
+    t0, t1 = q / a, c / q
+    return (t0, t1) if t0 <= t1 else (t1, t0)
 
-    c_outer = np.dot(origin_center, origin_center) - (cyl.outer_radius ** 2)
-    c_inner = np.dot(origin_center, origin_center) - (cyl.inner_radius ** 2)
+# 배치 버전 ~ (t0, t1, solvable), t0 <= t1 
+def solve_quadratic_batch(a, b, c):
+    Quadratic = b * b - 4 * a * c
+    solvable = (a != 0) & (Quadratic >= 0)
 
-    roots_outer = [r.real for r in np.roots([a, b, c_outer]) if np.isreal(r) and r.real > 0]
-    roots_inner = [r.real for r in np.roots([a, b, c_inner]) if np.isreal(r) and r.real > 0]
+    sqrt_disc = np.sqrt(np.where(solvable, Quadratic, 0))
+    q = -0.5 * (b + np.where(b >= 0, sqrt_disc, -sqrt_disc))
 
-    checklist = []
+    with np.errstate(divide='ignore', invalid='ignore'):
+        t0 = np.where(solvable, q / a, np.inf)
+        t1 = np.where(solvable & (q != 0), c / q, t0)
 
-    # 밖 
-    for t in roots_outer:
-        y = origin[1] + t * direction[1]
-        half_height = cyl.height / 2
+    return np.minimum(t0, t1), np.maximum(t0, t1), solvable
 
-        if cyl.center[1] - half_height <= y <= cyl.center[1] + half_height: # 포함되는 경우 
-            point = origin + t * direction
-            normal = point - center
-            normal[1] = 0
-            normal /= np.linalg.norm(normal)
+# 밖 / 안 옆면은 닫힌 형태로 풀고, 가장 가까운 hit 하나만 만든다 
+def intersect_hollow_cylinder(ray, cyl):
+    ox, oy, oz = (float(value) for value in ray.origin)
+    dx, dy, dz = (float(value) for value in ray.direction)
 
-            checklist.append(Hit(ray_distance=t, point=point, normal=normal, material=cyl.material, object=cyl))
+    geo = cyl.geometry
+    cx, cz = geo.center_xz
 
-    # 안 ~ normal만 반대 
-    for t in roots_inner:
-        y = origin[1] + t * direction[1]
-        half_height = cyl.height / 2
+    origin_x, origin_z = ox - cx, oz - cz
 
-        if cyl.center[1] - half_height <= y <= cyl.center[1] + half_height:
-            point = origin + t * direction
-            normal = point - center
-            normal[1] = 0
-            normal /= np.linalg.norm(normal)
+    a = dx * dx + dz * dz
+    b = (dx * origin_x + dz * origin_z) * 2 # 2배 
+    c_base = origin_x * origin_x + origin_z * origin_z
 
-            checklist.append(Hit(ray_distance=t, point=point, normal=-normal, material=cyl.material, object=cyl))
+    best_t = np.inf
+    best_normal = None
 
-    # 위아래 
-    for y_plane, normal_signature in [(center[1] + cyl.height / 2, 1), (center[1] - cyl.height / 2, -1)]:
-        if abs(direction[1]) < EPSILON: continue
+    # 밖 / 안 ~ 안쪽은 normal만 반대 
+    for radius_sq, signature in ((geo.outer_sq, 1), (geo.inner_sq, -1)):
+        roots = solve_quadratic(a, b, c_base - radius_sq)
+        if roots is None: continue
 
-        t_cap = (y_plane - origin[1]) / direction[1]
-        if t_cap < 0: continue
+        for t in roots: # 작은 근부터 
+            if t <= 0 or t >= best_t: continue
 
-        point = origin + t_cap * direction
-        dist_xz = np.linalg.norm(point[[0, 2]] - center[[0, 2]])
+            y = oy + t * dy
+            if not (geo.y_min <= y <= geo.y_max): continue
 
-        if cyl.inner_radius <= dist_xz <= cyl.outer_radius:
-            normal = np.array([0, normal_signature, 0], dtype=np.float32)
-            checklist.append(Hit(ray_distance=t_cap, point=point, normal=normal, material=cyl.material, object=cyl))
+            nx, nz = origin_x + t * dx, origin_z + t * dz
+            length = math.sqrt(nx * nx + nz * nz)
 
-    if not checklist: return None
+            best_t = t
+            best_normal = np.array([signature * nx / length, 0, signature * nz / length])
+            break
 
-    return min(checklist, key= lambda x: x.ray_distance)
+    # 위아래 
+    if abs(dy) >= EPSILON:
+        for y_plane, normal_signature in ((geo.y_max, 1), (geo.y_min, -1)):
+            t_cap = (y_plane - oy) / dy
+            if t_cap < 0 or t_cap >= best_t: continue
+
+            dist_xz = math.hypot(origin_x + t_cap * dx, origin_z + t_cap * dz)
+
+            if geo.inner_radius <= dist_xz <= geo.outer_radius:
+                best_t = t_cap
+                best_normal = np.array([0, normal_signature, 0], dtype=np.float32)
+
+    if best_normal is None: return None
+
+    point = ray.origin + best_t * ray.direction
+    return Hit(ray_distance=best_t, point=point, normal=best_normal, material=cyl.material, object=cyl)
 
 def intersect_sphere(ray, sphere):
-    origin = ray.origin - np.array(sphere.center)
+    geo = sphere.geometry
+
+    origin = ray.origin - geo.center
     dir = ray.direction
 
     a = np.dot(dir, dir)
     b = 2 * np.dot(origin, dir)
-    c = np.dot(origin, origin) - sphere.radius ** 2
+    c = np.dot(origin, origin) - geo.radius_sq
 
     Quadratic = b ** 2 - 4 * a * c
     if Quadratic < 0: return None 
@@ -192,10 +267,253 @@ def intersect_sphere(ray, sphere):
     if t is None: return None
 
     point = ray.origin + t * dir 
-    normal = (point - sphere.center) / sphere.radius
+    normal = (point - geo.center) * geo.inv_radius
 
     return Hit(ray_distance=t, point=point, normal=normal, material=sphere.material, object=sphere)
 
+# -------------------- Batch (wavefront) 교차
+# origins, directions : (N, 3) 배열 -> ray_distance (N,) (miss = inf), normal (N, 3)
+
+def intersect_plane_batch(origins, directions, plane):
+    geo = plane.geometry
+    center = geo.center
+    normal = geo.normal
+
+    lean = directions @ normal
+    valid = np.abs(lean) >= EPSILON
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ray_distance = ((center - origins) @ normal) / lean
+        point_center = origins + ray_distance[:, None] * directions - center
+
+    valid &= ray_distance >= 0
+
+    with np.errstate(invalid='ignore'):
+        valid &= (np.abs(point_center @ geo.u) <= geo.half_size[0]) & (np.abs(point_center @ geo.v) <= geo.half_size[1])
+
+    ray_distance = np.where(valid, ray_distance, np.inf)
+    normals = np.broadcast_to(normal, origins.shape).copy()
+
+    return ray_distance, normals
+
+def intersect_hole_plane_batch(origins, directions, face):
+    ray_distance, normals = intersect_plane_batch(origins, directions, face)
+
+    geo = face.geometry
+
+    with np.errstate(invalid='ignore'):
+        point_center = origins + ray_distance[:, None] * directions - geo.center
+
+        x = point_center @ geo.uv_u
+        y = point_center @ geo.uv_v
+
+    hole = (np.abs(x) < geo.half_hole[0]) & (np.abs(y) < geo.half_hole[1])
+
+    return np.where(hole, np.inf, ray_distance), normals
+
+def intersect_cube_batch(origins, directions, cube):
+    min_point = cube.geometry.bounds_min
+    max_point = cube.geometry.bounds_max
+
+    start_distance = np.full(len(origins), -np.inf)
+    exit_distance = np.full(len(origins), np.inf)
+
+    # 축별로 ~ (N, 3) reduce는 느림
+    with np.errstate(divide='ignore', invalid='ignore'):
+        for k in range(3):
+            ray_start = (min_point[k] - origins[:, k]) / directions[:, k]
+            ray_exit  = (max_point[k] - origins[:, k]) / directions[:, k]
+
+            start_distance = np.maximum(start_distance, np.minimum(ray_start, ray_exit))
+            exit_distance = np.minimum(exit_distance, np.maximum(ray_start, ray_exit))
+
+    valid = (start_distance <= exit_distance) & (exit_distance >= 0)
+
+    ray_distance = np.where(start_distance > 0, start_distance, exit_distance)
+    ray_distance = np.where(valid, ray_distance, np.inf)
+
+    # scalar 버전과 같은 순서로 (축마다 min -> max) normal 결정
+    with np.errstate(invalid='ignore'):
+        point = origins + ray_distance[:, None] * directions
+
+    normals = np.zeros_like(origins, dtype=np.float64)
+    assigned = np.zeros(len(origins), dtype=bool)
+
+    for i in range(3):
+        for bound, sign in ((min_point, -1), (max_point, 1)):
+            face = ~assigned & (np.abs(point[:, i] - bound[i]) < EPSILON)
+            normals[face, i] = sign
+            assigned |= face
+
+    return ray_distance, normals
+
+def intersect_hollow_cylinder_batch(origins, directions, cyl):
+    geo = cyl.geometry
+    cx, cz = geo.center_xz
+
+    origin_x, origin_z = origins[:, 0] - cx, origins[:, 2] - cz
+    dx, dy, dz = directions[:, 0], directions[:, 1], directions[:, 2]
+
+    a = dx * dx + dz * dz
+    b = (dx * origin_x + dz * origin_z) * 2
+    c_base = origin_x * origin_x + origin_z * origin_z
+
+    best_t = np.full(len(origins), np.inf)
+    best_normal = np.zeros((len(origins), 3), dtype=np.float64)
+
+    # 밖 / 안 (normal 반대)
+    for radius_sq, signature in ((geo.outer_sq, 1), (geo.inner_sq, -1)):
+        t0, t1, solvable = solve_quadratic_batch(a, b, c_base - radius_sq)
+
+        for t in (t0, t1):
+            with np.errstate(invalid='ignore'):
+                y = origins[:, 1] + t * dy
+                valid = solvable & (t > 0) & (y >= geo.y_min) & (y <= geo.y_max) & (t < best_t)
+
+            if not valid.any(): continue
+
+            nx = origin_x[valid] + t[valid] * dx[valid]
+            nz = origin_z[valid] + t[valid] * dz[valid]
+            length = np.sqrt(nx * nx + nz * nz) * signature
+
+            best_t[valid] = t[valid]
+            best_normal[valid, 0] = nx / length
+            best_normal[valid, 1] = 0
+            best_normal[valid, 2] = nz / length
+
+    # 위아래
+    for y_plane, normal_signature in [(geo.y_max, 1), (geo.y_min, -1)]:
+        with np.errstate(divide='ignore', invalid='ignore'):
+            t_cap = (y_plane - origins[:, 1]) / dy
+            dist_xz = np.hypot(origin_x + t_cap * dx, origin_z + t_cap * dz)
+
+            valid = (np.abs(dy) >= EPSILON) & (t_cap >= 0) & (t_cap < best_t)
+            valid &= (dist_xz >= geo.inner_radius) & (dist_xz <= geo.outer_radius)
+
+        best_t[valid] = t_cap[valid]
+        best_normal[valid] = (0, normal_signature, 0)
+
+    return best_t, best_normal
+
+def intersect_sphere_batch(origins, directions, sphere):
+    geo = sphere.geometry
+    center = geo.center
+    origin = origins - center
+
+    a = np.sum(directions * directions, axis=1)
+    b = 2 * np.sum(origin * directions, axis=1)
+    c = np.sum(origin * origin, axis=1) - geo.radius_sq
+
+    Quadratic = b ** 2 - 4 * a * c
+    sqrt_disc = np.sqrt(np.maximum(Quadratic, 0))
+
+    x1 = (-b - sqrt_disc) / (2 * a)
+    x2 = (-b + sqrt_disc) / (2 * a)
+
+    # 가까운 양수 근
+    t = np.where(x1 > 0, x1, np.where(x2 > 0, x2, np.inf))
+    t = np.where(Quadratic < 0, np.inf, t)
+
+    with np.errstate(invalid='ignore'):
+        normals = (origins + t[:, None] * directions - center) * geo.inv_radius
+
+    return t, normals
+
+# scene : objects 리스트 또는 flat BVH (bvh_hw5) 
+def scene_objects(scene):
+    return scene if isinstance(scene, list) else scene.objects
+
+# 최근접 교차 (배치) ~ object id는 objects 리스트의 index, miss = -1
+# AABB로 먼저 걸러서 통과한 ray만 모아서 (compaction) 교차 계산 
+def Nearest_HIT_finder_batch(origins, directions, scene):
+
+    if not isinstance(scene, list): return scene.nearest_hit_batch(origins, directions)
+
+    ray_distance = np.full(len(origins), np.inf)
+    normals = np.zeros((len(origins), 3), dtype=np.float64)
+    object_ids = np.full(len(origins), -1, dtype=np.int64)
+
+    for i, obj in enumerate(scene):
+        update_nearest_batch(origins, directions, obj, i, None, ray_distance, normals, object_ids)
+
+    return ray_distance, normals, object_ids
+
+# obj와 교차해서 더 가까운 곳만 ray_distance, normals, object_ids 갱신 (in-place)
+# rows : 검사할 ray index (None = 전부), BVH leaf에서도 같이 사용 
+def update_nearest_batch(origins, directions, obj, object_id, rows, ray_distance, normals, object_ids):
+
+    # plane은 교차 계산 자체가 AABB 검사만큼 싸서 바로 계산 
+    if obj.__class__.__name__ in ('Plane', 'Hole_Plane'):
+        count("tests." + obj.__class__.__name__, len(origins) if rows is None else len(rows))
+
+        if rows is None:
+            t, normal = obj.intersect_batch(origins, directions)
+            rows = np.arange(len(origins))
+        else:
+            t, normal = obj.intersect_batch(origins[rows], directions[rows])
+
+    else:
+        if rows is None: inside = compute_aabb(obj).intersect_batch(origins, directions, ray_distance)
+        else: inside = compute_aabb(obj).intersect_batch(origins[rows], directions[rows], ray_distance[rows])
+
+        count("tests.AABB", len(inside))
+
+        rows = np.nonzero(inside)[0] if rows is None else rows[inside]
+        if len(rows) == 0: return
+
+        count("tests." + obj.__class__.__name__, len(rows))
+        t, normal = obj.intersect_batch(origins[rows], directions[rows])
+
+    closer = t < ray_distance[rows]
+    rows = rows[closer]
+
+    ray_distance[rows] = t[closer]
+    normals[rows] = normal[closer]
+    object_ids[rows] = object_id
+
+# 가려짐 검사 (배치, any-hit) ~ max_distances 안쪽에 뭐라도 있으면 True
+# shadow ray는 최근접이 아니라 가려졌는지만 알면 됨 
+def Occlusion_finder_batch(origins, directions, max_distances, scene):
+    max_distances = np.broadcast_to(np.asarray(max_distances, dtype=np.float64), (len(origins),))
+
+    if isinstance(scene, BVHNode):
+        return np.array([Occlusion_finder_bvh(Ray(o, d), scene, t) for o, d, t in zip(origins, directions, max_distances)], dtype=bool)
+
+    if not isinstance(scene, list): return scene.occluded_batch(origins, directions, max_distances)
+
+    occluded = np.zeros(len(origins), dtype=bool)
+
+    for obj in scene:
+        # 아직 하나도 안 가려졌으면 gather 없이 전부 
+        rows = np.nonzero(~occluded)[0] if occluded.any() else None
+
+        update_occluded_batch(origins, directions, obj, rows, max_distances, occluded)
+        if occluded.all(): break
+
+    return occluded
+
+# obj가 rows의 ray들을 max_distances 안에서 가리는지 검사해서 occluded 갱신 (in-place)
+# rows : 검사할 ray index (None = 전부)
+def update_occluded_batch(origins, directions, obj, rows, max_distances, occluded):
+    if rows is not None and len(rows) == 0: return
+
+    if obj.__class__.__name__ not in ('Plane', 'Hole_Plane'):
+        count("tests.AABB", len(origins) if rows is None else len(rows))
+
+        if rows is None: rows = np.nonzero(compute_aabb(obj).intersect_batch(origins, directions, max_distances))[0]
+        else: rows = rows[compute_aabb(obj).intersect_batch(origins[rows], directions[rows], max_distances[rows])]
+
+        if len(rows) == 0: return
+
+    count("tests." + obj.__class__.__name__, len(origins) if rows is None else len(rows))
+
+    if rows is None:
+        t, _ = obj.intersect_batch(origins, directions)
+        occluded |= t < max_distances
+        return
+
+    t, _ = obj.intersect_batch(origins[rows], directions[rows])
+    occluded[rows[t < max_distances[rows]]] = True
 
 def build_bvh(objects):
     return BVHNode(objects)
@@ -221,6 +539,23 @@ class AABB:
 
         return t_near <= t_far and t_far >= 0 # 교차판별 
 
+    # 배치 버전 ~ max_distance보다 멀리서 시작하는 ray는 제외 
+    def intersect_batch(self, origins, directions, max_distance=np.inf):
+
+        t_near = np.full(len(origins), -np.inf)
+        t_far = np.full(len(origins), np.inf)
+
+        # (N, 3)에서 axis 방향 max/min은 느려서 축별로 
+        with np.errstate(divide='ignore', invalid='ignore'):
+            for k in range(3):
+                tmin = (self.min[k] - origins[:, k]) / directions[:, k]
+                tmax = (self.max[k] - origins[:, k]) / directions[:, k]
+
+                t_near = np.maximum(t_near, np.minimum(tmin, tmax))
+                t_far = np.minimum(t_far, np.maximum(tmin, tmax))
+
+        return (t_near <= t_far) & (t_far >= 0) & (t_near <= max_distance)
+
     @staticmethod
     def surrounding_box(box1, box2):
 
@@ -256,7 +591,8 @@ class BVHNode:
             centers = [(b.min + b.max) / 2 for b in boxes]
             axis_lengths = np.ptp(centers, axis=0)
             axis = np.argmax(axis_lengths)
-            objects.sort(key=lambda obj: compute_aabb(obj).min[axis])
+            order = sorted(range(len(objects)), key=lambda i: boxes[i].min[axis]) # 박스 재계산 없이 
+            objects[:] = [objects[i] for i in order]
             mid = len(objects) // 2
 
             self.left = BVHNode(objects[:mid])
@@ -267,62 +603,23 @@ class BVHNode:
 # ---------- AABB 생성기 ----------
 
 def compute_aabb(obj):
-    # class 기준으로, 서로 다른 aabbf를 세팅 
-    class_name = obj.__class__.__name__ 
-
-    if class_name == 'Cube':
-        center = np.array(obj.center)
-        size = np.array(obj.size)
-        half = size / 2
-        return AABB(center - half, center + half)
-    
-    elif class_name == 'HollowCylinder':
-        center = np.array(obj.center)
-        r = obj.outer_radius
-        h = obj.height / 2
-        return AABB(center - [r, h, r], center + [r, h, r])
-    
-    elif class_name in ('Plane', 'Hole_Plane'):
-        center = np.array(obj.center)
-        normal = np.array(obj.normal, dtype=np.float32)
-
-        # intersect_plane과 동일한 방식으로 u, v 축 계산
-        u_axis = np.cross(normal, (1, 0, 0))  
-
-        if np.linalg.norm(u_axis) < EPSILON: u_axis = np.cross(normal, (0, 0, 1))  
-
-        u_axis = u_axis / np.linalg.norm(u_axis)
-        v_axis = np.cross(normal, u_axis)
-        v_axis = v_axis / np.linalg.norm(v_axis)
-
-        half_u = (obj.size[0] / 2) * u_axis
-        half_v = (obj.size[1] / 2) * v_axis
-
-        corners = [center + dx * half_u + dy * half_v for dx in [-1, 1] for dy in [-1, 1]] # uv와 동일 처리 
-
-        min_corner = np.min(corners, axis=0)
-        max_corner = np.max(corners, axis=0)
-
-        min_corner -= 0.1
-        max_corner += 0.1 # 최소 두께 
-
-        return AABB(min_corner, max_corner)
-    
-    elif class_name == 'Sphere':
-        center = np.array(obj.center)
-        r = obj.radius
-        return AABB(center - r, center + r)
-    else:
-        raise NotImplementedError("Unknown object type")
+    # scene 생성 때 만든 geometry cache의 bounds 
+    return AABB(obj.geometry.bounds_min, obj.geometry.bounds_max)
 
 # 최근접 교차 찾기 
 
 def Nearest_HIT_finder_bvh(ray, node):
 
+    # flat BVH (bvh_hw5) 는 자체 iterative traversal 사용 
+    if not isinstance(node, BVHNode): return node.nearest_hit(ray)
+
     # 예외 처리 
+    count("bvh.nodes")
     if not node.aabb.intersect(ray): return None
 
-    if node.object is not None: return node.object.intersect(ray)
+    if node.object is not None:
+        count("tests." + node.object.__class__.__name__)
+        return node.object.intersect(ray)
 
     hit_left = Nearest_HIT_finder_bvh(ray, node.left) if node.left else None
     hit_right = Nearest_HIT_finder_bvh(ray, node.right) if node.right else None
@@ -331,3 +628,21 @@ def Nearest_HIT_finder_bvh(ray, node):
         return hit_left if hit_left.ray_distance < hit_right.ray_distance else hit_right
     
     return hit_left or hit_right
+
+# 가려짐 검사 (any-hit) ~ 첫 번째로 가리는 물체에서 바로 종료 
+
+def Occlusion_finder_bvh(ray, node, max_distance):
+
+    # flat BVH (bvh_hw5) 는 자체 traversal 사용 
+    if not isinstance(node, BVHNode): return node.occluded(ray, max_distance)
+
+    count("bvh.nodes")
+    if not node.aabb.intersect(ray): return False
+
+    if node.object is not None:
+        count("tests." + node.object.__class__.__name__)
+        hit = node.object.intersect(ray)
+        return hit is not None and hit.ray_distance < max_distance
+
+    if node.left and Occlusion_finder_bvh(ray, node.left, max_distance): return True
+    return bool(node.right) and Occlusion_finder_bvh(ray, node.right, max_distance)
@@ -0,0 +1,37 @@
+import os
+import numpy as np
+
+from PIL import Image
+
+# 파일 이름 결정 
+def get_next_filename(directory):
+    existing = [f for f in os.listdir(directory) if f.endswith(".png")]
+    nums = [int(f.split(".")[0]) for f in existing if f.split(".")[0].isdigit()]
+    next_num = max(nums) + 1 if nums else 1
+    return os.path.join(directory, f"{next_num}.png")
+
+def save_image(image_array, filename="output_image.png"):
+
+    # gamma correction - 자주 사용하는 2.2를 사용 
+    gamma_correction = np.clip(image_array, 0, 1) ** (1 / 2.2)
+
+    image = Image.fromarray((255* gamma_correction).astype(np.uint8)) # Error 처리 uint8 
+    image.save(filename)
+
+    # 확인용 
+    print(f"{filename} saved")
+
+# 픽셀별 샘플 수 heatmap ~ 검정 -> 파랑 -> 빨강 -> 노랑 (gamma 없이 그대로 저장)
+HEATMAP_COLORS = np.array([[0, 0, 0], [0, 0, 1], [1, 0, 0], [1, 1, 0]], dtype=np.float64)
+
+def save_heatmap(counts, filename="heatmap.png"):
+    t = counts / max(counts.max(), 1) * (len(HEATMAP_COLORS) - 1)
+
+    index = np.minimum(t.astype(np.int64), len(HEATMAP_COLORS) - 2)
+    frac = (t - index)[:, :, None]
+    colors = HEATMAP_COLORS[index] * (1 - frac) + HEATMAP_COLORS[index + 1] * frac
+
+    image = Image.fromarray((255 * colors).astype(np.uint8))
+    image.save(filename)
+
+    print(f"{filename} saved (samples per pixel: min {counts.min()}, max {counts.max()}, mean {counts.mean():.2f})")
@@ -0,0 +1,288 @@
+import os
+import numpy as np
+
+from find_intersection import Nearest_HIT_finder_batch
+from sampler_hw5 import cosine_hemisphere, orthonormal_basis
+from scene_file_hw5 import scene_signature
+from stats_hw5 import count, timed
+from photon_hw5 import current_photon_map
+from texture_hw5 import camera_pixel_angle
+
+# irradiance cache (Ward et al. 1988, gradient : Ward & Heckbert 1992) ~ 간접광 (depth 0 의 반구 샘플 평균) 을 record로 저장해두고
+# 가까운 shading point는 주변 record 들을 보간해서 씀 ~ 벽처럼 간접광이 천천히 변하는 곳은 반구 ray가 거의 필요 없음
+# record : 위치, normal, 간접광, 유효 반경 R (샘플 ray 거리의 조화평균), 회전 / 이동 gradient
+# 렌더링 전에 primary hit 들을 덮을 때까지 record를 만들어 두고 (prepare_irradiance_cache) 렌더링 중에는 읽기만 ~ worker 수와 상관없이 같은 결과
+# 못 찾은 점은 기존처럼 반구 샘플링
+
+# Ward의 허용 오차 a ~ 작을수록 record가 촘촘 (느리지만 정확)
+ACCURACY = 0.25
+
+# R 범위 (world 단위) ~ 구석에서 record가 너무 많아지거나, 넓은 면에서 너무 멀리 퍼지지 않게
+MIN_RADIUS = 0.5
+MAX_RADIUS = 10.0
+
+# record 하나의 반구 샘플 ~ theta M 칸 x phi N 칸 층화 (gradient 공식이 층화를 가정)
+RECORD_STRATA = (8, 16)
+
+# record를 놓을 후보 ~ 픽셀 중심 primary hit (STRIDE 픽셀 간격), 덮이지 않은 점 중 격자 칸마다 하나씩, 라운드마다 칸 크기 절반
+PREPARE_STRIDE = 2
+PREPARE_ROUNDS = 4
+
+# record가 shading point 앞쪽에 있으면 (오목한 곳) 제외 ~ R 대비
+FRONT_TOLERANCE = 0.01
+
+EPSILON = 0.01
+
+RECORD_ARRAYS = ('positions', 'normals', 'irradiance', 'radius', 'grad_r', 'grad_t')
+
+# 격자 칸 (ix, iy, iz) -> 정수 key ~ 충돌해도 후보가 늘 뿐 (가중치에서 걸러짐)
+def cell_keys(cells):
+    cells = cells.astype(np.int64)
+    return (cells[..., 0] * 73856093) ^ (cells[..., 1] * 19349663) ^ (cells[..., 2] * 83492791)
+
+class IrradianceCache:
+    def __init__(self, key=None, accuracy=ACCURACY, max_radius=MAX_RADIUS):
+        self.key = key
+        self.accuracy = accuracy
+
+        # record 하나가 유효한 범위 (a * R) 가 한 축으로 최대 3칸
+        self.cell_size = accuracy * max_radius
+
+        self.positions = np.empty((0, 3))
+        self.normals = np.empty((0, 3))
+        self.irradiance = np.empty((0, 3))
+        self.radius = np.empty(0)
+        self.grad_r = np.empty((0, 3, 3)) # (record, color, xyz)
+        self.grad_t = np.empty((0, 3, 3))
+
+        self._build_grid()
+
+    def __len__(self):
+        return len(self.radius)
+
+    def add(self, positions, normals, irradiance, radius, grad_r, grad_t):
+        for name, values in zip(RECORD_ARRAYS, (positions, normals, irradiance, radius, grad_r, grad_t)):
+            setattr(self, name, np.concatenate([getattr(self, name), values]))
+
+        self._build_grid()
+
+    # hash grid ~ record를 유효 범위가 걸치는 칸마다 넣고 key로 정렬 (CSR), 찾을 때는 searchsorted
+    def _build_grid(self):
+        extent = (self.accuracy * self.radius)[:, None]
+        lo = np.floor((self.positions - extent) / self.cell_size).astype(np.int64)
+        hi = np.floor((self.positions + extent) / self.cell_size).astype(np.int64)
+
+        keys, records = [], []
+        offsets = np.stack(np.meshgrid(*[np.arange(3)] * 3, indexing='ij'), axis=-1).reshape(-1, 3)
+
+        for offset in offsets:
+            cells = lo + offset
+            inside = np.all(cells <= hi, axis=1)
+
+            keys.append(cell_keys(cells[inside]))
+            records.append(np.nonzero(inside)[0])
+
+        keys = np.concatenate(keys) if keys else np.empty(0, dtype=np.int64)
+        records = np.concatenate(records) if records else np.empty(0, dtype=np.int64)
+
+        order = np.argsort(keys, kind='stable')
+        self.grid_keys = keys[order]
+        self.grid_records = records[order]
+
+    # 보간 ~ points, normals : (N, 3), 반환 (간접광 (N, 3), 찾았는지 (N,))
+    # E(p) = sum w_i (E_i + grad_r_i . (n_i x n) + grad_t_i . (p - p_i)) / sum w_i,  w_i = 1 / err_i - 1 / a (경계에서 0)
+    def lookup(self, points, normals):
+        values = np.zeros((len(points), 3))
+        if len(self) == 0 or len(points) == 0: return values, np.zeros(len(points), dtype=bool)
+
+        normals = normals / np.linalg.norm(normals, axis=1, keepdims=True)
+
+        # 점마다 같은 칸의 record 후보 -> (점, record) 쌍
+        keys = cell_keys(np.floor(points / self.cell_size))
+        start = np.searchsorted(self.grid_keys, keys, side='left')
+        counts = np.searchsorted(self.grid_keys, keys, side='right') - start
+
+        pair_points = np.repeat(np.arange(len(points)), counts)
+        pair_slots = np.repeat(start - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())
+        pair_records = self.grid_records[pair_slots]
+
+        offset = points[pair_points] - self.positions[pair_records]
+        n, n_i = normals[pair_points], self.normals[pair_records]
+        radius = self.radius[pair_records]
+
+        error = np.linalg.norm(offset, axis=1) / radius + np.sqrt(np.maximum(1 - np.sum(n * n_i, axis=1), 0))
+        in_front = np.sum(offset * (n + n_i), axis=1) / 2 < -FRONT_TOLERANCE * radius
+
+        valid = (error < self.accuracy) & ~in_front
+        pair_points, pair_records, offset, n, n_i = pair_points[valid], pair_records[valid], offset[valid], n[valid], n_i[valid]
+
+        weights = 1 / np.maximum(error[valid], 1e-6) - 1 / self.accuracy
+
+        estimate = self.irradiance[pair_records] + np.einsum('rcx,rx->rc', self.grad_r[pair_records], np.cross(n_i, n)) + np.einsum('rcx,rx->rc', self.grad_t[pair_records], offset)
+        estimate = np.maximum(estimate, 0)
+
+        weight_sum = np.bincount(pair_points, weights, minlength=len(points))
+        for c in range(3): values[:, c] = np.bincount(pair_points, weights * estimate[:, c], minlength=len(points))
+
+        found = weight_sum > 0
+        values[found] /= weight_sum[found, None]
+
+        return values, found
+
+    # ---------- 저장 ~ 같은 scene을 다시 렌더링할 때 (progressive 이어서, 다음 프레임) record 재사용 ----------
+
+    # 임시 파일에 쓰고 교체 ~ AccumulationBuffer와 같은 방식
+    def save(self, path):
+        if path is None: return
+
+        directory = os.path.dirname(path)
+        if directory: os.makedirs(directory, exist_ok=True)
+
+        temp_path = path + ".tmp.npz"
+        np.savez(temp_path, key=np.array(self.key or ""), **{name: getattr(self, name) for name in RECORD_ARRAYS})
+        os.replace(temp_path, path)
+
+    # key (scene 내용) 가 다르면 빈 cache
+    @classmethod
+    def load(cls, path, key=None):
+        cache = cls(key)
+        if path is None or not os.path.exists(path): return cache
+
+        with np.load(path) as data:
+            if str(data['key']) != (key or ""):
+                print(f"{path}: scene changed, irradiance cache discarded")
+                return cache
+
+            cache.add(*(data[name] for name in RECORD_ARRAYS))
+
+        print(f"{path}: {len(cache)} irradiance records")
+        return cache
+
+# record를 다시 쓸 수 있는 조건 ~ scene 내용 + record 설정 + caustic photon 수
+def cache_signature(scene, lights):
+    photons = 0 if current_photon_map() is None else len(current_photon_map())
+    return scene_signature(scene, lights, (RECORD_STRATA, MIN_RADIUS, MAX_RADIUS, ACCURACY, photons))
+
+# ---------- record 만들기 ----------
+
+# 점 K개의 record ~ 층화된 cosine-weighted 반구 샘플 M x N 개를 trace 해서 평균 + gradient
+# trace : trace_rays (depth 1 부터, 반사 / 굴절 포함), 반환은 IrradianceCache.add 인자
+def compute_records(points, normals, scene, lights, camera_pos, trace, rng, pixel_angle=None):
+    M, N = RECORD_STRATA
+    K = len(points)
+
+    normals = normals / np.linalg.norm(normals, axis=1, keepdims=True)
+
+    # 칸 (j, k) ~ sin^2(theta) 가 [j/M, (j+1)/M), phi가 [2 pi k/N, 2 pi (k+1)/N)
+    j, k = np.meshgrid(np.arange(M), np.arange(N), indexing='ij')
+    jitter = rng.random((K, M, N, 2))
+
+    sin2 = (j + jitter[..., 1]) / M
+    u = np.stack([(k + jitter[..., 0]) / N, 1 - sin2], axis=-1)
+
+    directions, _ = cosine_hemisphere(normals, M * N, u.reshape(-1, 2))
+    origins = np.repeat(points + EPSILON * normals, M * N, axis=0)
+
+    count("rays.indirect", len(origins))
+
+    # 샘플 ray 거리 (R, gradient) + 색
+    with timed("intersect"): distance, _, object_ids = Nearest_HIT_finder_batch(origins, directions, scene)
+    distance = np.where(object_ids >= 0, distance, np.inf).reshape(K, M, N)
+
+    L = trace(origins, directions, scene, lights, camera_pos, 1, pixel_angle=pixel_angle).reshape(K, M, N, 3)
+
+    irradiance = L.mean(axis=(1, 2))
+
+    # R ~ 조화평균 (전부 miss 면 최대)
+    radius = M * N / np.maximum(np.sum(1 / distance, axis=(1, 2)), 1e-12)
+    radius = np.clip(radius, MIN_RADIUS, MAX_RADIUS)
+
+    # 접평면 방향 ~ u_k : phi_k (칸 경계), v_k : phi_k + pi / 2
+    tangent, bitangent = orthonormal_basis(normals)
+
+    def plane(phi):
+        return np.cos(phi)[None, :, None] * tangent[:, None] + np.sin(phi)[None, :, None] * bitangent[:, None] # (K, N, 3)
+
+    phi_edge = 2 * np.pi * np.arange(N) / N
+    phi_center = 2 * np.pi * (np.arange(N) + 0.5) / N
+
+    # 회전 gradient ~ sum_k v_k sum_j (-tan theta_jk) L_jk / (M N)
+    tan_theta = np.sqrt(sin2 / np.maximum(1 - sin2, 1e-6))
+    grad_r = np.einsum('kmn,kmnc,knx->kcx', -tan_theta, L, plane(phi_center + np.pi / 2)) / (M * N)
+
+    # 이동 gradient ~ theta 방향 (j-1 -> j) 경계 + phi 방향 (k-1 -> k) 경계의 변화량 / 더 가까운 쪽 거리
+    edge_sin2 = np.arange(M) / M
+    theta_weight = (2 * np.pi / N) * np.sqrt(edge_sin2[1:]) * (1 - edge_sin2[1:]) # sin theta_j- cos^2 theta_j-
+    theta_term = theta_weight[None, :, None, None] * (L[:, 1:] - L[:, :-1]) / np.minimum(distance[:, 1:], distance[:, :-1])[..., None]
+
+    phi_weight = np.sqrt((np.arange(M) + 1) / M) - np.sqrt(np.arange(M) / M) # sin theta_j+ - sin theta_j-
+    L_prev, distance_prev = np.roll(L, 1, axis=2), np.roll(distance, 1, axis=2)
+    phi_term = phi_weight[None, :, None, None] * (L - L_prev) / np.minimum(distance, distance_prev)[..., None]
+
+    grad_t = np.einsum('kmnc,knx->kcx', theta_term, plane(phi_edge)) + np.einsum('kmnc,knx->kcx', phi_term, plane(phi_edge + np.pi / 2))
+    grad_t /= np.pi # 공식은 irradiance (pi x 평균) 기준
+
+    # gradient로 R 제한 ~ R 만큼 움직였을 때 변화가 값 자체보다 크지 않게
+    luminance = irradiance.mean(axis=1)
+    slope = np.linalg.norm(grad_t.mean(axis=1), axis=1)
+    radius = np.maximum(np.minimum(radius, luminance / np.maximum(slope, 1e-12)), MIN_RADIUS)
+
+    return points, normals, irradiance, radius, grad_r, grad_t
+
+# 픽셀 중심 primary hit ~ stride 간격, 맞은 것만 (points, normals)
+def primary_hits(camera, scene, stride=PREPARE_STRIDE):
+    ys, xs = np.mgrid[0:camera.height:stride, 0:camera.width:stride]
+    origins, directions = camera.generate_rays(xs.ravel(), ys.ravel())
+
+    with timed("intersect"): distance, normals, object_ids = Nearest_HIT_finder_batch(origins, directions, scene)
+
+    rows = np.nonzero(object_ids >= 0)[0]
+    return origins[rows] + distance[rows, None] * directions[rows], normals[rows]
+
+# 렌더링 전 ~ primary hit 중 cache로 덮이지 않은 점에 record 추가 (이미 있는 record는 재사용)
+# 라운드마다 덮이지 않은 점을 격자 칸으로 묶어 칸마다 하나씩 record (칸 크기는 라운드마다 절반)
+def prepare_irradiance_cache(cache, camera, scene, lights, trace, seed=0, rounds=PREPARE_ROUNDS):
+    with timed("irradiance"): points, normals = primary_hits(camera, scene)
+
+    rng = np.random.default_rng(seed)
+    np.random.seed(seed) # trace 안의 광원 패턴 선택
+
+    cell = cache.cell_size
+    before = len(cache)
+
+    for _ in range(rounds):
+        with timed("irradiance"): _, found = cache.lookup(points, normals)
+
+        points, normals = points[~found], normals[~found]
+        if len(points) == 0: break
+
+        _, first = np.unique(cell_keys(np.floor(points / cell)), return_index=True)
+        first = np.sort(first)
+
+        cache.add(*compute_records(points[first], normals[first], scene, lights, camera.eye, trace, rng, camera_pixel_angle(camera)))
+        cell /= 2
+
+    print(f"Irradiance cache: {len(cache)} records ({len(cache) - before} new)")
+    return cache
+
+# ---------- 렌더링 중 ~ 현재 cache (worker에는 initargs로) ----------
+
+IRRADIANCE_CACHE = None
+
+def set_irradiance_cache(cache):
+    global IRRADIANCE_CACHE
+    IRRADIANCE_CACHE = cache
+
+def current_irradiance_cache():
+    return IRRADIANCE_CACHE
+
+# depth 0 간접광 ~ cache가 없으면 전부 못 찾음
+def lookup_indirect(points, normals):
+    if IRRADIANCE_CACHE is None: return np.zeros((len(points), 3)), np.zeros(len(points), dtype=bool)
+
+    with timed("irradiance"): values, found = IRRADIANCE_CACHE.lookup(points, normals)
+
+    count("irradiance.lookups", len(points))
+    count("irradiance.hits", np.count_nonzero(found))
+
+    return values, found
@@ -0,0 +1,105 @@
+import numpy as np
+
+# 면광원 샘플링 ~ "grid" : 기존 num x num 격자 (linspace), "stratified" : 격자 칸마다 jitter 1개, "random" : 균일 랜덤
+LIGHT_MODE = "stratified"
+LIGHT_SAMPLES = 16
+
+# 미리 만들어 두는 패턴 수 ~ shading point 마다 하나를 골라 씀 (grid는 1개)
+LIGHT_PATTERNS = 64
+LIGHT_SEED = 1234
+
+# 입체각 가중치 ~ cos(광원 면) / d^2 에 비례, 합이 1이 되도록 정규화 (False면 1 / S, 기존 격자 평균과 같은 추정)
+# 정규화된 가중치는 비율 추정이라 샘플이 적으면 편향 (가까운 쪽 샘플이 더 밝게) ~ 기본은 끔
+SOLID_ANGLE_WEIGHTS = False
+
+# 광원 면의 두 축 ~ 바닥 / 천장 방향 광원이면 (x, z) 로, 기존 격자와 같은 배치
+def light_frame(normal):
+    normal = np.array(normal, dtype=np.float64)
+    normal /= np.linalg.norm(normal)
+
+    axis = np.array([1.0, 0.0, 0.0]) if abs(normal[0]) < 0.9 else np.array([0.0, 0.0, 1.0])
+    u = axis - np.dot(axis, normal) * normal
+    u /= np.linalg.norm(u)
+    v = np.cross(normal, u)
+
+    return normal, u, v
+
+# 정사각형에 가까운 nx * ny = count 분할
+def strata_shape(count):
+    nx = int(np.sqrt(count))
+    while count % nx: nx -= 1
+
+    return nx, count // nx
+
+# [-0.5, 0.5]^2 위의 샘플 패턴들 ~ (P, S, 2)
+def sample_patterns(count, mode, patterns, seed=LIGHT_SEED):
+    rng = np.random.default_rng(seed)
+
+    if mode == "grid":
+        num = max(int(round(np.sqrt(count))), 1)
+        x = np.linspace(-0.5, 0.5, num)
+        z = np.linspace(-0.5, 0.5, num)[::-1] # 위에서 아래
+
+        zz, xx = np.meshgrid(z, x, indexing='ij')
+        return np.stack([xx.ravel(), zz.ravel()], axis=1)[None]
+
+    if mode == "stratified":
+        nx, ny = strata_shape(count)
+
+        iy, ix = np.meshgrid(np.arange(ny), np.arange(nx), indexing='ij')
+        cells = np.stack([ix.ravel(), iy.ravel()], axis=1)
+        jitter = rng.random((patterns, count, 2))
+
+        return (cells[None] + jitter) / np.array([nx, ny]) - 0.5
+
+    if mode == "random": return rng.random((patterns, count, 2)) - 0.5
+
+    raise ValueError(f"unknown light sampling mode: {mode}")
+
+# 광원 하나의 샘플 점들을 한 번만 만들어 두고 재사용
+class LightSampler:
+    def __init__(self, light, samples=LIGHT_SAMPLES, mode=LIGHT_MODE, patterns=LIGHT_PATTERNS, solid_angle=SOLID_ANGLE_WEIGHTS):
+        self.mode = mode
+        self.solid_angle = solid_angle
+
+        self.normal, u, v = light_frame(light.normal)
+        width, height = light.size
+
+        offsets = sample_patterns(samples, mode, patterns)
+        self.points = np.array(light.center, dtype=np.float64) + offsets[:, :, :1] * width * u + offsets[:, :, 1:] * height * v # (P, S, 3)
+
+        self.count = self.points.shape[1]
+
+    # shading point 하나 ~ (S, 3)
+    def sample(self):
+        if len(self.points) == 1: return self.points[0]
+        return self.points[np.random.randint(len(self.points))]
+
+    # shading point n개 ~ 점마다 다른 패턴, (n, S, 3)
+    # u : 패턴 고르기용 [0, 1) 값 (n,) ~ sampler에서, None 이면 np.random
+    def sample_batch(self, n, u=None):
+        if len(self.points) == 1: return np.broadcast_to(self.points[0], (n, self.count, 3))
+        if u is None: return self.points[np.random.randint(len(self.points), size=n)]
+
+        return self.points[np.minimum((u * len(self.points)).astype(np.int64), len(self.points) - 1)]
+
+    # 샘플별 가중치 ~ light_dirs : shading point -> 광원 (정규화), 마지막 축이 xyz
+    def weights(self, light_dirs, light_distances):
+        if not self.solid_angle: return np.full(light_distances.shape, 1 / self.count)
+
+        cos_light = np.maximum(-(light_dirs @ self.normal), 0.0)
+        solid_angle = cos_light / light_distances ** 2
+
+        total = solid_angle.sum(axis=-1, keepdims=True)
+
+        # 광원 뒤쪽이라 전부 0 이면 균등
+        return np.where(total > 0, solid_angle / np.where(total > 0, total, 1), 1 / self.count)
+
+# 광원마다 sampler 붙여두기 ~ lights와 같이 worker로 넘어감
+def configure_light_sampling(lights, samples=LIGHT_SAMPLES, mode=LIGHT_MODE, solid_angle=SOLID_ANGLE_WEIGHTS):
+    for light in lights:
+        light.sampler = LightSampler(light, samples, mode, solid_angle=solid_angle)
+
+def light_sampler(light):
+    if getattr(light, 'sampler', None) is None: light.sampler = LightSampler(light)
+    return light.sampler
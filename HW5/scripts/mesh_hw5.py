@@ -0,0 +1,402 @@
+import os
+import time
+import numpy as np
+
+from find_intersection import Hit, compile_geometry, EPSILON
+from stats_hw5 import count
+from bvh_hw5 import FlatBVH, cached_sah_arrays, content_hash, cache_path, load_cached_arrays, save_cached_arrays, SAH_BINS, CACHE_FORMAT
+
+# 삼각형 BVH leaf 크기 ~ leaf 안은 (ray x 삼각형) 배열로 한 번에 계산하니 object BVH보다 크게
+MESH_LEAF_SIZE = 16
+
+# Möller–Trumbore ~ det이 이보다 작으면 ray가 삼각형과 평행
+DET_EPSILON = 1e-12
+
+# uv 조회용 (점이 어느 삼각형 위에 있는지) 허용 오차
+LOCATE_EPSILON = 1e-4
+
+# ---------- OBJ 로더 ----------
+# v / vt / vn / f 만 읽음 (나머지 o / g / usemtl 등은 무시), 다각형 face는 부채꼴로 삼각형 분할
+# 키워드와 값 사이는 공백이든 tab이든 상관없음, 숫자가 모자라거나 숫자가 아닌 v / vt / vn / f 줄은 ValueError
+# 반환 : vertices (V, 3), uvs (T, 2), normals (N, 3), face 인덱스 (F, 3) 세 종류 (없으면 -1)
+
+# 줄마다 앞의 width개 숫자 ~ 보통은 한 번에 변환, 줄마다 개수가 다르면 (w, vertex color 등) 줄 단위로
+# minimum 개보다 적으면 ValueError, 모자란 뒤쪽은 0 (vt의 v 생략 등)
+def _read_floats(rests, width, minimum, path, key):
+    if not rests: return np.zeros((0, width), dtype=np.float64)
+
+    try:
+        values = np.array(" ".join(rests).split(), dtype=np.float64)
+        if len(values) == width * len(rests): return values.reshape(-1, width)
+
+        rows = [rest.split()[:width] for rest in rests]
+        short = next((i for i, row in enumerate(rows) if len(row) < minimum), None)
+        if short is not None: raise ValueError(f"{path}: '{key}' line needs {minimum} numbers: {key} {rests[short]}")
+
+        return np.array([row + ['0'] * (width - len(row)) for row in rows], dtype=np.float64)
+
+    except ValueError as error:
+        if str(error).startswith(path): raise
+        raise ValueError(f"{path}: malformed '{key}' line ({error})") from None
+
+# "a//c" 처럼 비어 있는 자리 ~ 실제 인덱스와 겹치지 않는 값
+ABSENT_INDEX = 2 ** 62
+
+# OBJ 인덱스 (1부터, 음수는 그 face 줄 앞까지 읽은 것 중 뒤에서부터) -> 0부터, 비어 있으면 -1
+# seen : face마다 그 줄 앞까지 읽은 개수, total : 전체 개수 ~ 0 이나 범위 밖은 ValueError
+def _fix_index(index, seen, total, path, what):
+    if np.any(index == 0): raise ValueError(f"{path}: {what} index 0 in face (OBJ indices start at 1)")
+
+    absent = index == ABSENT_INDEX
+    fixed = np.where(index < 0, index + seen, index - 1)
+
+    if np.any(~absent & ((fixed < 0) | (fixed >= total))): raise ValueError(f"{path}: {what} index out of range in face")
+    return np.where(absent, -1, fixed)
+
+def load_obj(path):
+    with open(path) as file:
+        lines = file.read().splitlines()
+
+    # 첫 단어 기준으로 한 번에 분류 ~ face 줄마다 그 앞까지 읽은 v / vt / vn 개수 (음수 인덱스 기준)
+    records = {'v': [], 'vt': [], 'vn': [], 'f': []}
+    order = []
+
+    for line in lines:
+        parts = line.split(None, 1)
+        if not parts or parts[0] not in records: continue
+
+        key, rest = parts[0], parts[1] if len(parts) > 1 else ""
+
+        records[key].append(rest)
+        order.append(key)
+
+    order = np.array(order)
+    is_face = order == 'f'
+    seen = np.stack([np.cumsum(order == key)[is_face] for key in ('v', 'vt', 'vn')], axis=1)
+
+    vertices = _read_floats(records['v'], 3, 3, path, 'v')
+    uvs = _read_floats(records['vt'], 2, 1, path, 'vt')
+    normals = _read_floats(records['vn'], 3, 3, path, 'vn')
+
+    faces = records['f']
+    if not faces: raise ValueError(f"{path}: no faces")
+
+    # 모든 corner를 한 문자열로 모아서 한 번에 숫자로 ~ "a//c" 는 vt 자리를 ABSENT_INDEX 로
+    tokens = " ".join(faces).split()
+    counts = np.array([len(face.split()) for face in faces], dtype=np.int64)
+    if np.any(counts < 3): raise ValueError(f"{path}: face with fewer than 3 vertices")
+
+    components = tokens[0].count('/') + 1
+
+    text = " ".join(tokens).replace("//", f"/{ABSENT_INDEX}/").replace("/", " ")
+    try: corners = np.array(text.split(), dtype=np.int64)
+    except ValueError as error: raise ValueError(f"{path}: malformed 'f' line ({error})") from None
+
+    if len(corners) != components * len(tokens): raise ValueError(f"{path}: faces mix different index formats")
+    corners = corners.reshape(-1, components)
+
+    # 부채꼴 분할 ~ face마다 (0, i, i + 1)
+    triangle_count = counts - 2
+
+    face_start = np.cumsum(counts) - counts
+    face_of_triangle = np.repeat(np.arange(len(counts)), triangle_count)
+    local = np.arange(triangle_count.sum()) - np.repeat(np.cumsum(triangle_count) - triangle_count, triangle_count)
+
+    first = face_start[face_of_triangle]
+    triangles = np.stack([first, first + local + 1, first + local + 2], axis=1) # corners의 index
+
+    seen = seen[face_of_triangle][:, None, :] # (triangle, 1, v / vt / vn)
+
+    face_vertices = _fix_index(corners[triangles, 0], seen[..., 0], len(vertices), path, "vertex")
+    face_uvs = _fix_index(corners[triangles, 1], seen[..., 1], len(uvs), path, "uv") if components > 1 else np.full_like(face_vertices, -1)
+    face_normals = _fix_index(corners[triangles, 2], seen[..., 2], len(normals), path, "normal") if components > 2 else np.full_like(face_vertices, -1)
+
+    return vertices, uvs, normals, face_vertices, face_uvs, face_normals
+
+# OBJ 파일 -> Mesh ~ center, size가 있으면 bounding box 중심 / 가장 긴 변 기준으로 맞춤
+def load_mesh(path, material, center=None, size=None, smooth=True):
+    vertices, uvs, normals, face_vertices, face_uvs, face_normals = load_obj(path)
+
+    if size is not None:
+        vertices = vertices * (size / np.max(vertices.max(axis=0) - vertices.min(axis=0)))
+    if center is not None:
+        vertices = vertices - (vertices.max(axis=0) + vertices.min(axis=0)) / 2 + np.array(center, dtype=np.float64)
+
+    corner_normals = normals[face_normals] if len(normals) and np.all(face_normals >= 0) else None
+    corner_uvs = uvs[face_uvs] if len(uvs) and np.all(face_uvs >= 0) else None
+
+    return Mesh(vertices, face_vertices, material, corner_normals=corner_normals, corner_uvs=corner_uvs, smooth=smooth)
+
+# 면적 가중 vertex normal ~ 파일에 normal이 없을 때
+def vertex_normals(vertices, faces):
+    face_normal = np.cross(vertices[faces[:, 1]] - vertices[faces[:, 0]], vertices[faces[:, 2]] - vertices[faces[:, 0]])
+
+    normals = np.zeros_like(vertices)
+    for corner in range(3): np.add.at(normals, faces[:, corner], face_normal)
+
+    length = np.linalg.norm(normals, axis=1, keepdims=True)
+    return np.divide(normals, length, out=np.zeros_like(normals), where=length > 0)
+
+# ---------- 삼각형 mesh ----------
+
+# 삼각형별 배열 ~ 입력 (vertex, face, normal, uv) 의 hash로 BVH cache와 같은 곳에 저장, 다음부터 / worker에서는 memory-map
+TRIANGLE_ARRAYS = ('v0', 'edge1', 'edge2', 'corner_normals')
+
+class Mesh:
+    def __init__(self, vertices, faces, material, corner_normals=None, corner_uvs=None, smooth=True):
+        self.vertices = np.asarray(vertices, dtype=np.float64)
+        self.faces = np.asarray(faces, dtype=np.int64)
+        self.material = material
+
+        inputs = [self.vertices, self.faces] + [np.asarray(a, dtype=np.float64) for a in (corner_normals, corner_uvs) if a is not None]
+        self.array_names = TRIANGLE_ARRAYS + (() if corner_uvs is None else ('corner_uvs',))
+        self.cache_path = cache_path("mesh", content_hash(inputs, (CACHE_FORMAT, corner_normals is None, corner_uvs is None, smooth)))
+
+        if self.cache_path is not None and os.path.isdir(self.cache_path): self.__dict__.update(load_cached_arrays(self.cache_path, self.array_names))
+        else:
+            self.build_triangles(corner_normals, corner_uvs, smooth)
+
+            if self.cache_path is not None and not save_cached_arrays(self.cache_path, self.array_names, [getattr(self, name) for name in self.array_names]):
+                self.cache_path = None
+
+        if corner_uvs is None: self.corner_uvs = None
+
+        self.center = (self.vertices.min(axis=0) + self.vertices.max(axis=0)) / 2
+        self.geometry = compile_geometry(self)
+
+        self.bvh = build_mesh_bvh(self)
+
+    def build_triangles(self, corner_normals, corner_uvs, smooth):
+        # Möller–Trumbore용 v0, 두 변
+        self.v0 = self.vertices[self.faces[:, 0]]
+        self.edge1 = self.vertices[self.faces[:, 1]] - self.v0
+        self.edge2 = self.vertices[self.faces[:, 2]] - self.v0
+
+        # 꼭짓점별 normal (F, 3, 3) ~ smooth가 아니면 면 normal
+        if corner_normals is None:
+            if smooth: corner_normals = vertex_normals(self.vertices, self.faces)[self.faces]
+            else:
+                face_normal = np.cross(self.edge1, self.edge2)
+                face_normal /= np.linalg.norm(face_normal, axis=1, keepdims=True)
+                corner_normals = np.repeat(face_normal[:, None, :], 3, axis=1)
+
+        self.corner_normals = np.asarray(corner_normals, dtype=np.float64)
+        self.corner_uvs = None if corner_uvs is None else np.asarray(corner_uvs, dtype=np.float64) # (F, 3, 2)
+
+    # pickle (worker로 넘기기) ~ cache에 있으면 삼각형 배열 대신 경로만
+    def __getstate__(self):
+        state = dict(self.__dict__)
+
+        if self.cache_path is not None:
+            for name in self.array_names: del state[name]
+
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        if self.cache_path is not None: self.__dict__.update(load_cached_arrays(self.cache_path, self.array_names))
+
+    def __len__(self):
+        return len(self.faces)
+
+    # 무게중심 좌표 (u, v) -> 보간한 normal
+    def interpolate_normals(self, triangle_ids, u, v):
+        n = self.corner_normals[triangle_ids]
+        normals = (1 - u - v)[:, None] * n[:, 0] + u[:, None] * n[:, 1] + v[:, None] * n[:, 2]
+
+        length = np.linalg.norm(normals, axis=1, keepdims=True)
+        return np.divide(normals, length, out=np.zeros_like(normals), where=length > 0)
+
+    def intersect_batch(self, origins, directions):
+        ray_distance, normals, triangle_ids = self.bvh.nearest_hit_batch(origins, directions)
+        return ray_distance, normals
+
+    def intersect(self, ray):
+        origin = ray.origin.astype(np.float64)[None]
+        direction = ray.direction.astype(np.float64)[None]
+
+        ray_distance, normals = self.intersect_batch(origin, direction)
+        if not np.isfinite(ray_distance[0]): return None
+
+        point = ray.origin + ray_distance[0] * ray.direction
+        return Hit(ray_distance=ray_distance[0], point=point, normal=normals[0], material=self.material, object=self)
+
+    # uv ~ 점이 놓인 삼각형을 찾아서 무게중심 보간 (uv 없으면 0)
+    def get_uv_batch(self, points):
+        if self.corner_uvs is None: return np.zeros(len(points)), np.zeros(len(points))
+
+        triangle_ids, u, v = self.bvh.locate_batch(points)
+        found = triangle_ids >= 0
+
+        uv = np.zeros((len(points), 2))
+        t = self.corner_uvs[triangle_ids[found]]
+        uv[found] = (1 - u[found] - v[found])[:, None] * t[:, 0] + u[found, None] * t[:, 1] + v[found, None] * t[:, 2]
+
+        return np.clip(uv[:, 0], 0, 1), np.clip(uv[:, 1], 0, 1)
+
+    def get_uv(self, point):
+        u, v = self.get_uv_batch(np.asarray(point, dtype=np.float64)[None])
+        return u[0], v[0]
+
+# Möller–Trumbore ~ (R, 3) ray x (T,) 삼각형 -> ray_distance, u, v (R, T), miss = inf
+def intersect_triangles(origins, directions, v0, edge1, edge2):
+    dx, dy, dz = directions[:, 0, None], directions[:, 1, None], directions[:, 2, None]
+
+    # p = d x e2
+    px = dy * edge2[:, 2] - dz * edge2[:, 1]
+    py = dz * edge2[:, 0] - dx * edge2[:, 2]
+    pz = dx * edge2[:, 1] - dy * edge2[:, 0]
+
+    det = edge1[:, 0] * px + edge1[:, 1] * py + edge1[:, 2] * pz
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        inv_det = 1 / det
+
+        # s = o - v0, q = s x e1
+        sx = origins[:, 0, None] - v0[:, 0]
+        sy = origins[:, 1, None] - v0[:, 1]
+        sz = origins[:, 2, None] - v0[:, 2]
+
+        u = (sx * px + sy * py + sz * pz) * inv_det
+
+        qx = sy * edge1[:, 2] - sz * edge1[:, 1]
+        qy = sz * edge1[:, 0] - sx * edge1[:, 2]
+        qz = sx * edge1[:, 1] - sy * edge1[:, 0]
+
+        v = (dx * qx + dy * qy + dz * qz) * inv_det
+        t = (edge2[:, 0] * qx + edge2[:, 1] * qy + edge2[:, 2] * qz) * inv_det
+
+        valid = (np.abs(det) > DET_EPSILON) & (u >= 0) & (v >= 0) & (u + v <= 1) & (t > EPSILON)
+
+    return np.where(valid, t, np.inf), u, v
+
+# 삼각형 하나하나가 primitive인 BVH ~ 배치 traversal은 FlatBVH 그대로, leaf만 삼각형 배열로
+# traversal 중에는 normals[:, :2] 에 무게중심 (u, v) 를 넣어두고 끝나면 보간 normal로 바꿈
+class MeshBVH(FlatBVH):
+    def __init__(self, mesh, *arrays):
+        super().__init__(None, *arrays)
+        self.mesh = mesh
+
+    def nearest_hit_batch(self, origins, directions):
+        ray_distance, barycentric, triangle_ids = super().nearest_hit_batch(origins, directions)
+
+        normals = np.zeros_like(barycentric)
+        hit = triangle_ids >= 0
+        normals[hit] = self.mesh.interpolate_normals(triangle_ids[hit], barycentric[hit, 0], barycentric[hit, 1])
+
+        return ray_distance, normals, triangle_ids
+
+    def _leaf_nearest(self, node, origins, directions, rows, ray_distance, normals, object_ids):
+        triangles = self._leaf_primitives(node)
+        mesh = self.mesh
+
+        if rows is None: rows = np.arange(len(origins))
+
+        count("tests.Triangle", len(rows) * len(triangles))
+        t, u, v = intersect_triangles(origins[rows], directions[rows], mesh.v0[triangles], mesh.edge1[triangles], mesh.edge2[triangles])
+
+        nearest = np.argmin(t, axis=1)
+        sub = np.arange(len(rows))
+        t = t[sub, nearest]
+
+        closer = t < ray_distance[rows]
+        hit_rows = rows[closer]
+
+        ray_distance[hit_rows] = t[closer]
+        normals[hit_rows, 0] = u[sub[closer], nearest[closer]]
+        normals[hit_rows, 1] = v[sub[closer], nearest[closer]]
+        object_ids[hit_rows] = triangles[nearest[closer]]
+
+    def _leaf_occluded(self, node, origins, directions, rows, max_distances, occluded):
+        triangles = self._leaf_primitives(node)
+        mesh = self.mesh
+
+        count("tests.Triangle", len(rows) * len(triangles))
+        t, _, _ = intersect_triangles(origins[rows], directions[rows], mesh.v0[triangles], mesh.edge1[triangles], mesh.edge2[triangles])
+        occluded[rows[np.any(t < max_distances[rows, None], axis=1)]] = True
+
+    # scalar ~ ray 하나짜리 배치로
+    def nearest_hit(self, ray):
+        return self.mesh.intersect(ray)
+
+    def occluded(self, ray, max_distance):
+        origin = ray.origin.astype(np.float64)[None]
+        direction = ray.direction.astype(np.float64)[None]
+
+        return bool(self.occluded_batch(origin, direction, np.array([max_distance]))[0])
+
+    # 점 -> 그 점이 놓인 삼각형 id, 무게중심 (u, v) ~ 못 찾으면 -1
+    def locate_batch(self, points):
+        n = len(points)
+        mesh = self.mesh
+
+        triangle_ids = np.full(n, -1, dtype=np.int64)
+        best_distance = np.full(n, np.inf)
+        u_out = np.zeros(n)
+        v_out = np.zeros(n)
+
+        stack = [(0, np.arange(n))]
+
+        while stack:
+            node, rows = stack.pop()
+
+            p = points[rows]
+            inside = np.all((p >= self.bounds_min[node] - LOCATE_EPSILON) & (p <= self.bounds_max[node] + LOCATE_EPSILON), axis=1)
+
+            rows = rows[inside]
+            if len(rows) == 0: continue
+
+            left = self.left[node]
+
+            if left >= 0:
+                stack.append((self.right[node], rows))
+                stack.append((left, rows))
+                continue
+
+            # leaf ~ 평면까지 거리가 가장 작고 삼각형 안에 있는 것
+            triangles = self._leaf_primitives(node)
+            e1, e2 = mesh.edge1[triangles], mesh.edge2[triangles]
+
+            rel = points[rows][:, None, :] - mesh.v0[triangles] # (R, T, 3)
+
+            d11 = np.sum(e1 * e1, axis=1)
+            d12 = np.sum(e1 * e2, axis=1)
+            d22 = np.sum(e2 * e2, axis=1)
+            denom = d11 * d22 - d12 * d12
+
+            r1 = np.sum(rel * e1, axis=2)
+            r2 = np.sum(rel * e2, axis=2)
+
+            with np.errstate(divide='ignore', invalid='ignore'):
+                u = (d22 * r1 - d12 * r2) / denom
+                v = (d11 * r2 - d12 * r1) / denom
+
+            distance = np.linalg.norm(rel - u[:, :, None] * e1 - v[:, :, None] * e2, axis=2)
+            valid = (u >= -LOCATE_EPSILON) & (v >= -LOCATE_EPSILON) & (u + v <= 1 + LOCATE_EPSILON) & (denom > 0)
+            distance = np.where(valid, distance, np.inf)
+
+            nearest = np.argmin(distance, axis=1)
+            sub = np.arange(len(rows))
+
+            closer = distance[sub, nearest] < best_distance[rows]
+            hit_rows = rows[closer]
+
+            best_distance[hit_rows] = distance[sub[closer], nearest[closer]]
+            triangle_ids[hit_rows] = triangles[nearest[closer]]
+            u_out[hit_rows] = u[sub[closer], nearest[closer]]
+            v_out[hit_rows] = v[sub[closer], nearest[closer]]
+
+        return triangle_ids, u_out, v_out
+
+def build_mesh_bvh(mesh, leaf_size=MESH_LEAF_SIZE, bins=SAH_BINS):
+    start_time = time.perf_counter()
+
+    corners = np.stack([mesh.v0, mesh.v0 + mesh.edge1, mesh.v0 + mesh.edge2])
+
+    arrays, path, from_cache = cached_sah_arrays(corners.min(axis=0), corners.max(axis=0), leaf_size, bins)
+
+    bvh = MeshBVH(mesh, *arrays)
+    bvh.build_time = time.perf_counter() - start_time
+    bvh.cache_path, bvh.from_cache = path, from_cache
+
+    return bvh
@@ -0,0 +1,104 @@
+import os
+import multiprocessing as mp
+import numpy as np
+
+from tqdm import tqdm
+
+from ray_tracing_fresnel import render_tile, render_pixels, trace_rays
+from path_tracing_hw5 import trace_paths
+from stats_hw5 import enable_stats, stats_enabled, current_stats
+from irradiance_hw5 import set_irradiance_cache, current_irradiance_cache
+from photon_hw5 import set_photon_map, current_photon_map
+
+TILE_SIZE = 32
+SEED = 0
+
+# "whitted" : 기존 재귀 (반사 + 굴절 분기, depth 0 간접광), "path" : path tracing (샘플당 path 하나)
+INTEGRATOR = "whitted"
+INTEGRATORS = {"whitted": trace_rays, "path": trace_paths}
+
+# 이미지를 타일로 나누기 ~ (x0, y0, x1, y1), row-major 순서
+def make_tiles(width, height, tile_size=TILE_SIZE):
+    return [(x0, y0, min(x0 + tile_size, width), min(y0 + tile_size, height)) for y0 in range(0, height, tile_size) for x0 in range(0, width, tile_size)]
+
+# 타일 index 기준으로 seed ~ 어느 worker가 몇 번째로 렌더링하든 같은 결과
+# sampler (QMC) 가 있으면 seed 대신 sampler의 seed + sample_index로 결정됨
+def render_seeded_tile(camera, scene, lights, tile, tile_index, seed=SEED, jitter=False, integrator=INTEGRATOR, sampler=None, sample_index=0):
+    np.random.seed(seed + tile_index)
+
+    x0, y0, x1, y1 = tile
+    return render_tile(camera, scene, lights, x0, y0, x1, y1, jitter, INTEGRATORS[integrator], sampler, sample_index)
+
+# 픽셀 목록 (xs, ys) 하나 ~ 항상 jitter, seed는 호출하는 쪽이 chunk마다 정함 (adaptive)
+def render_seeded_pixels(camera, scene, lights, xs, ys, seed=SEED, integrator=INTEGRATOR, sampler=None, sample_index=0):
+    np.random.seed(seed)
+    return render_pixels(camera, scene, lights, xs, ys, True, INTEGRATORS[integrator], sampler, sample_index)
+
+# worker마다 scene / BVH는 처음 한 번만 받아둠 (타일마다 보내지 않도록)
+_worker_scene = {}
+
+def _init_worker(camera, scene, lights, seed, jitter, integrator, sampler=None, sample_index=0, collect_stats=False, irradiance_cache=None, photon_map=None):
+    _worker_scene['camera'] = camera
+    _worker_scene['scene'] = scene
+    _worker_scene['lights'] = lights
+    _worker_scene['seed'] = seed
+    _worker_scene['jitter'] = jitter
+    _worker_scene['integrator'] = integrator
+    _worker_scene['sampler'] = sampler
+    _worker_scene['sample_index'] = sample_index
+
+    # 통계는 worker마다 모아서 타일 결과와 같이 돌려보냄
+    if collect_stats: enable_stats()
+
+    # irradiance cache, photon map은 렌더링 중 읽기만
+    set_irradiance_cache(irradiance_cache)
+    set_photon_map(photon_map)
+
+def _render_job(job):
+    tile_index, tile = job
+
+    color = render_seeded_tile(_worker_scene['camera'], _worker_scene['scene'], _worker_scene['lights'], tile, tile_index, _worker_scene['seed'], _worker_scene['jitter'], _worker_scene['integrator'], _worker_scene['sampler'], _worker_scene['sample_index'])
+    return tile, color, current_stats().take() if stats_enabled() else None
+
+def _render_pixels_job(job):
+    seed, xs, ys, sample_index = job
+
+    color = render_seeded_pixels(_worker_scene['camera'], _worker_scene['scene'], _worker_scene['lights'], xs, ys, seed, _worker_scene['integrator'], _worker_scene['sampler'], sample_index)
+    return color, current_stats().take() if stats_enabled() else None
+
+# scene / 설정을 받아둔 worker pool ~ 렌더링 중 읽는 cache (irradiance, photon map) 도 같이
+def worker_pool(camera, scene, lights, workers, seed=SEED, jitter=False, integrator=INTEGRATOR, sampler=None, sample_index=0):
+    return mp.Pool(processes=workers, initializer=_init_worker, initargs=(camera, scene, lights, seed, jitter, integrator, sampler, sample_index, stats_enabled(), current_irradiance_cache(), current_photon_map()))
+
+# 픽셀 chunk들 ~ jobs : (seed, xs, ys, sample_index), pool이 None 이면 현재 프로세스에서, 결과는 jobs 순서대로
+def render_pixel_jobs(camera, scene, lights, jobs, pool=None, integrator=INTEGRATOR, sampler=None):
+    if pool is None:
+        for seed, xs, ys, sample_index in jobs: yield render_seeded_pixels(camera, scene, lights, xs, ys, seed, integrator, sampler, sample_index)
+        return
+
+    for color, stats in pool.imap(_render_pixels_job, jobs):
+        if stats is not None: current_stats().merge(stats)
+        yield color
+
+# 타일 병렬 렌더링 ~ workers = None 이면 코어 수만큼, 1 이면 현재 프로세스에서
+# sampler : make_sampler(...) 결과 (None 이면 np.random), sample_index : 이번 렌더링이 픽셀마다 몇 번째 샘플인지
+def render_parallel(camera, scene, lights, width=640, height=480, tile_size=TILE_SIZE, workers=None, seed=SEED, jitter=False, integrator=INTEGRATOR, desc="Rendering", sampler=None, sample_index=0):
+    image = np.zeros((height, width, 3), dtype=np.float32)
+
+    jobs = list(enumerate(make_tiles(width, height, tile_size)))
+    workers = workers or os.cpu_count() or 1
+
+    if workers == 1:
+        for tile_index, tile in tqdm(jobs, desc=f"{desc} (wavefront)"):
+            x0, y0, x1, y1 = tile
+            image[y0:y1, x0:x1] = render_seeded_tile(camera, scene, lights, tile, tile_index, seed, jitter, integrator, sampler, sample_index)
+        return image
+
+    with worker_pool(camera, scene, lights, workers, seed, jitter, integrator, sampler, sample_index) as pool:
+        results = pool.imap_unordered(_render_job, jobs)
+
+        for (x0, y0, x1, y1), color, stats in tqdm(results, total=len(jobs), desc=f"{desc} ({workers} workers)"):
+            image[y0:y1, x0:x1] = color
+            if stats is not None: current_stats().merge(stats)
+
+    return image
@@ -0,0 +1,128 @@
+import numpy as np
+
+from find_intersection import Nearest_HIT_finder_batch, scene_objects
+from shader_hw5 import shade_batch, surface_color_batch, material_table
+from texture_hw5 import pixel_footprint
+from stats_hw5 import count, timed
+from ray_tracing_fresnel import EPSILON, INDIRECT_WEIGHT
+from sampler_hw5 import cosine_hemisphere, lambert_weight
+
+# path 길이 상한 ~ 샘플당 비용이 이 이상 늘지 않음
+MAX_DEPTH = 8
+
+# 이 depth부터 Russian roulette ~ throughput이 작을수록 일찍 종료
+RR_DEPTH = 2
+RR_MAX = 0.95
+
+# trace_rays의 iterative 버전 ~ ray 하나당 path 하나 (분기 없음)
+# 각 vertex에서 trace_ray의 혼합 비율대로 (diffuse / 반사 / 굴절) 중 하나만 골라서 진행, throughput으로 보정
+# scene : objects 리스트 또는 flat BVH
+# samples : SampleStream (QMC) ~ vertex마다 광원, 분기 1, 반구 2, Russian roulette 1 차원, None 이면 np.random
+# pixel_angle : texture footprint용 camera_pixel_angle(camera) ~ None 이면 기본 camera 값
+def trace_paths(origins, directions, scene, lights, camera_pos, table=None, max_depth=MAX_DEPTH, rr_depth=RR_DEPTH, samples=None, pixel_angle=None):
+    objects = scene_objects(scene)
+    if table is None: table = material_table(objects)
+
+    colors = np.zeros((len(origins), 3))
+    throughput = np.ones((len(origins), 3))
+    paths = np.arange(len(origins)) # 살아있는 path -> colors의 index
+
+    for depth in range(max_depth):
+        if len(paths) == 0: break
+
+        # hit check ~ 못 맞춘 path는 종료
+        with timed("intersect"): ray_distance, normals, object_ids = Nearest_HIT_finder_batch(origins, directions, scene)
+
+        hit = object_ids >= 0
+        if not hit.all():
+            origins, directions, throughput, paths = origins[hit], directions[hit], throughput[hit], paths[hit]
+            ray_distance, normals, object_ids = ray_distance[hit], normals[hit], object_ids[hit]
+            if samples is not None: samples = samples.take(hit)
+
+        if len(paths) == 0: break
+
+        points = origins + ray_distance[:, None] * directions
+        normals = normals / np.linalg.norm(normals, axis=1, keepdims=True)
+
+        reflective = table['reflective'][object_ids]
+        refractive = table['refractive'][object_ids]
+        ior = table['ior'][object_ids]
+
+        # 직접광 ~ trace_ray와 같은 비율
+        local_weight = 1 - reflective - refractive
+        local_color = shade_batch(points, normals, object_ids, scene, lights, camera_pos, table, samples, pixel_angle)
+
+        colors[paths] += throughput * local_weight[:, None] * local_color
+
+        cos_d = np.sum(directions * normals, axis=1)
+
+        # 굴절 ~ 내부에서 나가는 경우 swap
+        inside = cos_d > 0
+        n_diff = np.where(inside, ior, 1 / ior)
+        normal_t = np.where(inside[:, None], -normals, normals)
+        cos_i = np.abs(cos_d)
+
+        sin_t2 = n_diff ** 2 * (1 - cos_i ** 2)
+        has_refract = (refractive > 0) & (sin_t2 <= 1)
+
+        # Fresnel ~ Schlick
+        R0 = ((1 - ior) / (1 + ior)) ** 2
+        fresnel = R0 + (1 - R0) * (1 - np.maximum(-cos_d, 0.0)) ** 5
+
+        # 분기별 가중치 ~ diffuse (간접광), 반사, 굴절 (전반사면 0)
+        specular = reflective + refractive
+        weights = np.stack([local_weight * INDIRECT_WEIGHT, specular * fresnel, specular * (1 - fresnel) * has_refract], axis=1)
+        weights = np.maximum(weights, 0)
+
+        total = weights.sum(axis=1)
+
+        # 가중치에 비례해서 분기 하나 선택 ~ 선택 확률로 나누면 throughput *= total
+        pick = (np.random.rand(len(paths)) if samples is None else samples.uniform()[:, 0]) * total
+        branch = (pick >= weights[:, 0]).astype(np.int64) + (pick >= weights[:, 0] + weights[:, 1])
+        branch = np.where(total > 0, np.minimum(branch, 2), 0)
+
+        throughput = throughput * total[:, None]
+
+        # diffuse ~ 표면 색으로 물듦 (color bleeding)
+        diffuse = branch == 0
+        if diffuse.any(): throughput[diffuse] *= surface_color_batch(points[diffuse], object_ids[diffuse], objects, table, pixel_footprint(points[diffuse], normals[diffuse], camera_pos, pixel_angle))
+
+        new_directions = np.empty_like(directions)
+        new_origins = np.empty_like(origins)
+
+        # 반구 방향 ~ 차원이 path마다 어긋나지 않게 전체에서 꺼내고 diffuse만 씀
+        hemisphere = None if samples is None else samples.uniform(2)
+
+        if diffuse.any():
+            new_directions[diffuse], pdfs = cosine_hemisphere(normals[diffuse], 1, None if hemisphere is None else hemisphere[diffuse])
+            new_origins[diffuse] = points[diffuse] + EPSILON * normals[diffuse]
+
+            throughput[diffuse] *= lambert_weight(new_directions[diffuse], normals[diffuse], pdfs)[:, None]
+
+        reflect = branch == 1
+        new_directions[reflect] = directions[reflect] - 2 * cos_d[reflect, None] * normals[reflect]
+        new_origins[reflect] = points[reflect] + EPSILON * normals[reflect]
+
+        refract = branch == 2
+        cos_t = np.sqrt(np.maximum(1 - sin_t2[refract], 0))
+        new_directions[refract] = n_diff[refract, None] * directions[refract] + (n_diff[refract] * cos_i[refract] - cos_t)[:, None] * normal_t[refract]
+        new_origins[refract] = points[refract] - EPSILON * normal_t[refract]
+
+        new_directions /= np.linalg.norm(new_directions, axis=1, keepdims=True)
+
+        # Russian roulette ~ 살아남으면 확률로 나눠서 기댓값 유지
+        alive = total > 0
+
+        if depth + 1 >= rr_depth:
+            survive = np.minimum(throughput.max(axis=1), RR_MAX)
+            alive &= (np.random.rand(len(paths)) if samples is None else samples.uniform()[:, 0]) < survive
+            throughput = throughput / np.where(alive, survive, 1)[:, None]
+
+        count("rays.indirect", np.count_nonzero(diffuse & alive))
+        count("rays.reflection", np.count_nonzero(reflect & alive))
+        count("rays.refraction", np.count_nonzero(refract & alive))
+
+        origins, directions, throughput, paths = new_origins[alive], new_directions[alive], throughput[alive], paths[alive]
+        if samples is not None: samples = samples.take(alive)
+
+    return np.clip(colors, 0, 1)
@@ -0,0 +1,237 @@
+import numpy as np
+
+from find_intersection import Nearest_HIT_finder_batch, scene_objects
+from light_hw5 import light_frame
+from sampler_hw5 import orthonormal_basis
+from stats_hw5 import count, timed
+
+# caustic photon map (Jensen 1996) ~ 광원 -> 유리 / 거울 -> diffuse 면 으로 가는 빛은 shadow ray가 막히고 (유리도 가림)
+# 반구 ray로는 광원에 닿지 않아서 whitted / path 둘 다 못 찾음 ~ 렌더링 전에 광원에서 photon을 쏴서 specular 반사 / 굴절 뒤 닿은 곳에 저장
+# shading 때 가까운 photon k개의 밀도로 그 점에 모인 빛을 추정 (KD-tree), diffuse 항처럼 더함
+# photon은 specular 물체 (caustic을 만드는 것) 쪽으로만 쏨 ~ 대부분 유리 / 거울에 맞아서 낭비가 적음
+# 물체마다 원뿔이 따로라 겹치는 방향은 여러 번 쏘게 됨 ~ 각 묶음은 처음 맞은 것이 그 물체인 photon만 (경로마다 한 묶음에서만 셈)
+
+# 광원 x caustic 물체 쌍마다 쏘는 photon 수
+PHOTONS = 100000
+
+# 반사 + 굴절 비율이 이 이상인 물체를 향해 쏨
+CAUSTIC_SPECULAR = 0.5
+
+# photon 하나의 최대 bounce 수
+MAX_BOUNCES = 8
+
+# 모으기 ~ 가까운 GATHER_K 개 (반경 GATHER_RADIUS 안), 반경은 k 번째 photon까지 거리 (모자라면 GATHER_RADIUS)
+GATHER_K = 64
+GATHER_RADIUS = 1.0
+
+# photon normal과 shading normal의 cos 하한 ~ 벽 모서리에서 옆 면 photon이 섞이지 않게
+GATHER_NORMAL_COS = 0.9
+
+# cone filter (Jensen) ~ 거리 d 의 photon 가중치 1 - d / (k r), caustic 경계가 덜 번짐
+CONE_FILTER = 1.1
+
+EPSILON = 0.01
+
+# 물체를 감싸는 구 (중심, 반지름) ~ Sphere는 그 자체, 나머지는 bounding box
+def bounding_sphere(obj):
+    geo = obj.geometry
+    center = (np.asarray(geo.bounds_min, dtype=np.float64) + np.asarray(geo.bounds_max, dtype=np.float64)) / 2
+
+    if hasattr(obj, 'radius'): return center, float(obj.radius)
+    return center, float(np.linalg.norm(np.asarray(geo.bounds_max, dtype=np.float64) - center))
+
+# shade_batch와 같은 거리 감쇠
+def attenuation(distance):
+    return 1 / (1 + 0.05 * distance + 0.01 * distance ** 2)
+
+class PhotonMap:
+    def __init__(self, positions, normals, power):
+        self.positions = positions
+        self.normals = normals
+        self.power = power
+
+        self.tree = None
+        if len(positions) > 0:
+            from scipy.spatial import cKDTree # sampler_hw5와 같이 쓸 때만
+            self.tree = cKDTree(positions)
+
+    def __len__(self):
+        return len(self.positions)
+
+    # 점마다 모인 빛 (N, 3) ~ 같은 방향 면의 photon 가중 합 / 원 넓이
+    def irradiance(self, points, normals):
+        values = np.zeros((len(points), 3))
+        if self.tree is None or len(points) == 0: return values
+
+        k = min(GATHER_K, len(self))
+        distance, index = self.tree.query(points, k=k, distance_upper_bound=GATHER_RADIUS)
+        distance, index = distance.reshape(len(points), k), index.reshape(len(points), k)
+
+        # 반경 ~ k 번째까지 거리, 모자라면 (대부분의 점) GATHER_RADIUS
+        found = index < len(self)
+        radius = np.maximum(np.where(found[:, -1], distance[:, -1], GATHER_RADIUS), 1e-6)
+
+        # 찾은 것만 (점, photon) 쌍으로 ~ caustic에서 먼 점은 몇 개뿐이라 (N, k) 전체보다 훨씬 작음
+        pair_points, pair_slots = np.nonzero(found)
+        if len(pair_points) == 0: return values
+
+        photon = index[pair_points, pair_slots]
+
+        n = normals[pair_points] / np.linalg.norm(normals[pair_points], axis=1, keepdims=True)
+        same_side = np.sum(self.normals[photon] * n, axis=1) > GATHER_NORMAL_COS
+
+        weights = np.where(same_side, 1 - distance[pair_points, pair_slots] / (CONE_FILTER * radius[pair_points]), 0)
+        area = (1 - 2 / (3 * CONE_FILTER)) * np.pi * radius ** 2
+
+        for c in range(3): values[:, c] = np.bincount(pair_points, weights * self.power[photon, c], minlength=len(points))
+        return values / area[:, None]
+
+# ---------- photon 쏘기 ----------
+
+# 광원 면 위 점 n개 -> 구 (center, radius) 를 덮는 원뿔 안 균일 방향 ~ (origins, directions, 원뿔 입체각)
+def emit_photons(light, center, radius, n, rng):
+    normal, u, v = light_frame(light.normal)
+    width, height = light.size
+
+    offsets = rng.random((n, 2)) - 0.5
+    origins = np.array(light.center, dtype=np.float64) + offsets[:, :1] * width * u + offsets[:, 1:] * height * v
+
+    axis = center - origins
+    distance = np.linalg.norm(axis, axis=1)
+    axis /= distance[:, None]
+
+    # 광원이 구 안에 있으면 구 전체 (반구 2개)
+    cos_max = np.sqrt(np.maximum(1 - (radius / distance) ** 2, 0)) * (distance > radius) - (distance <= radius)
+
+    sample = rng.random((n, 2))
+    cos_theta = 1 - sample[:, 0] * (1 - cos_max)
+    sin_theta = np.sqrt(np.maximum(1 - cos_theta ** 2, 0))
+    phi = 2 * np.pi * sample[:, 1]
+
+    tangent, bitangent = orthonormal_basis(axis)
+    directions = (sin_theta * np.cos(phi))[:, None] * tangent + (sin_theta * np.sin(phi))[:, None] * bitangent + cos_theta[:, None] * axis
+
+    # 광원 뒤쪽 (앞면으로만 빛남) 은 버림
+    front = directions @ normal > 0
+    solid_angle = 2 * np.pi * (1 - cos_max)
+
+    return origins[front], directions[front], solid_angle[front]
+
+# photon을 scene에 쏴서 specular bounce 뒤 diffuse 면에 닿은 것만 저장
+# 각 hit에서 trace_rays와 같은 비율 ~ 반사 (reflective + refractive) * fresnel, 굴절 (reflective + refractive) * (1 - fresnel), 나머지는 흡수 (Russian roulette)
+# photon power ~ 모델의 직접광 (intensity x cos x 감쇠(d)) 과 같은 밀도가 되도록 intensity x 입체각 / n x 감쇠(d) x d^2 (d : 광원부터 지나온 전체 거리)
+def trace_caustic_photons(scene, lights, photons=PHOTONS, seed=0):
+    objects = scene_objects(scene)
+
+    reflective = np.array([obj.material.reflective for obj in objects], dtype=np.float64)
+    refractive = np.array([obj.material.refractive for obj in objects], dtype=np.float64)
+    ior = np.array([obj.material.ior for obj in objects], dtype=np.float64)
+
+    specular = reflective + refractive
+    generators = np.nonzero(specular >= CAUSTIC_SPECULAR)[0]
+
+    rng = np.random.default_rng(seed)
+    positions, normals_out, power_out = [], [], []
+
+    with timed("photons"):
+        for light in lights:
+            intensity = np.array(light.intensity, dtype=np.float64)
+
+            for object_id in generators:
+                center, radius = bounding_sphere(objects[object_id])
+                origins, directions, solid_angle = emit_photons(light, center, radius, photons, rng)
+
+                count("photons.emitted", photons)
+
+                power = (solid_angle / photons)[:, None] * intensity
+                length = np.zeros(len(origins))
+                bounces = np.zeros(len(origins), dtype=np.int64)
+
+                for _ in range(MAX_BOUNCES + 1):
+                    if len(origins) == 0: break
+
+                    count("rays.photon", len(origins))
+                    distance, normals, object_ids = Nearest_HIT_finder_batch(origins, directions, scene)
+
+                    # 첫 hit은 이 묶음의 물체만 ~ 다른 물체가 가리면 그 물체의 묶음이 셈
+                    hit = (object_ids >= 0) & ((bounces > 0) | (object_ids == object_id))
+                    origins, directions, power, length, bounces = origins[hit], directions[hit], power[hit], length[hit], bounces[hit]
+                    distance, normals, object_ids = distance[hit], normals[hit], object_ids[hit]
+
+                    points = origins + distance[:, None] * directions
+                    normals = normals / np.linalg.norm(normals, axis=1, keepdims=True)
+                    length = length + distance
+
+                    cos_d = np.sum(directions * normals, axis=1)
+
+                    # 저장 ~ specular를 한 번 이상 거쳐서 diffuse 성분이 있는 면의 앞쪽 (normal 쪽) 에 닿은 photon
+                    store = (bounces > 0) & (1 - specular[object_ids] > 0) & (cos_d < 0)
+
+                    positions.append(points[store])
+                    normals_out.append(normals[store])
+                    power_out.append(power[store] * (attenuation(length[store]) * length[store] ** 2)[:, None])
+
+                    # 굴절 ~ 내부에서 나가는 경우 swap
+                    inside = cos_d > 0
+                    n_diff = np.where(inside, ior[object_ids], 1 / ior[object_ids])
+                    normal_t = np.where(inside[:, None], -normals, normals)
+                    cos_i = np.abs(cos_d)
+
+                    sin_t2 = n_diff ** 2 * (1 - cos_i ** 2)
+                    has_refract = (refractive[object_ids] > 0) & (sin_t2 <= 1)
+                    cos_t = np.sqrt(np.maximum(1 - sin_t2, 0))
+
+                    # Fresnel ~ Schlick, 안에서 나갈 때는 굴절각 쪽 cos (전반사면 1)
+                    # trace_rays는 안쪽에서 cos 0 (전부 반사) 이라 photon이 유리 밖으로 못 나옴
+                    R0 = ((1 - ior[object_ids]) / (1 + ior[object_ids])) ** 2
+                    fresnel = R0 + (1 - R0) * (1 - np.where(inside, cos_t, cos_i)) ** 5
+                    fresnel = np.where(sin_t2 <= 1, fresnel, 1.0)
+
+                    reflect_weight = specular[object_ids] * fresnel
+                    refract_weight = specular[object_ids] * (1 - fresnel) * has_refract
+
+                    # 비율대로 하나 고르고 나머지는 흡수 ~ 고를 확률이 가중치와 같아서 power는 그대로
+                    pick = rng.random(len(origins))
+                    reflect = pick < reflect_weight
+                    refract = ~reflect & (pick < reflect_weight + refract_weight)
+
+                    new_directions = np.empty_like(directions)
+                    new_origins = np.empty_like(origins)
+
+                    new_directions[reflect] = directions[reflect] - 2 * cos_d[reflect, None] * normals[reflect]
+                    new_origins[reflect] = points[reflect] + EPSILON * np.where(inside[reflect, None], -normals[reflect], normals[reflect])
+
+                    new_directions[refract] = n_diff[refract, None] * directions[refract] + (n_diff[refract] * cos_i[refract] - cos_t[refract])[:, None] * normal_t[refract]
+                    new_origins[refract] = points[refract] - EPSILON * normal_t[refract]
+
+                    alive = reflect | refract
+                    origins, directions = new_origins[alive], new_directions[alive]
+                    directions /= np.linalg.norm(directions, axis=1, keepdims=True)
+                    power, length, bounces = power[alive], length[alive], bounces[alive] + 1
+
+        photon_map = PhotonMap(np.concatenate(positions) if positions else np.empty((0, 3)), np.concatenate(normals_out) if normals_out else np.empty((0, 3)), np.concatenate(power_out) if power_out else np.empty((0, 3)))
+
+    count("photons.stored", len(photon_map))
+    print(f"Caustic photons: {len(photon_map)} stored ({len(generators)} specular objects, {len(lights)} lights)")
+
+    return photon_map
+
+# ---------- 렌더링 중 ~ 현재 photon map (worker에는 initargs로) ----------
+
+PHOTON_MAP = None
+
+def set_photon_map(photon_map):
+    global PHOTON_MAP
+    PHOTON_MAP = photon_map
+
+def current_photon_map():
+    return PHOTON_MAP
+
+# shading point의 caustic 빛 (N, 3) ~ photon map이 없으면 0
+def lookup_caustics(points, normals):
+    if PHOTON_MAP is None: return np.zeros((len(points), 3))
+
+    with timed("photons"): values = PHOTON_MAP.irradiance(points, normals)
+
+    count("photons.lookups", len(points))
+    return values
@@ -0,0 +1,117 @@
+import os
+import numpy as np
+
+from image_hw5 import save_image
+from parallel_hw5 import make_tiles, render_parallel, TILE_SIZE, SEED, INTEGRATOR
+from scene_file_hw5 import scene_signature
+from irradiance_hw5 import current_irradiance_cache
+from photon_hw5 import current_photon_map
+
+LUMINANCE = np.array([0.2126, 0.7152, 0.0722])
+
+# 누적 버퍼 ~ 픽셀별 color 합, 밝기 제곱 합 (분산용), 샘플 수, 끝난 pass 수를 디스크 (.npz) 에 저장
+# 중간에 죽어도, 나중에 샘플을 더 추가할 때도 여기서 이어서 렌더링 (path = None 이면 메모리에만)
+# key : 샘플을 만든 조건 (buffer_signature) ~ 다르면 이전 샘플과 섞지 않음
+class AccumulationBuffer:
+    def __init__(self, path, width, height, key=None):
+        self.path = path
+        self.key = key
+
+        self.color_sum = np.zeros((height, width, 3), dtype=np.float64)
+        self.luminance_sq_sum = np.zeros((height, width), dtype=np.float64)
+        self.sample_count = np.zeros((height, width), dtype=np.int64)
+        self.passes = 0
+
+    # key가 다르면 (scene / seed / sampler ... 가 바뀜) 빈 버퍼 ~ IrradianceCache와 같은 방식
+    @classmethod
+    def load(cls, path, width, height, key=None):
+        buffer = cls(path, width, height, key)
+        if path is None or not os.path.exists(path): return buffer
+
+        with np.load(path) as data:
+            stored_key = str(data['key']) if 'key' in data else ""
+
+            if stored_key != (key or ""):
+                print(f"{path}: scene or render settings changed, accumulation buffer discarded")
+                return buffer
+
+            if data['color_sum'].shape != buffer.color_sum.shape:
+                raise ValueError(f"{path}: buffer is {data['color_sum'].shape[1]}x{data['color_sum'].shape[0]}, expected {width}x{height}")
+
+            buffer.color_sum = data['color_sum']
+            buffer.sample_count = data['sample_count']
+            buffer.passes = int(data['passes'])
+
+            if 'luminance_sq_sum' in data: buffer.luminance_sq_sum = data['luminance_sq_sum']
+
+        return buffer
+
+    # 임시 파일에 쓰고 교체 ~ 저장 도중 죽어도 이전 버퍼는 남음
+    def save(self):
+        if self.path is None: return
+
+        directory = os.path.dirname(self.path)
+        if directory: os.makedirs(directory, exist_ok=True)
+
+        temp_path = self.path + ".tmp.npz"
+        np.savez(temp_path, key=np.array(self.key or ""), color_sum=self.color_sum, luminance_sq_sum=self.luminance_sq_sum, sample_count=self.sample_count, passes=self.passes)
+        os.replace(temp_path, self.path)
+
+    # pass 하나 (픽셀당 1 샘플) 더하기
+    def add(self, image):
+        self.color_sum += image
+        self.luminance_sq_sum += (image @ LUMINANCE) ** 2
+        self.sample_count += 1
+
+        self.passes += 1
+
+    # 일부 픽셀에만 샘플 1개씩 더하기 ~ 같은 픽셀이 여러 번 있어도 됨
+    def add_pixels(self, xs, ys, colors):
+        np.add.at(self.color_sum, (ys, xs), colors)
+        np.add.at(self.luminance_sq_sum, (ys, xs), (colors @ LUMINANCE) ** 2)
+        np.add.at(self.sample_count, (ys, xs), 1)
+
+    # 픽셀 밝기의 평균의 표준오차 ~ 샘플 2개 미만은 inf
+    def standard_error(self):
+        n = self.sample_count
+        safe_n = np.maximum(n, 1)
+
+        mean = (self.color_sum @ LUMINANCE) / safe_n
+        variance = np.maximum(self.luminance_sq_sum / safe_n - mean ** 2, 0) * safe_n / np.maximum(n - 1, 1)
+
+        return np.where(n >= 2, np.sqrt(variance / safe_n), np.inf), mean
+
+    def image(self):
+        count = np.maximum(self.sample_count, 1)[:, :, None]
+        return (self.color_sum / count).astype(np.float32)
+
+# 누적 버퍼의 key ~ scene 내용 + 카메라 + 샘플을 정하는 설정 (seed, 타일 크기, integrator, sampler) + 렌더링 중 읽는 cache들
+def buffer_signature(camera, scene, lights, tile_size=TILE_SIZE, seed=SEED, integrator=INTEGRATOR, sampler=None):
+    view = tuple(np.asarray(v, dtype=np.float64).tolist() for v in (camera.eye, camera.target, camera.up)) + (camera.fov, camera.width, camera.height)
+    sampling = None if sampler is None else (sampler.kind, sampler.seed)
+
+    irradiance = current_irradiance_cache()
+    photons = current_photon_map()
+
+    return scene_signature(scene, lights, (view, tile_size, seed, integrator, sampling, 0 if irradiance is None else len(irradiance), 0 if photons is None else len(photons)))
+
+# progressive 렌더링 ~ pass 마다 픽셀당 jitter 샘플 1개씩 누적, 버퍼 저장 + preview 저장
+# 버퍼에 이미 있는 pass는 건너뛰므로 같은 호출로 이어서 / 더 많이 렌더링 가능
+# sampler (QMC) 가 있으면 pass 번호가 수열 위치
+def render_progressive(camera, scene, lights, buffer_path, passes, preview_path=None, width=640, height=480, tile_size=TILE_SIZE, workers=1, seed=SEED, integrator=INTEGRATOR, sampler=None):
+    buffer = AccumulationBuffer.load(buffer_path, width, height, buffer_signature(camera, scene, lights, tile_size, seed, integrator, sampler))
+
+    if buffer.passes > 0: print(f"{buffer_path}: resuming from pass {buffer.passes}")
+
+    # pass 마다 다른 seed 범위 ~ 이어서 렌더링해도 처음부터 한 것과 같은 결과
+    tile_count = len(make_tiles(width, height, tile_size))
+
+    for pass_index in range(buffer.passes, passes):
+        image = render_parallel(camera, scene, lights, width, height, tile_size=tile_size, workers=workers, seed=seed + pass_index * tile_count, jitter=True, integrator=integrator, desc=f"Pass {pass_index + 1}/{passes}", sampler=sampler, sample_index=pass_index)
+
+        buffer.add(image)
+        buffer.save()
+
+        if preview_path is not None: save_image(buffer.image(), preview_path)
+
+    return buffer.image()
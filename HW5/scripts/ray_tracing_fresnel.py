@@ -1,71 +1,56 @@
 import numpy as np
 
-from find_intersection import Ray, Nearest_HIT_finder_bvh
-from shader_hw5 import shade
+from find_intersection import Ray, Nearest_HIT_finder_bvh, Nearest_HIT_finder_batch, scene_objects
+from shader_hw5 import shade, shade_batch, material_table
+from stats_hw5 import count, timed
+from sampler_hw5 import SampleStream, cosine_hemisphere, lambert_weight
+from irradiance_hw5 import lookup_indirect
+from texture_hw5 import camera_pixel_angle
 
 NUM_recursive = 4
 EPSILON = 0.01
 
-# 간접광용 
-def random_hemisphere(normal):
-
-    # 랜덤 2개 추출 
-    r1 = np.random.rand() # phi
-    r2 = np.random.rand() # theta ~ 고도 
-
-    phi = 2 * np.pi * r1
-
-    x = np.cos(phi) * np.sqrt(1 - r2)
-    y = np.sqrt(r2)
-    z = np.sin(phi) * np.sqrt(1 - r2)
-
-    up = np.array([0, 1, 0], dtype=np.float64)
-    normal = np.array(normal, dtype=np.float64)
-
-    # normal과 up이 거의 같은 경우 (회전 불필요)
-    if np.allclose(normal, up): return np.array([x, y, z])
-    elif np.allclose(normal, -up): return np.array([x, -y, -z])  # 반대 방향 hemisphere 
-
-    axis = np.cross(up, normal).astype(np.float64)
-    axis /= np.linalg.norm(axis)
-    angle = np.arccos(np.clip(np.dot(up, normal), -1, 1))
-
-    return rotate_vector(np.array([x, y, z]), axis, angle)
-
-# Rodrigues 회전공식 
-def rotate_vector(v, axis, angle):
-    return (v * np.cos(angle) + np.cross(axis, v) * np.sin(angle) + axis * np.dot(axis, v) * (1 - np.cos(angle)))
+NUM_SAMPLES = 10 # 간접광 샘플 수, 조절 가능! 
+INDIRECT_WEIGHT = 0.2
 
 # 메인 ray 함수 
-def trace_ray(ray, bvh_root, lights, camera_pos, depth=0):
+def trace_ray(ray, bvh_root, lights, camera_pos, depth=0, pixel_angle=None):
 
     # 재귀 종료 
     if depth > NUM_recursive: return np.array([0, 0, 0]) # 검정 
 
     # hit check 
-    hit = Nearest_HIT_finder_bvh(ray, bvh_root)
+    with timed("intersect"): hit = Nearest_HIT_finder_bvh(ray, bvh_root)
     if not hit: return np.array([0, 0, 0]) 
 
-    local_color = shade(hit, lights, bvh_root, camera_pos)
+    local_color = shade(hit, lights, bvh_root, camera_pos, pixel_angle)
 
     # 1-bounce diffuse lighting
     # depth == 0 -> 1번 반사됐을 때, 1번만 적용 
     if depth == 0:
-        indirect = np.zeros(3)
-
-        num_samples = 10  # 조절 가능! 
+        num_samples = NUM_SAMPLES
         norm = hit.normal
         origin = hit.point + norm * EPSILON
 
-        for i in range(num_samples):
-            dir = random_hemisphere(norm) # 랜덤 방향 가져옴 
+        # irradiance cache 에 있으면 그 값
+        cached, found = lookup_indirect(np.asarray(hit.point, dtype=np.float64)[None], np.asarray(norm, dtype=np.float64)[None])
+        indirect = cached[0]
+
+        if not found[0]:
+            count("rays.indirect", num_samples)
+
+            # 랜덤 방향 (cosine-weighted) 을 한 번에 가져옴 
+            dirs, pdfs = cosine_hemisphere(norm[None], num_samples)
+            weights = lambert_weight(dirs, norm, pdfs)
+
+            for dir, weight in zip(dirs, weights):
+                sample_ray = Ray(origin, dir)
+                sample_color = trace_ray(sample_ray, bvh_root, lights, camera_pos, depth + 1, pixel_angle)
+                indirect += weight * sample_color
 
-            sample_ray = Ray(origin, dir)
-            sample_color = trace_ray(sample_ray, bvh_root, lights, camera_pos, depth + 1)
-            indirect += sample_color
+            indirect /= num_samples
 
-        indirect /= num_samples
-        local_color += 0.2 * indirect
+        local_color += INDIRECT_WEIGHT * indirect
 
     reflected_color = np.zeros(3) # 반사
     refracted_color = np.zeros(3) # 굴절 
@@ -116,8 +101,12 @@ def trace_ray(ray, bvh_root, lights, camera_pos, depth=0):
     if hit.material.reflective > 0 or hit.material.refractive > 0:
 
         # 반사, 굴절 
-        reflected_color = trace_ray(reflect_ray, bvh_root, lights, camera_pos, depth + 1)
-        if has_refract: refracted_color = trace_ray(refract_ray, bvh_root, lights, camera_pos, depth + 1)
+        count("rays.reflection")
+        reflected_color = trace_ray(reflect_ray, bvh_root, lights, camera_pos, depth + 1, pixel_angle)
+
+        if has_refract:
+            count("rays.refraction")
+            refracted_color = trace_ray(refract_ray, bvh_root, lights, camera_pos, depth + 1, pixel_angle)
 
         # Fresnel 기반 반사-굴절 혼합
         color = (1 - fresnel) * refracted_color + fresnel * reflected_color
@@ -130,10 +119,159 @@ def trace_ray(ray, bvh_root, lights, camera_pos, depth=0):
 
     return np.clip(final_color, 0, 1)
 
+# depth 부터 (아래 반사 / 굴절 분기까지) trace_rays 가 쓰는 샘플 차원 수 ~ depth마다 광원 하나에 1 + 두 갈래
+def branch_dimensions(depth, light_count):
+    if depth > NUM_recursive: return 0
+    return light_count + 2 * branch_dimensions(depth + 1, light_count)
+
+# 메인 ray 함수의 wavefront 버전 
+# ray 하나씩 재귀하는 대신 depth 단위로 배치 전체를 mask로 처리
+# scene : objects 리스트 또는 flat BVH
+# samples : ray와 같이 다니는 SampleStream (QMC) ~ None 이면 np.random
+# pixel_angle : texture footprint용 camera_pixel_angle(camera) ~ None 이면 기본 camera 값
+def trace_rays(origins, directions, scene, lights, camera_pos, depth=0, table=None, samples=None, pixel_angle=None):
+    colors = np.zeros((len(origins), 3))
+
+    # 재귀 종료 
+    if depth > NUM_recursive or len(origins) == 0: return colors
+    if table is None: table = material_table(scene_objects(scene))
+
+    # hit check 
+    with timed("intersect"): ray_distance, normals, object_ids = Nearest_HIT_finder_batch(origins, directions, scene)
+
+    rows = np.nonzero(object_ids >= 0)[0]
+    if len(rows) == 0: return colors
+
+    directions = directions[rows]
+    normals = normals[rows]
+    object_ids = object_ids[rows]
+    points = origins[rows] + ray_distance[rows, None] * directions
+
+    if samples is not None: samples = samples.take(rows)
+
+    local_color = shade_batch(points, normals, object_ids, scene, lights, camera_pos, table, samples, pixel_angle)
+
+    # 분기마다 차원 구간을 따로 ~ 간접광 / 반사 / 굴절이 같은 (픽셀, 샘플, 차원) 값을 쓰지 않게
+    # [간접광 2 + 다음 depth] [반사 = 다음 depth] [굴절 = 다음 depth] 순서
+    branch = branch_dimensions(depth + 1, len(lights))
+
+    # 1-bounce diffuse lighting (depth == 0)
+    # irradiance cache 에서 찾은 점은 보간 값, 나머지만 반구 샘플링
+    if depth == 0:
+        indirect, found = lookup_indirect(points, normals)
+        missing = np.nonzero(~found)[0]
+
+        if len(missing) > 0:
+            missing_normals = normals[missing]
+            sample_origins = np.repeat(points[missing] + missing_normals * EPSILON, NUM_SAMPLES, axis=0)
+
+            count("rays.indirect", len(sample_origins))
+
+            # 픽셀의 NUM_SAMPLES 개가 수열의 연속된 점
+            indirect_samples = None if samples is None else samples.take(missing).split(NUM_SAMPLES)
+
+            # hit 마다 접평면 축 한 번, 방향 NUM_SAMPLES 개
+            sample_dirs, pdfs = cosine_hemisphere(missing_normals, NUM_SAMPLES, None if indirect_samples is None else indirect_samples.uniform(2))
+            weights = lambert_weight(sample_dirs, np.repeat(missing_normals, NUM_SAMPLES, axis=0), pdfs)
+
+            traced = trace_rays(sample_origins, sample_dirs, scene, lights, camera_pos, depth + 1, table, indirect_samples, pixel_angle) * weights[:, None]
+            indirect[missing] = traced.reshape(len(missing), NUM_SAMPLES, 3).mean(axis=1)
+
+        local_color += INDIRECT_WEIGHT * indirect
+        if samples is not None: samples.skip(2 + branch)
+
+    reflective = table['reflective'][object_ids]
+    refractive = table['refractive'][object_ids]
+    ior = table['ior'][object_ids]
+
+    cos_d = np.sum(directions * normals, axis=1)
+
+    # 반사 
+    reflect_dirs = directions - 2 * cos_d[:, None] * normals
+    reflect_dirs /= np.linalg.norm(reflect_dirs, axis=1, keepdims=True)
+    reflect_origins = points + EPSILON * normals
+
+    # 굴절 ~ 내부에서 나가는 경우 swap
+    inside = -cos_d < 0
+    n_diff = np.where(inside, ior, 1 / ior)
+    normal_t = np.where(inside[:, None], -normals, normals)
+    cos_i = np.abs(cos_d)
+
+    sin_t2 = n_diff ** 2 * (1 - cos_i ** 2)
+    has_refract = (refractive > 0) & (sin_t2 <= 1)
+
+    cos_t = np.sqrt(np.maximum(1 - sin_t2, 0))
+    refract_dirs = n_diff[:, None] * directions + (n_diff * cos_i - cos_t)[:, None] * normal_t
+    refract_origins = points - EPSILON * normal_t
+
+    # Fresnel ~ Schlick
+    R0 = ((1 - ior) / (1 + ior)) ** 2
+
+    cos_theta = np.maximum(-cos_d, 0.0)
+    fresnel = (R0 + (1 - R0) * (1 - cos_theta) ** 5)[:, None]
+
+    # 반사, 굴절 있는 ray만 다음 depth로 
+    secondary = (reflective > 0) | (refractive > 0)
+
+    reflected_color = np.zeros((len(rows), 3))
+    refracted_color = np.zeros((len(rows), 3))
+
+    reflect_samples = None if samples is None else samples.take(secondary)
+    refract_samples = None if samples is None else samples.take(has_refract)
+    if refract_samples is not None: refract_samples.skip(branch)
+
+    count("rays.reflection", np.count_nonzero(secondary))
+    reflected_color[secondary] = trace_rays(reflect_origins[secondary], reflect_dirs[secondary], scene, lights, camera_pos, depth + 1, table, reflect_samples, pixel_angle)
+
+    if has_refract.any():
+        count("rays.refraction", np.count_nonzero(has_refract))
+
+        refract_dirs = refract_dirs[has_refract] / np.linalg.norm(refract_dirs[has_refract], axis=1, keepdims=True)
+        refracted_color[has_refract] = trace_rays(refract_origins[has_refract], refract_dirs, scene, lights, camera_pos, depth + 1, table, refract_samples, pixel_angle)
+
+    color = np.where(secondary[:, None], (1 - fresnel) * refracted_color + fresnel * reflected_color, local_color)
+
+    # 비율에 맞춰 최종 color 결정 
+    final_color = (1 - reflective - refractive)[:, None] * local_color + (reflective + refractive)[:, None] * color
+
+    colors[rows] = np.clip(final_color, 0, 1)
+    return colors
+
+# 임의의 픽셀 목록 (xs, ys) 을 wavefront로 렌더링 ~ jitter, trace, sampler는 render_tile과 동일 
+# sample_index : 픽셀마다 몇 번째 샘플인지 (QMC 수열 위치), 숫자 하나 또는 (N,)
+def render_pixels(camera, scene, lights, xs, ys, jitter=False, trace=trace_rays, sampler=None, sample_index=0):
+    samples = None if sampler is None else SampleStream(sampler, np.asarray(ys) * camera.width + np.asarray(xs), sample_index)
+
+    xs = np.asarray(xs, dtype=np.float64)
+    ys = np.asarray(ys, dtype=np.float64)
+
+    if jitter: xs, ys = jitter_pixels(xs, ys, samples)
+
+    origins, directions = camera.generate_rays(xs, ys)
+    count("rays.primary", len(origins))
+
+    return trace(origins, directions, scene, lights, camera.eye, samples=samples, pixel_angle=camera_pixel_angle(camera))
+
+# 픽셀 내 오프셋 (0~1) ~ sampler가 있으면 차원 0, 1
+def jitter_pixels(xs, ys, samples=None):
+    if samples is None: return xs + np.random.rand(len(xs)), ys + np.random.rand(len(ys))
+
+    offsets = samples.pixel_offsets()
+    return xs + offsets[:, 0], ys + offsets[:, 1]
+
+# 타일 하나 (x0 ~ x1, y0 ~ y1) 를 wavefront로 렌더링
+# jitter : render와 같이 픽셀 내 무작위 오프셋 (0~1) 
+# trace : 배치 ray -> color 함수 (trace_rays 또는 path tracer)
+# sampler : QMCSampler 또는 None (np.random), sample_index : 이 타일이 픽셀마다 몇 번째 샘플인지
+def render_tile(camera, scene, lights, x0, y0, x1, y1, jitter=False, trace=trace_rays, sampler=None, sample_index=0):
+    xs, ys = camera.tile_pixels(x0, y0, x1, y1)
+    return render_pixels(camera, scene, lights, xs, ys, jitter, trace, sampler, sample_index).reshape(y1 - y0, x1 - x0, 3)
+
 # 메인 렌더링 함수
 # Diffuse Sampling 
 def render(camera, bvh_root, lights, width=640, height=480):
     image = np.zeros((height, width, 3), dtype=np.float32)
+    pixel_angle = camera_pixel_angle(camera)
 
     rays_pixel = 10
 
@@ -147,7 +285,8 @@ def render(camera, bvh_root, lights, width=640, height=480):
                 rand2 = np.random.rand()
 
                 ray = camera.generate_ray(x + rand1, y + rand2)
-                color = trace_ray(ray, bvh_root, lights, camera.eye)
+                count("rays.primary")
+                color = trace_ray(ray, bvh_root, lights, camera.eye, pixel_angle=pixel_angle)
                 color_sum += color
 
             image[y, x] = color_sum / rays_pixel
@@ -0,0 +1,140 @@
+import numpy as np
+
+# 샘플 생성기 ~ "random" : 기존 np.random (호출마다), "sobol" / "halton" : 저불일치 (QMC) 수열
+# QMC는 모든 픽셀이 같은 수열의 sample_index 번째 점을 쓰고, 픽셀 x 차원마다 다른 Cranley-Patterson 이동 (mod 1) 으로 서로 다르게
+# 픽셀 하나를 pass 마다 (progressive / adaptive) 보면 수열 그대로 ~ random보다 고르게 퍼져서 같은 샘플 수에 노이즈가 적음
+SAMPLER = "sobol"
+SAMPLER_SEED = 0
+
+# 미리 만드는 차원 수 ~ 픽셀 2 + depth 마다 광원 1 + (분기 1 + 반구 2 + Russian roulette 1), 넘으면 앞의 차원을 다른 이동으로 재사용
+DIMENSIONS = 64
+
+# 차원 배치 ~ 0, 1 : 픽셀 안 위치 (jitter), 이후는 integrator가 쓰는 순서대로
+PIXEL_DIMENSIONS = 2
+
+# splitmix64 ~ (seed, 픽셀, 차원) -> [0, 1) 이동량, 배열 한 번에
+MASK64 = (1 << 64) - 1
+
+def hash_uniform(seed, pixels, dimensions):
+    base = np.uint64((seed * 0x9E3779B97F4A7C15) & MASK64)
+    x = base + np.asarray(pixels, dtype=np.uint64) * np.uint64(0xBF58476D1CE4E5B9) + np.asarray(dimensions, dtype=np.uint64) * np.uint64(0x94D049BB133111EB)
+
+    x ^= x >> np.uint64(30)
+    x *= np.uint64(0xBF58476D1CE4E5B9)
+    x ^= x >> np.uint64(27)
+    x *= np.uint64(0x94D049BB133111EB)
+    x ^= x >> np.uint64(31)
+
+    return (x >> np.uint64(11)).astype(np.float64) * 2.0 ** -53
+
+# 저불일치 수열 (scrambled Sobol / Halton) 의 점들을 표로 만들어 두고 필요하면 늘림 ~ worker로 넘어가도 표만 복사
+class QMCSampler:
+    def __init__(self, kind=SAMPLER, seed=SAMPLER_SEED, dimensions=DIMENSIONS):
+        if kind not in ("sobol", "halton"): raise ValueError(f"unknown sampler: {kind!r}")
+
+        self.kind = kind
+        self.seed = seed
+        self.dimensions = dimensions
+
+        self.table = np.empty((0, dimensions))
+
+    # 점 count개 ~ Sobol은 2의 거듭제곱 개로 (균형 조건), 같은 seed면 앞부분은 그대로
+    def _generate(self, count):
+        from scipy.stats import qmc # scipy.stats import가 느려서 (1초 이상) QMC를 쓸 때만
+
+        m = max(int(np.ceil(np.log2(max(count, 2)))), 4)
+
+        if self.kind == "sobol": return qmc.Sobol(self.dimensions, scramble=True, seed=self.seed).random_base2(m)
+        return qmc.Halton(self.dimensions, scramble=True, seed=self.seed).random(2 ** m)
+
+    def points(self, count):
+        if count > len(self.table): self.table = self._generate(count)
+        return self.table
+
+    # 샘플 값 (N, k) ~ pixels : 전체 이미지 기준 픽셀 번호 (N,), sample_index : 픽셀마다 몇 번째 샘플인지 (N,), 차원 dimension ~ dimension + k - 1
+    def uniform(self, pixels, sample_index, dimension, k=1):
+        dims = dimension + np.arange(k)
+        table = self.points(int(np.max(sample_index, initial=0)) + 1)
+
+        shift = hash_uniform(self.seed, np.asarray(pixels)[:, None], dims[None, :])
+        return (table[np.asarray(sample_index)[:, None], dims % self.dimensions] + shift) % 1.0
+
+# "random" -> None (기존 np.random 그대로), 나머지는 QMCSampler
+def make_sampler(kind=SAMPLER, seed=SAMPLER_SEED):
+    if kind is None or kind == "random": return None
+    return QMCSampler(kind, seed)
+
+# ray 배치와 같이 다니는 샘플 상태 ~ ray마다 픽셀 번호 / 샘플 번호, 배치 전체가 다음에 쓸 차원
+# integrator는 ray를 골라내거나 (take) 나눌 때 (split) 같이 바꾸고, 결정마다 uniform(k) 로 k 차원씩 꺼냄
+class SampleStream:
+    def __init__(self, sampler, pixels, sample_index, dimension=PIXEL_DIMENSIONS):
+        self.sampler = sampler
+        self.pixels = np.asarray(pixels, dtype=np.int64)
+        self.sample_index = np.broadcast_to(np.asarray(sample_index, dtype=np.int64), self.pixels.shape)
+        self.dimension = dimension
+
+    def __len__(self):
+        return len(self.pixels)
+
+    # 픽셀 안 위치 (N, 2) ~ 차원 0, 1 고정
+    def pixel_offsets(self):
+        return self.sampler.uniform(self.pixels, self.sample_index, 0, PIXEL_DIMENSIONS)
+
+    def uniform(self, k=1):
+        values = self.sampler.uniform(self.pixels, self.sample_index, self.dimension, k)
+        self.dimension += k
+        return values
+
+    # 값을 꺼내지 않고 차원 k개를 건너뜀 ~ 분기마다 차원 구간을 따로 줄 때
+    def skip(self, k):
+        self.dimension += k
+
+    # 일부 ray만 ~ 차원은 그대로 이어감
+    def take(self, rows):
+        return SampleStream(self.sampler, self.pixels[rows], self.sample_index[rows], self.dimension)
+
+    # ray마다 k개로 (np.repeat 순서) ~ 샘플 번호 s -> s * k + j, 한 픽셀의 k개가 수열의 연속된 점이라 서로 고르게 퍼짐
+    def split(self, k):
+        sample_index = (self.sample_index[:, None] * k + np.arange(k)).ravel()
+        return SampleStream(self.sampler, np.repeat(self.pixels, k), sample_index, self.dimension)
+
+# ---------- 방향 샘플링 ----------
+
+# normal마다 접평면 두 축 (tangent, bitangent) ~ Duff et al. (2017) 의 분기 없는 정규직교 기저, normals는 단위 벡터 (N, 3)
+def orthonormal_basis(normals):
+    x, y, z = normals[:, 0], normals[:, 1], normals[:, 2]
+    sign = np.copysign(1.0, z)
+    a = -1 / (sign + z)
+    b = x * y * a
+
+    tangent = np.stack([1 + sign * x * x * a, sign * b, -sign * x], axis=1)
+    bitangent = np.stack([b, sign + y * y * a, -y], axis=1)
+
+    return tangent, bitangent
+
+# normal 주위 cosine-weighted 방향 ~ normals : (N, 3), normal마다 k개 (np.repeat 순서), u : (N * k, 2) [0, 1) 값 (None 이면 np.random)
+# 반환 : directions (N * k, 3) 단위 벡터, pdfs (N * k,) = cos / pi (입체각 기준)
+# 접평면 축은 normal 하나당 한 번 ~ 샘플마다 회전 없음
+# u[:, 0] -> 방위각 phi = 2 pi u, u[:, 1] -> cos(theta) = sqrt(u)
+def cosine_hemisphere(normals, k=1, u=None):
+    normals = np.asarray(normals, dtype=np.float64)
+    normals = normals / np.linalg.norm(normals, axis=1, keepdims=True)
+
+    if u is None: u = np.random.rand(len(normals) * k, 2)
+    u = np.asarray(u, dtype=np.float64).reshape(len(normals), k, 2)
+
+    tangent, bitangent = orthonormal_basis(normals)
+
+    # 밀도가 cos에 비례
+    phi = 2 * np.pi * u[:, :, 0]
+    cos_theta = np.sqrt(u[:, :, 1])
+    sin_theta = np.sqrt(1 - u[:, :, 1])
+
+    directions = (sin_theta * np.cos(phi))[:, :, None] * tangent[:, None] + (sin_theta * np.sin(phi))[:, :, None] * bitangent[:, None] + cos_theta[:, :, None] * normals[:, None]
+
+    return directions.reshape(-1, 3), (cos_theta / np.pi).ravel()
+
+# Lambert 면에서 샘플 하나의 가중치 ~ cos / (pi * pdf), cosine-weighted 면 1 (pdf 0 인 방향은 0)
+def lambert_weight(directions, normals, pdfs):
+    cos_theta = np.maximum(np.sum(directions * normals, axis=-1) / np.linalg.norm(normals, axis=-1), 0)
+    return np.divide(cos_theta, np.pi * pdfs, out=np.zeros_like(cos_theta), where=pdfs > 0)
@@ -0,0 +1,185 @@
+import os
+import json
+import pickle
+import numpy as np
+
+from Cornell_scene import Material, Plane, Hole_Plane, Cube, HollowCylinder, Sphere, AreaLight
+from mesh_hw5 import load_mesh
+from camera_hw5 import Camera
+from light_hw5 import configure_light_sampling, LIGHT_MODE, LIGHT_SAMPLES
+from bvh_hw5 import build_flat_bvh, content_hash
+from find_intersection import scene_objects
+from shader_hw5 import material_table
+from compiled_scene_hw5 import compile_scene
+
+# 이보다 작은 scene은 wavefront에서 BVH 없이 종류별 배열 (compiled scene) 로 전부 검사하는 쪽이 더 빠름 (plane 위주)
+SMALL_SCENE = 16
+
+# ---------- scene 파일 (JSON) ----------
+# {
+#   "camera": {eye, target, up, fov, width, height},
+#   "render": {mode, integrator, passes, ...} ~ main의 설정 덮어쓰기,
+#   "materials": {이름: {color, ambient, ..., texture}},
+#   "objects": [{"type": "Plane" | "Hole_Plane" | "Cube" | "HollowCylinder" | "Sphere" | "Mesh", ..., "material": 이름}],
+#   "lights": [{"type": "AreaLight", center, normal, size, intensity}]
+# }
+# texture / mesh 경로는 scene 파일 위치 기준, "name" 같은 모르는 key는 주석용으로 무시
+
+PRIMITIVES = {
+    'Plane': (Plane, ('center', 'normal', 'size')),
+    'Hole_Plane': (Hole_Plane, ('center', 'normal', 'size', 'hole_size')),
+    'Cube': (Cube, ('center', 'size')),
+    'HollowCylinder': (HollowCylinder, ('center', 'outer_radius', 'inner_radius', 'height')),
+    'Sphere': (Sphere, ('center', 'radius')),
+}
+
+MATERIAL_FIELDS = ('color', 'ambient', 'diffuse', 'specular', 'shininess', 'reflective', 'refractive', 'ior', 'texture')
+
+CAMERA_FIELDS = ('eye', 'target', 'up', 'fov', 'width', 'height')
+
+# JSON 배열 -> tuple ~ create_cornell_box 와 같은 형태로
+def _value(value):
+    return tuple(value) if isinstance(value, list) else value
+
+def _fields(description, names, what):
+    missing = [name for name in names if name not in description]
+    if missing: raise ValueError(f"{what}: missing {', '.join(missing)}")
+
+    return {name: _value(description[name]) for name in names}
+
+def _resolve(base_dir, path):
+    return path if os.path.isabs(path) else os.path.normpath(os.path.join(base_dir, path))
+
+def build_material(description, base_dir):
+    unknown = set(description) - set(MATERIAL_FIELDS)
+    if unknown: raise ValueError(f"material: unknown fields {', '.join(sorted(unknown))}")
+
+    fields = {name: _value(value) for name, value in description.items()}
+    if fields.get('texture') is not None: fields['texture'] = _resolve(base_dir, fields['texture'])
+
+    return Material(**fields)
+
+def build_object(description, materials, base_dir):
+    kind = description.get('type')
+
+    if description.get('material') not in materials:
+        raise ValueError(f"{kind}: unknown material {description.get('material')!r}")
+    material = materials[description['material']]
+
+    if kind == 'Mesh':
+        return load_mesh(_resolve(base_dir, description['file']), material, center=description.get('center'), size=description.get('size'), smooth=description.get('smooth', True))
+
+    if kind not in PRIMITIVES: raise ValueError(f"unknown object type: {kind!r}")
+
+    cls, names = PRIMITIVES[kind]
+    return cls(material=material, **_fields(description, names, kind))
+
+def build_light(description):
+    kind = description.get('type', 'AreaLight')
+    if kind != 'AreaLight': raise ValueError(f"unknown light type: {kind!r}")
+
+    return AreaLight(**_fields(description, ('center', 'normal', 'size', 'intensity'), kind))
+
+# 가속 구조 ~ "auto" : 작은 scene은 compiled scene, 큰 scene은 flat BVH
+def build_accelerator(objects, kind="auto"):
+    if kind == "auto": kind = "compiled" if len(objects) <= SMALL_SCENE else "bvh"
+
+    if kind == "compiled": return compile_scene(objects)
+    if kind == "bvh": return build_flat_bvh(objects)
+    if kind == "list": return objects
+
+    raise ValueError(f"unknown accelerator: {kind!r}")
+
+# 파일 하나를 읽어서 만든 결과 ~ 렌더링에 필요한 것 전부
+class LoadedScene:
+    def __init__(self, path, camera, objects, lights, accelerator, settings):
+        self.path = path
+        self.camera = camera
+        self.objects = objects
+        self.lights = lights
+        self.accelerator = accelerator
+        self.settings = settings
+
+# dict (JSON을 읽은 것) -> LoadedScene ~ object geometry cache, 광원 sampler, 가속 구조까지 미리
+def build_scene(description, base_dir=".", path=None):
+    settings = dict(description.get('render', {}))
+
+    camera = Camera(**_fields(description['camera'], CAMERA_FIELDS, "camera"))
+
+    materials = {name: build_material(material, base_dir) for name, material in description.get('materials', {}).items()}
+    objects = [build_object(obj, materials, base_dir) for obj in description['objects']]
+    lights = [build_light(light) for light in description.get('lights', [])]
+
+    configure_light_sampling(lights, settings.get('light_samples', LIGHT_SAMPLES), settings.get('light_mode', LIGHT_MODE))
+    accelerator = build_accelerator(objects, settings.get('accelerator', "auto"))
+
+    return LoadedScene(path, camera, objects, lights, accelerator, settings)
+
+# compiled scene pickle 형식 ~ LoadedScene / geometry 구조가 바뀌면 올려서 예전 pickle을 버림
+SCENE_FORMAT = 1
+
+def _file_stamp(path):
+    try: stat = os.stat(path)
+    except OSError: return None # 없는 파일 ~ 다시 만들다가 build_scene이 에러
+
+    return stat.st_mtime_ns, stat.st_size
+
+# 다시 만들지 판단하는 key ~ 형식 버전 + scene 파일과 거기서 쓰는 texture / mesh 파일의 (수정 시각, 크기)
+def scene_stamp(path, description):
+    base_dir = os.path.dirname(os.path.abspath(path))
+
+    files = [material['texture'] for material in description.get('materials', {}).values() if material.get('texture') is not None]
+    files += [obj['file'] for obj in description.get('objects', []) if obj.get('type') == 'Mesh' and 'file' in obj]
+
+    return SCENE_FORMAT, _file_stamp(path), tuple((file, _file_stamp(_resolve(base_dir, file))) for file in files)
+
+# 만든 scene을 pickle로 저장해두고 다음부터는 바로 읽기 (compiled_path = None 이면 안 씀)
+# scene_stamp가 다르면 (scene 파일, texture / mesh 파일, 형식 중 하나라도 바뀌면) 다시 만듦
+def load_scene(path, compiled_path=None):
+    with open(path) as file:
+        description = json.load(file)
+
+    stamp = scene_stamp(path, description)
+
+    if compiled_path is not None and os.path.exists(compiled_path):
+        # BVH 배열은 BVH cache를 가리키기만 함 ~ 그쪽이 지워졌거나 파일이 깨졌으면 새로 만듦
+        try:
+            with open(compiled_path, "rb") as file:
+                cached_stamp, scene = pickle.load(file)
+
+            if cached_stamp == stamp: return scene
+
+        except (OSError, EOFError, ValueError, AttributeError, ImportError, pickle.UnpicklingError): pass # 깨졌거나 예전 형식
+
+    scene = build_scene(description, os.path.dirname(os.path.abspath(path)), path)
+
+    if compiled_path is not None:
+        directory = os.path.dirname(compiled_path)
+        if directory: os.makedirs(directory, exist_ok=True)
+
+        temp_path = compiled_path + ".tmp"
+        with open(temp_path, "wb") as file:
+            pickle.dump((stamp, scene), file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_path, compiled_path)
+
+    return scene
+
+# scene 파일 옆 .cache/<이름>.pkl
+def compiled_scene_path(path):
+    name = os.path.splitext(os.path.basename(path))[0] + ".pkl"
+    return os.path.join(os.path.dirname(os.path.abspath(path)), ".cache", name)
+
+# scene 내용 -> key ~ 재질 / object 위치 / 광원 (샘플링 포함) / texture 파일 + 쓰는 쪽의 설정 (settings) 이 같으면 같은 key
+# 디스크에 남겨두는 결과 (irradiance cache, 누적 버퍼) 를 다른 scene에 이어 쓰지 않도록
+def scene_signature(scene, lights, settings=()):
+    objects = scene_objects(scene)
+    table = material_table(objects)
+
+    arrays = [table[name] for name in sorted(table)]
+    arrays += [np.concatenate([obj.geometry.bounds_min, obj.geometry.bounds_max]).astype(np.float64) for obj in objects]
+    arrays += [np.array([*light.center, *light.normal, *light.size, *np.ravel(light.intensity)], dtype=np.float64) for light in lights]
+
+    textures = [getattr(obj.material.texture, 'path', None) for obj in objects]
+    light_sampling = [(getattr(light, 'sampler', None) and (light.sampler.mode, light.sampler.count)) for light in lights]
+
+    return content_hash(arrays, (textures, light_sampling, settings))
@@ -1,27 +1,15 @@
 import numpy as np
-from find_intersection import Ray, Nearest_HIT_finder_bvh
+from find_intersection import Occlusion_finder_batch, scene_objects
+from light_hw5 import light_sampler
+from texture_hw5 import pixel_footprint, uv_scale
+from stats_hw5 import count, timed
+from photon_hw5 import lookup_caustics, current_photon_map
 
 EPSILON = 0.01
-LIGHT_NUM = 6
-
-# 면광원 ~ 점광원 근사. 
-def lights_sampling(light, num=LIGHT_NUM):
-    points = []
-
-    center = np.array(light.center)
-    width, height = light.size
-
-    x = np.linspace(-width / 2, width / 2, num)
-    z = np.linspace(-height / 2, height / 2, num)
-
-    for i in z[::-1]:  # 위에서 아래
-        for j in x:
-            points.append(center + np.array([j, 0, i]))
-
-    return points
 
 # Phong shading ~ hw4 그대로 사용 
-def shade(hit, lights, bvh_root, view_pos):
+@timed("shade")
+def shade(hit, lights, bvh_root, view_pos, pixel_angle=None):
     norm = hit.normal / np.linalg.norm(hit.normal)
     frag_pos = hit.point
     material = hit.material
@@ -29,22 +17,27 @@ def shade(hit, lights, bvh_root, view_pos):
     result = np.zeros(3) # init 
 
     for light in lights:
-        sample_points = lights_sampling(light, num=LIGHT_NUM)
+        # 면광원 ~ 미리 만들어 둔 샘플 패턴 + 입체각 가중치
+        sampler = light_sampler(light)
+        sample_points = sampler.sample()
         contribution = np.zeros(3)
 
-        for sp in sample_points:
-            light_dir = sp - frag_pos
-            light_distance = np.linalg.norm(light_dir)
+        light_dirs = sample_points - frag_pos
+        light_distances = np.linalg.norm(light_dirs, axis=1)
+
+        light_dirs /= light_distances[:, None] # normalize
+        weights = sampler.weights(light_dirs, light_distances)
 
-            light_dir /= light_distance # normalize
+        # shadow ray는 전부 한 번에, 가려졌는지만 (any-hit)
+        shadow_origin = frag_pos + EPSILON * norm
+        count("rays.shadow", len(sample_points))
 
-            shadow_origin = frag_pos + EPSILON * norm
-            shadow_ray = Ray(shadow_origin, light_dir)
-    
-            shadow_hit = Nearest_HIT_finder_bvh(shadow_ray, bvh_root)
+        with timed("shadow"): occluded = Occlusion_finder_batch(np.tile(shadow_origin, (len(sample_points), 1)), light_dirs, light_distances, bvh_root)
+
+        for light_dir, light_distance, weight, blocked in zip(light_dirs, light_distances, weights, occluded):
 
             # 계산 생략 조건
-            if shadow_hit and shadow_hit.ray_distance < light_distance : continue 
+            if blocked: continue 
 
             # ambient
             ambient = material.ambient * np.array(light.intensity)
@@ -70,24 +63,125 @@ def shade(hit, lights, bvh_root, view_pos):
                 spec = max(np.dot(view_dir, reflect_dir), 0)
                 specular = material.specular * (spec ** material.shininess) * np.array(light.intensity)
 
-            contribution += (ambient + attenuation * (diffuse + specular))
+            contribution += weight * (ambient + attenuation * (diffuse + specular))
+
+        result += contribution
 
-        result += contribution / len(sample_points)
+    # caustic (photon map) ~ 유리 / 거울을 거쳐 모인 빛, diffuse처럼
+    if current_photon_map() is not None: result += material.diffuse * lookup_caustics(np.asarray(frag_pos, dtype=np.float64)[None], norm[None])[0]
 
     # Texture 적용
     base_color = np.array(material.color)
 
     if (material.texture is not None) and hasattr(hit.object, 'get_uv'): 
-        u, v = hit.object.get_uv(frag_pos)
-
-        h, w, no_use = material.texture.shape
+        with timed("texture"):
+            u, v = hit.object.get_uv(frag_pos)
 
-        mapping_x = min(int(u*w), w - 1)
-        # mapping_y = min(int(v*h), h - 1)
-        mapping_y = min(int((1 - v)*h), h - 1) # 위아래반대 
+            # 거리 / 각도에 맞는 mip 단계
+            footprint = pixel_footprint(frag_pos, norm, view_pos, pixel_angle) * uv_scale(hit.object)
+            tex_color = material.texture.sample(np.array([u]), np.array([v]), material.texture.lod(np.array([footprint])))[0]
 
-        tex_color = material.texture[mapping_y, mapping_x][:3] # 반대!!!! 
         base_color *= tex_color
 
     final_color = result * base_color
     return np.clip(final_color, 0, 1)
+
+# 재질 값을 object id로 바로 뽑기 위한 테이블 
+def material_table(objects):
+    materials = [obj.material for obj in objects]
+
+    return {
+        'color': np.array([m.color for m in materials], dtype=np.float64),
+        'ambient': np.array([m.ambient for m in materials], dtype=np.float64),
+        'diffuse': np.array([m.diffuse for m in materials], dtype=np.float64),
+        'specular': np.array([m.specular for m in materials], dtype=np.float64),
+        'shininess': np.array([m.shininess for m in materials], dtype=np.float64),
+        'reflective': np.array([m.reflective for m in materials], dtype=np.float64),
+        'refractive': np.array([m.refractive for m in materials], dtype=np.float64),
+        'ior': np.array([m.ior for m in materials], dtype=np.float64),
+    }
+
+# shade의 배치 버전 ~ points, normals : (N, 3), object_ids : (N,)
+# scene : objects 리스트 또는 flat BVH, samples : SampleStream (광원마다 1 차원) 또는 None (np.random)
+@timed("shade")
+def shade_batch(points, normals, object_ids, scene, lights, view_pos, table=None, samples=None, pixel_angle=None):
+    objects = scene_objects(scene)
+    if table is None: table = material_table(objects)
+
+    norm = normals / np.linalg.norm(normals, axis=1, keepdims=True)
+
+    ambient_k = table['ambient'][object_ids][:, None, None]
+    diffuse_k = table['diffuse'][object_ids][:, None]
+    specular_k = table['specular'][object_ids][:, None]
+    shininess = table['shininess'][object_ids][:, None]
+
+    view_dir = np.array(view_pos, dtype=np.float64) - points
+    view_dir /= np.linalg.norm(view_dir, axis=1, keepdims=True)
+
+    result = np.zeros((len(points), 3)) # init 
+
+    for light in lights:
+        sampler = light_sampler(light)
+        sample_points = sampler.sample_batch(len(points), None if samples is None else samples.uniform()[:, 0]) # (N, S, 3)
+        intensity = np.array(light.intensity, dtype=np.float64)
+
+        light_dir = sample_points - points[:, None, :] # (N, S, 3)
+        light_distance = np.linalg.norm(light_dir, axis=2)
+
+        light_dir /= light_distance[:, :, None]
+        weights = sampler.weights(light_dir, light_distance)
+
+        # shadow ray 한 번에 (any-hit)
+        shadow_origin = np.repeat(points + EPSILON * norm, sampler.count, axis=0)
+        count("rays.shadow", len(shadow_origin))
+
+        with timed("shadow"): lit = ~Occlusion_finder_batch(shadow_origin, light_dir.reshape(-1, 3), light_distance.ravel(), scene)
+        lit = lit.reshape(light_distance.shape)
+
+        # diffuse
+        diff = np.maximum(np.sum(norm[:, None, :] * light_dir, axis=2), 0.0)
+
+        # attenuation
+        attenuation = 1 / (1 + 0.05 * light_distance + 0.01 * (light_distance ** 2))
+
+        # specular ~ diff > 0 인 곳만
+        reflect_dir = 2 * np.sum(norm[:, None, :] * light_dir, axis=2)[:, :, None] * norm[:, None, :] - light_dir
+        reflect_dir /= np.linalg.norm(reflect_dir, axis=2, keepdims=True)
+
+        spec = np.maximum(np.sum(view_dir[:, None, :] * reflect_dir, axis=2), 0)
+        spec = np.where(diff > 0, specular_k * spec ** shininess, 0.0)
+
+        contribution = ambient_k * intensity + (attenuation * (diffuse_k * diff + spec))[:, :, None] * intensity
+        contribution *= (lit * weights)[:, :, None]
+
+        result += contribution.sum(axis=1)
+
+    # caustic (photon map) ~ shadow ray로는 못 찾는 유리 / 거울을 거쳐 모인 빛, diffuse처럼
+    result += diffuse_k * lookup_caustics(points, norm)
+
+    # Texture 적용
+    base_color = surface_color_batch(points, object_ids, objects, table, pixel_footprint(points, norm, view_pos, pixel_angle))
+
+    final_color = result * base_color
+    return np.clip(final_color, 0, 1)
+
+# 재질 color * texture ~ object 별로 묶어서 
+# footprints : hit 지점의 world footprint (N,) ~ mip 단계 선택용, None 이면 원본 해상도
+def surface_color_batch(points, object_ids, objects, table, footprints=None):
+    base_color = table['color'][object_ids]
+
+    for object_id in np.unique(object_ids):
+        obj = objects[object_id]
+        texture = obj.material.texture
+
+        if texture is None or not hasattr(obj, 'get_uv_batch'): continue
+
+        rows = np.nonzero(object_ids == object_id)[0]
+
+        with timed("texture"):
+            u, v = obj.get_uv_batch(points[rows])
+
+            lod = None if footprints is None else texture.lod(footprints[rows] * uv_scale(obj))
+            base_color[rows] *= texture.sample(u, v, lod)
+
+    return base_color
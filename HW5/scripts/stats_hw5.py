@@ -0,0 +1,113 @@
+import json
+import time
+
+from contextlib import contextmanager
+
+# 렌더링 통계 (opt-in) ~ enable_stats() 전에는 count / timed 가 아무것도 안 함
+# counters : "rays.primary", "rays.shadow", "rays.indirect", "rays.reflection", "rays.refraction",
+#            "bvh.nodes" (ray x 노드 방문), "tests.<class>" (ray x primitive 교차 검사, "tests.AABB" 는 object box)
+# timers   : "intersect", "shadow", "shade", "texture" ~ 겹치지 않게 (안쪽 timer가 도는 동안 바깥 timer는 멈춤)
+STATS = None
+
+class RenderStats:
+    def __init__(self):
+        self.counters = {}
+        self.timers = {}
+
+        self._stack = [] # [이름, 시작 시각]
+
+    def count(self, name, n=1):
+        self.counters[name] = self.counters.get(name, 0) + int(n)
+
+    def start(self, name):
+        now = time.perf_counter()
+
+        # 바깥 timer 멈춤
+        if self._stack: self._add_time(self._stack[-1], now)
+        self._stack.append([name, now])
+
+    def stop(self):
+        now = time.perf_counter()
+
+        self._add_time(self._stack.pop(), now)
+        if self._stack: self._stack[-1][1] = now
+
+    def _add_time(self, entry, now):
+        name, start = entry
+        self.timers[name] = self.timers.get(name, 0.0) + now - start
+
+    # worker에서 받은 통계 더하기
+    def merge(self, data):
+        for name, n in data['counters'].items(): self.count(name, n)
+        for name, seconds in data['timers'].items(): self.timers[name] = self.timers.get(name, 0.0) + seconds
+
+    def to_dict(self):
+        return {'counters': dict(sorted(self.counters.items())), 'timers': dict(sorted(self.timers.items()))}
+
+    # 지금까지 것을 넘기고 비우기 ~ worker가 타일마다
+    def take(self):
+        data = self.to_dict()
+        self.counters, self.timers = {}, {}
+        return data
+
+    def summary(self, wall_time=None):
+        lines = ["Rays:"]
+
+        rays = {name[5:]: n for name, n in self.counters.items() if name.startswith("rays.")}
+        total_rays = sum(rays.values())
+
+        for name, n in sorted(rays.items(), key=lambda item: -item[1]):
+            lines.append(f"  {name:<12} {n:>14,d}  {100 * n / max(total_rays, 1):5.1f}%")
+
+        if 'bvh.nodes' in self.counters: lines.append(f"BVH nodes visited: {self.counters['bvh.nodes']:,d}")
+
+        tests = {name[6:]: n for name, n in self.counters.items() if name.startswith("tests.")}
+        if tests:
+            lines.append("Primitive tests:")
+            for name, n in sorted(tests.items(), key=lambda item: -item[1]): lines.append(f"  {name:<14} {n:>14,d}")
+
+        total_time = sum(self.timers.values())
+        if total_time > 0:
+            lines.append("Time (all processes):")
+            for name, seconds in sorted(self.timers.items(), key=lambda item: -item[1]):
+                lines.append(f"  {name:<12} {seconds:10.2f}s  {100 * seconds / total_time:5.1f}%")
+
+        if wall_time is not None:
+            lines.append(f"Wall time {wall_time:.2f}s, {total_rays / max(wall_time, 1e-9):,.0f} rays/s")
+
+        return "\n".join(lines)
+
+    def dump(self, path, wall_time=None):
+        data = self.to_dict()
+        if wall_time is not None: data['wall_time'] = wall_time
+
+        with open(path, "w") as file:
+            json.dump(data, file, indent=2)
+
+def enable_stats():
+    global STATS
+    STATS = RenderStats()
+    return STATS
+
+def disable_stats():
+    global STATS
+    STATS = None
+
+def stats_enabled():
+    return STATS is not None
+
+def current_stats():
+    return STATS
+
+def count(name, n=1):
+    if STATS is not None: STATS.count(name, n)
+
+@contextmanager
+def timed(name):
+    if STATS is None:
+        yield
+        return
+
+    STATS.start(name)
+    try: yield
+    finally: STATS.stop()
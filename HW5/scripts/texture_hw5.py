@@ -0,0 +1,233 @@
+import os
+import hashlib
+import numpy as np
+
+from PIL import Image
+
+# "nearest" : 기존 방식 (texel 하나), "bilinear" : 원본 해상도에서 4 texel 보간, "trilinear" : 가까운 mip 두 단계를 bilinear 후 보간
+TEXTURE_FILTER = "trilinear"
+
+# 화면 픽셀 하나가 차지하는 각도 (radian) ~ 거리에 곱하면 hit 지점의 footprint
+# 렌더링은 camera_pixel_angle(camera) 를 shade / shade_batch 까지 넘김, 안 넘기면 (pixel_angle=None) main의 기본 camera (fov 46, 480px) 값
+PIXEL_ANGLE = np.radians(46) / 480
+
+# 비스듬히 볼수록 footprint가 늘어남 ~ cos이 이보다 작으면 고정 (수평에 가까운 면이 완전히 뭉개지지 않게)
+GRAZING_COS = 0.1
+
+# texture 공유 ~ 같은 파일이면 material / scene이 몇 개든 한 번만 읽고 mip도 한 번만
+TEXTURE_CACHE = {}
+
+# 2 x 2 평균으로 절반 크기 ~ 홀수면 마지막 줄 / 열을 복사해서 맞춤
+def downsample(level):
+    h, w = level.shape[:2]
+    level = np.pad(level, ((0, h % 2), (0, w % 2), (0, 0)), mode='edge')
+
+    return (level[0::2, 0::2] + level[1::2, 0::2] + level[0::2, 1::2] + level[1::2, 1::2]) / 4
+
+# 원본 이미지 -> mip 단계들 ~ 1 x 1 까지, uint8 로 보관 (float32의 1/4)
+def build_mips(image):
+    image = np.asarray(image)
+    if image.ndim == 2: image = image[:, :, None]
+    if image.shape[2] == 1: image = np.repeat(image, 3, axis=2)
+
+    # RGB만 ~ alpha는 shading에 안 씀
+    image = image[:, :, :3]
+    level = image.astype(np.float32) / 255 if image.dtype == np.uint8 else image.astype(np.float32)
+
+    levels = [np.round(level * 255).astype(np.uint8)]
+
+    while max(level.shape[:2]) > 1:
+        level = downsample(level)
+        levels.append(np.round(level * 255).astype(np.uint8))
+
+    return levels
+
+# downsample과 같은 규칙 (홀수는 올림) 으로 단계별 크기
+def mip_shapes(height, width):
+    shapes = [(height, width)]
+
+    while max(height, width) > 1:
+        height, width = (height + 1) // 2, (width + 1) // 2
+        shapes.append((height, width))
+
+    return shapes
+
+# ---------- 디스크 cache ----------
+# 디코딩 + mip 결과를 HW5/.cache/textures/ 에 raw .npy (단계들을 이어붙인 1차원) 로 저장 (.gitignore)
+# 다음부터는 memory-map 으로 열어서 ~ 디코딩 없음, worker끼리 같은 page를 공유 (None 이면 안 씀)
+TEXTURE_CACHE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), ".cache", "textures")
+
+# 파일 이름에 원본 경로 hash / 수정 시각 / 크기를 넣어서 ~ 다른 폴더의 같은 이름과 안 섞이고, 원본이 바뀌면 새로 만듦
+def npy_cache_path(path):
+    if TEXTURE_CACHE_DIR is None: return None
+
+    stat = os.stat(path)
+    digest = hashlib.sha1(path.encode()).hexdigest()[:12]
+    name = f"{os.path.basename(path)}.{digest}.{stat.st_mtime_ns:x}.{stat.st_size:x}.npy"
+
+    return os.path.join(TEXTURE_CACHE_DIR, name)
+
+def split_levels(flat, height, width):
+    levels = []
+    start = 0
+
+    for h, w in mip_shapes(height, width):
+        levels.append(flat[start:start + h * w * 3].reshape(h, w, 3))
+        start += h * w * 3
+
+    return levels
+
+def load_levels(path):
+    cache_path = npy_cache_path(path)
+
+    if cache_path is not None and os.path.exists(cache_path):
+        with Image.open(path) as image: width, height = image.size # header만 읽음
+        return split_levels(np.load(cache_path, mmap_mode='r'), height, width)
+
+    with Image.open(path) as image:
+        levels = build_mips(np.array(image.convert("RGB")))
+
+    if cache_path is not None:
+        # 임시 파일에 쓰고 교체 ~ 동시에 여러 worker가 만들어도 깨진 파일이 안 남음, 못 쓰면 (읽기 전용 등) 메모리에만
+        try:
+            os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+
+            temp_path = f"{cache_path}.{os.getpid()}.tmp.npy"
+            np.save(temp_path, np.concatenate([level.ravel() for level in levels]))
+            os.replace(temp_path, cache_path)
+
+        except OSError: pass
+
+    return levels
+
+# path가 있으면 처음 샘플링할 때 읽음 (lazy) ~ 만들기 / pickle (worker로 넘기기) 은 path만
+class Texture:
+    def __init__(self, image=None, path=None):
+        self.path = path
+        self._levels = None if image is None else build_mips(image)
+
+    # worker에서는 자기 process의 texture cache로 다시 연결
+    def __reduce__(self):
+        if self.path is None: return (Texture, (self.levels[0],))
+        return (load_texture, (self.path,))
+
+    @property
+    def levels(self):
+        if self._levels is None: self._levels = load_levels(self.path)
+        return self._levels
+
+    @property
+    def loaded(self):
+        return self._levels is not None
+
+    @property
+    def height(self):
+        return self.levels[0].shape[0]
+
+    @property
+    def width(self):
+        return self.levels[0].shape[1]
+
+    @property
+    def shape(self):
+        return self.levels[0].shape
+
+    @property
+    def nbytes(self):
+        return sum(level.nbytes for level in self.levels)
+
+    # texel 하나 ~ 기존 shade와 같은 mapping (v는 위아래 반대)
+    def _nearest(self, level, u, v):
+        h, w = level.shape[:2]
+
+        x = np.minimum((u * w).astype(np.int64), w - 1)
+        y = np.minimum(((1 - v) * h).astype(np.int64), h - 1)
+
+        return level[y, x].astype(np.float64) / 255
+
+    # texel 중심 기준 4개 보간, 가장자리는 clamp
+    def _bilinear(self, level, u, v):
+        h, w = level.shape[:2]
+
+        fx = np.clip(u * w - 0.5, 0, w - 1)
+        fy = np.clip((1 - v) * h - 0.5, 0, h - 1)
+
+        x0 = np.minimum(fx.astype(np.int64), w - 1)
+        y0 = np.minimum(fy.astype(np.int64), h - 1)
+        x1 = np.minimum(x0 + 1, w - 1)
+        y1 = np.minimum(y0 + 1, h - 1)
+
+        tx = (fx - x0)[:, None]
+        ty = (fy - y0)[:, None]
+
+        top = level[y0, x0] * (1 - tx) + level[y0, x1] * tx
+        bottom = level[y1, x0] * (1 - tx) + level[y1, x1] * tx
+
+        return (top * (1 - ty) + bottom * ty) / 255
+
+    # 배치 샘플링 ~ u, v : (N,), lod : (N,) mip 단계 (실수, None 이면 0), 반환 (N, 3)
+    def sample(self, u, v, lod=None, mode=TEXTURE_FILTER):
+        u = np.asarray(u, dtype=np.float64)
+        v = np.asarray(v, dtype=np.float64)
+
+        if mode == "nearest": return self._nearest(self.levels[0], u, v)
+        if mode == "bilinear" or lod is None: return self._bilinear(self.levels[0], u, v)
+        if mode != "trilinear": raise ValueError(f"unknown texture filter: {mode}")
+
+        lod = np.clip(lod, 0, len(self.levels) - 1)
+        low = np.minimum(lod.astype(np.int64), len(self.levels) - 1)
+        blend = (lod - low)[:, None]
+
+        # 단계별로 묶어서 ~ 보통 몇 단계 안 됨
+        lower = np.empty((len(u), 3))
+        upper = np.empty((len(u), 3))
+
+        for level_index in np.unique(low):
+            rows = np.nonzero(low == level_index)[0]
+            lower[rows] = self._bilinear(self.levels[level_index], u[rows], v[rows])
+            upper[rows] = self._bilinear(self.levels[min(level_index + 1, len(self.levels) - 1)], u[rows], v[rows])
+
+        return lower * (1 - blend) + upper * blend
+
+    # footprint (uv 단위 폭) -> mip 단계
+    def lod(self, uv_footprint):
+        texels = uv_footprint * max(self.width, self.height)
+        return np.log2(np.maximum(texels, 1))
+
+# 파일 -> Texture ~ 절대 경로로 cache, 디코딩은 처음 쓸 때
+# 파일이 없으면 여기서 (scene 만들 때) 바로 에러 ~ 렌더링 중 worker 안에서 터지지 않게
+def load_texture(path):
+    path = os.path.abspath(path)
+    if not os.path.isfile(path): raise FileNotFoundError(f"texture not found: {path}")
+
+    if path not in TEXTURE_CACHE: TEXTURE_CACHE[path] = Texture(path=path)
+    return TEXTURE_CACHE[path]
+
+# material.texture ~ 경로면 load_texture, 배열이면 바로 Texture로
+def as_texture(texture):
+    if texture is None or isinstance(texture, Texture): return texture
+    if isinstance(texture, (str, os.PathLike)): return load_texture(texture)
+
+    return Texture(texture)
+
+# world 길이 1 이 uv로 얼마인지 ~ object 크기 (가장 긴 변) 로 근사
+def uv_scale(obj):
+    geo = getattr(obj, 'geometry', None)
+    if geo is None or not hasattr(geo, 'bounds_min'): return 1.0
+
+    extent = np.max(geo.bounds_max - geo.bounds_min)
+    return 1 / extent if extent > 0 else 1.0
+
+# 카메라의 픽셀 각도 ~ 거리 1 의 image plane 에서 픽셀 하나의 높이 (generate_ray와 같은 scale)
+def camera_pixel_angle(camera):
+    return 2 * camera.scale / camera.height
+
+# hit 지점의 world footprint ~ 카메라 (또는 ray 시작점) 까지 거리 x 픽셀 각도 / cos
+# pixel_angle : camera_pixel_angle(camera), None 이면 PIXEL_ANGLE
+def pixel_footprint(points, normals, view_pos, pixel_angle=None):
+    pixel_angle = PIXEL_ANGLE if pixel_angle is None else pixel_angle
+    view = np.array(view_pos, dtype=np.float64) - points
+    distance = np.linalg.norm(view, axis=-1)
+
+    cos_view = np.abs(np.sum(view * normals, axis=-1)) / np.maximum(distance * np.linalg.norm(normals, axis=-1), 1e-12)
+    return distance * pixel_angle / np.maximum(cos_view, GRAZING_COS)
@@ -0,0 +1,29 @@
+import os
+import sys
+import pytest
+
+HW5_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.join(HW5_DIR, "scripts"))
+
+import bvh_hw5
+import texture_hw5
+from scene_file_hw5 import load_scene
+from camera_hw5 import Camera
+
+CORNELL_BOX = os.path.join(HW5_DIR, "scenes", "cornell_box.json")
+
+# 디스크 cache (BVH, texture) 는 테스트마다 임시 디렉터리 ~ HW5/.cache 와 섞이지 않게
+@pytest.fixture(autouse=True)
+def cache_dirs(tmp_path, monkeypatch):
+    monkeypatch.setattr(bvh_hw5, "BVH_CACHE_DIR", str(tmp_path / "bvh"))
+    monkeypatch.setattr(texture_hw5, "TEXTURE_CACHE_DIR", str(tmp_path / "textures"))
+
+@pytest.fixture
+def cornell():
+    return load_scene(CORNELL_BOX)
+
+# scene 카메라와 같은 시점, 작은 해상도 ~ 8 x 8 타일 6개
+@pytest.fixture
+def camera(cornell):
+    view = cornell.camera
+    return Camera(view.eye, view.target, view.up, view.fov, 24, 16)
@@ -0,0 +1,89 @@
+import os
+import json
+import shutil
+import numpy as np
+
+import bvh_hw5
+import scene_file_hw5
+from bvh_hw5 import cached_sah_arrays
+from scene_file_hw5 import load_scene
+
+HW5_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# scene 파일 + texture를 임시 디렉터리로 ~ 같은 상대 경로 (../textures)
+def copy_scene(tmp_path):
+    shutil.copytree(os.path.join(HW5_DIR, "textures"), tmp_path / "textures")
+    os.makedirs(tmp_path / "scenes")
+
+    path = tmp_path / "scenes" / "cornell_box.json"
+    shutil.copy(os.path.join(HW5_DIR, "scenes", "cornell_box.json"), path)
+    return str(path)
+
+# 수정 시각을 확실히 바꾸기 ~ 파일 시스템 시각 해상도와 상관없이
+def touch(path):
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+
+def test_compiled_scene_invalidation(tmp_path, monkeypatch):
+    path = copy_scene(tmp_path)
+    compiled_path = str(tmp_path / "compiled.pkl")
+
+    builds = []
+    build_scene = scene_file_hw5.build_scene
+    monkeypatch.setattr(scene_file_hw5, "build_scene", lambda *args: builds.append(args) or build_scene(*args))
+
+    def load(): return load_scene(path, compiled_path)
+
+    load()
+    load()
+    assert len(builds) == 1
+
+    # scene 이 쓰는 texture
+    touch(tmp_path / "textures" / "paper.png")
+    load()
+    load()
+    assert len(builds) == 2
+
+    # scene 파일 내용
+    with open(path) as file: description = json.load(file)
+    description['objects'][-1]['center'][0] += 1.0
+    with open(path, "w") as file: json.dump(description, file)
+
+    scene = load()
+    assert len(builds) == 3
+    assert load().objects[-1].center[0] == scene.objects[-1].center[0]
+    assert len(builds) == 3
+
+    # pickle 형식 버전
+    monkeypatch.setattr(scene_file_hw5, "SCENE_FORMAT", scene_file_hw5.SCENE_FORMAT + 1)
+    load()
+    assert len(builds) == 4
+
+    # 깨진 pickle
+    with open(compiled_path, "wb") as file: file.write(b"broken")
+    load()
+    assert len(builds) == 5
+
+def test_bvh_cache_invalidation(monkeypatch):
+    rng = np.random.default_rng(0)
+    prim_min = rng.uniform(-10, 10, (200, 3))
+    prim_max = prim_min + rng.uniform(0.1, 1, (200, 3))
+
+    built, path, cached = cached_sah_arrays(prim_min, prim_max)
+    assert path is not None and not cached
+
+    loaded, cached_path, cached = cached_sah_arrays(prim_min, prim_max)
+    assert cached and cached_path == path
+    for a, b in zip(built, loaded): assert np.array_equal(a, b)
+
+    # primitive box가 바뀌면
+    moved_min, moved_max = prim_min.copy(), prim_max.copy()
+    moved_min[0] += 0.5
+    moved_max[0] += 0.5
+    _, moved_path, cached = cached_sah_arrays(moved_min, moved_max)
+    assert not cached and moved_path != path
+
+    # 빌드 설정 (SAH 비용) 이 바뀌면
+    monkeypatch.setattr(bvh_hw5, "INTERSECT_COST", bvh_hw5.INTERSECT_COST * 2)
+    _, cost_path, cached = cached_sah_arrays(prim_min, prim_max)
+    assert not cached and cost_path != path
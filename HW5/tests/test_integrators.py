@@ -0,0 +1,57 @@
+import numpy as np
+import pytest
+
+import ray_tracing_fresnel
+from ray_tracing_fresnel import trace_ray, render_pixels
+from light_hw5 import configure_light_sampling
+from bvh_hw5 import build_flat_bvh
+from texture_hw5 import camera_pixel_angle
+from parallel_hw5 import render_parallel
+from progressive_hw5 import render_progressive
+from sampler_hw5 import make_sampler
+
+TILE = 8
+
+# 직접광만 ~ 모든 점이 irradiance cache 에 간접광 0 으로 있는 것처럼 (반구 샘플링의 np.random 을 안 씀)
+def no_indirect(points, normals):
+    return np.zeros((len(points), 3)), np.ones(len(points), dtype=bool)
+
+# wavefront (trace_rays) 와 scalar (trace_ray) 가 같은 이미지 ~ 광원은 grid (패턴 1개) 라 둘 다 결정적
+# 반사 / 굴절 / texture 까지 포함, 차이는 float32 camera / texture 정도
+def test_wavefront_matches_scalar(cornell, camera, monkeypatch):
+    monkeypatch.setattr(ray_tracing_fresnel, "lookup_indirect", no_indirect)
+    configure_light_sampling(cornell.lights, 16, "grid")
+
+    xs, ys = camera.tile_pixels(0, 0, camera.width, camera.height)
+    wavefront = render_pixels(camera, cornell.accelerator, cornell.lights, xs, ys)
+
+    bvh = build_flat_bvh(cornell.objects)
+    pixel_angle = camera_pixel_angle(camera)
+    scalar = np.array([trace_ray(camera.generate_ray(x, y), bvh, cornell.lights, camera.eye, pixel_angle=pixel_angle) for x, y in zip(xs, ys)])
+
+    assert wavefront.max() > 0
+    np.testing.assert_allclose(wavefront, scalar, atol=1e-4)
+
+# 타일마다 seed가 정해져 있으므로 worker 수와 상관없이 같은 이미지
+@pytest.mark.parametrize("integrator", ["whitted", "path"])
+def test_parallel_independent_of_workers(cornell, camera, integrator):
+    images = [render_parallel(camera, cornell.accelerator, cornell.lights, camera.width, camera.height, TILE, workers, jitter=True, integrator=integrator) for workers in (1, 2, 3)]
+
+    assert np.array_equal(images[0], images[1])
+    assert np.array_equal(images[0], images[2])
+
+# 중간에 멈췄다가 이어서 렌더링해도 한 번에 끝까지 한 것과 비트 단위로 같음
+@pytest.mark.parametrize("sampler", [None, "sobol"])
+def test_progressive_resume(cornell, camera, tmp_path, sampler):
+    sampler = make_sampler(sampler)
+
+    def render(path, passes):
+        return render_progressive(camera, cornell.accelerator, cornell.lights, str(path), passes, width=camera.width, height=camera.height, tile_size=TILE, sampler=sampler)
+
+    full = render(tmp_path / "full.npz", 3)
+
+    render(tmp_path / "resumed.npz", 1)
+    resumed = render(tmp_path / "resumed.npz", 3)
+
+    assert np.array_equal(full, resumed)
+    with np.load(tmp_path / "resumed.npz") as data: assert int(data['passes']) == 3
@@ -0,0 +1,57 @@
+import pytest
+
+from mesh_hw5 import load_obj
+
+TRIANGLE = "v 0 0 0\nv 1 0 0\nv 0 1 0\n"
+
+def write_obj(tmp_path, text):
+    path = tmp_path / "mesh.obj"
+    path.write_text(text)
+    return str(path)
+
+# 음수 인덱스는 그 face 줄 앞까지 읽은 vertex 기준 ~ v / f 가 섞여 있어도
+def test_relative_indices(tmp_path):
+    vertices, _, _, faces, _, _ = load_obj(write_obj(tmp_path, TRIANGLE + "f -3 -2 -1\nv 5 5 5\nv 6 5 5\nv 5 6 5\nf -3 -2 -1\nf 1 -5 6\n"))
+
+    assert len(vertices) == 6
+    assert faces.tolist() == [[0, 1, 2], [3, 4, 5], [0, 1, 5]]
+
+# 다각형은 첫 corner 기준 부채꼴로
+def test_polygon_fan(tmp_path):
+    _, _, _, faces, _, _ = load_obj(write_obj(tmp_path, TRIANGLE + "v 1 1 0\nv 0.5 2 0\nf 1 2 4 5 3\n"))
+
+    assert faces.tolist() == [[0, 1, 3], [0, 3, 4], [0, 4, 2]]
+
+# "a//c" 는 uv 없음 (-1), "a/b" 는 normal 없음
+def test_missing_components(tmp_path):
+    _, _, _, _, uvs, normals = load_obj(write_obj(tmp_path, TRIANGLE + "vn 0 0 1\nf 1//1 2//1 3//1\n"))
+    assert uvs.tolist() == [[-1, -1, -1]]
+    assert normals.tolist() == [[0, 0, 0]]
+
+    _, _, _, _, uvs, normals = load_obj(write_obj(tmp_path, TRIANGLE + "vt 0 0\nvt 1 0\nvt 0 1\nf 1/3 2/2 3/1\n"))
+    assert uvs.tolist() == [[2, 1, 0]]
+    assert normals.tolist() == [[-1, -1, -1]]
+
+# 공백이 탭 / 여러 칸이어도, vt 는 u 만 있어도
+def test_whitespace(tmp_path):
+    vertices, uvs, _, faces, _, _ = load_obj(write_obj(tmp_path, "v\t0 0 0\nv  1 0 0\nv 0\t1 0\nvt 0.5\nf\t1/1 2/1  3/1\n"))
+
+    assert vertices.tolist() == [[0, 0, 0], [1, 0, 0], [0, 1, 0]]
+    assert uvs.tolist() == [[0.5, 0]]
+    assert faces.tolist() == [[0, 1, 2]]
+
+@pytest.mark.parametrize("text, message", [
+    (TRIANGLE + "f 0 1 2\n", "vertex index 0"),
+    (TRIANGLE + "vt 0 0\nf 1/0 2/1 3/1\n", "uv index 0"),
+    ("v 0 0 0\nv 1 0 0\nf 1 2 -3\nv 0 1 0\n", "vertex index out of range"),
+    (TRIANGLE + "f 1 2 4\n", "vertex index out of range"),
+    (TRIANGLE + "f 1 2\n", "fewer than 3"),
+    (TRIANGLE + "f\n", "fewer than 3"),
+    (TRIANGLE + "f 1 2 a\n", "malformed 'f' line"),
+    (TRIANGLE + "vn 0 0 1\nf 1//1 2 3\n", "mix different index formats"),
+    ("v 0 0\nv 1 0 0\nv 0 1 0\nf 1 2 3\n", "'v' line needs 3 numbers"),
+    ("v 0 0 0\nv 1 0 0\nv 0 1 x\nf 1 2 3\n", "malformed 'v' line"),
+    (TRIANGLE, "no faces"),
+])
+def test_malformed(tmp_path, text, message):
+    with pytest.raises(ValueError, match=message): load_obj(write_obj(tmp_path, text))